@@ -1 +1,5 @@
 from . import api
+from . import cache
+from . import records
+from . import search_request
+from . import session
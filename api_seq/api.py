@@ -1,11 +1,28 @@
-from datetime import datetime
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
 import json
+import time
 from telebot import types
 import telebot
 import requests
+from . import session
+from .cache import create_cache, RefreshingCache
+from .media import select_images, media_stats, file_id_cache, photo_sources, remember_file_ids, \
+    forget_file_ids
+from .records import HotelBatch, format_price
+from .prefetch import Prefetcher
+from .quota import quota, QuotaExceeded, LEVEL_LIST_ONLY
+from .search_request import SearchRequest
+from .singleflight import SingleFlight
 from keyboards.reply import generate_city_keyboard
-from database.classes import User, Hotel
+from database.writer import history_writer, search_columns
+from utils.sender import outbound, PRIORITY_RESULT
 from loader import API_KEY, bot
+from config_data.config import DETAIL_MAX_WORKERS, LOCATION_CACHE_SIZE, LOCATION_CACHE_TTL, LOCATION_CACHE_SQLITE, \
+    DETAIL_CACHE_SIZE, DETAIL_CACHE_TTL, DETAIL_CACHE_IMAGES, DETAIL_CACHE_SQLITE, SEARCH_CACHE_SIZE, \
+    SEARCH_CACHE_TTL, SEARCH_CACHE_STALE_TTL, API_CONNECT_TIMEOUT, LOCATIONS_READ_TIMEOUT, LIST_READ_TIMEOUT, \
+    DETAIL_READ_TIMEOUT, PREFETCH_WORKERS, PREFETCH_DETAILS, PREFETCH_MAX_CHATS, LIST_RESULTS_SIZE
 from loguru import logger
 
 
@@ -13,7 +30,6 @@ class API:
     """
     class contains the parameters for API requests
     """
-    min_date = datetime.now()
     url1 = "https://hotels4.p.rapidapi.com/locations/v3/search"
     url2 = "https://hotels4.p.rapidapi.com/properties/v2/list"
     url3 = "https://hotels4.p.rapidapi.com/properties/v2/detail"
@@ -31,7 +47,7 @@ class API:
         "X-RapidAPI-Host": "hotels4.p.rapidapi.com"
     }
 
-    # полезная нагрузка для url2
+    # шаблон полезной нагрузки для url2, заполняется в SearchRequest.list_payload
     payload_list = {
         "currency": "USD",
         "eapid": 1,
@@ -71,78 +87,415 @@ class API:
     }
 
 
-def make_api_request():
+location_cache = create_cache(namespace='locations', maxsize=LOCATION_CACHE_SIZE, ttl=LOCATION_CACHE_TTL,
+                              sqlite=LOCATION_CACHE_SQLITE)
+detail_cache = create_cache(namespace='details', maxsize=DETAIL_CACHE_SIZE, ttl=DETAIL_CACHE_TTL,
+                            sqlite=DETAIL_CACHE_SQLITE)
+# одинаковые запросы, отправленные одновременно, объединяются в один запрос к API
+location_flight = SingleFlight('locations/v3/search', timeout=API_CONNECT_TIMEOUT + LOCATIONS_READ_TIMEOUT)
+list_flight = SingleFlight('properties/v2/list', timeout=API_CONNECT_TIMEOUT + LIST_READ_TIMEOUT)
+detail_flight = SingleFlight('properties/v2/detail', timeout=API_CONNECT_TIMEOUT + DETAIL_READ_TIMEOUT)
+search_cache = RefreshingCache(maxsize=SEARCH_CACHE_SIZE, ttl=SEARCH_CACHE_TTL, stale_ttl=SEARCH_CACHE_STALE_TTL,
+                               flight=list_flight)
+
+
+def list_request(search):
     """
-        Sends a request to the API and returns the response.
+        Returns the properties/v2/list request sent for the search: at least LIST_RESULTS_SIZE hotels,
+        so the searches differing only in the number of hotels share one search cache entry.
 
-        :return: The response data in JSON format if successful, None otherwise.
-        :rtype: dict or None
+        :param search: SearchRequest (parameters of the user's search)
+        :return: SearchRequest
+    """
+    return search._replace(results_size=max(search.results_size, LIST_RESULTS_SIZE))
+
+
+def make_api_request(search):
+    """
+        Returns the hotels of the search from the search cache, requesting them from the API on a miss.
+        Identical concurrent searches share one request, a stale result is returned at once
+        and refreshed in the background. The cached list (list_request) is cut to the number of hotels of the search.
+
+        :param search: SearchRequest (parameters of the user's search)
+        :return: The parsed hotels if successful, None otherwise.
+        :rtype: HotelBatch or None
+        :raises QuotaExceeded: if the hotels4 budget does not allow the request
+    """
+    request = list_request(search)
+    try:
+        hotels = search_cache.get(request.cache_key(), lambda: request_hotels(request))
+    except QuotaExceeded:
+        raise
+    except requests.RequestException as e:
+        logger.error(f'Hotels list request failed: {e}')
+        return None
+    return hotels.head(search.results_size) if hotels else hotels
+
+
+def request_hotels(search):
+    """
+        Sends a properties/v2/list request to the API and returns the response.
+
+        :param search: SearchRequest (parameters of the user's search)
+        :return: The parsed hotels if successful, None otherwise.
+        :rtype: HotelBatch or None
+        :raises QuotaExceeded: if the hotels4 budget does not allow the request
+    """
+    payload = search.list_payload(API.payload_list)
+    quota.acquire('list')
+    try:
+        response = session.request("POST", API.url2, json=payload, headers=API.headers_list_detail,
+                                   timeout=(API_CONNECT_TIMEOUT, LIST_READ_TIMEOUT))
+    except requests.RequestException as e:
+        logger.error(f'Hotels list request failed: {e}')
+        return None
+    return parse_list_response(response.json())
+
+
+def parse_list_response(response_data):
+    """
+        Parses the properties/v2/list response.
+
+        :param response_data: dict (response in JSON format)
+        :return: The parsed hotels if successful, None otherwise.
+        :rtype: HotelBatch or None
     """
-    response = requests.request("POST", API.url2, json=API.payload_list, headers=API.headers_list_detail)
-    response_data = response.json()
     if 'errors' in response_data and response_data['errors'][0]['message'].startswith(
             'Error occurred in downstream service.'):
         return None
     else:
-        return response.json()['data']['propertySearch']['properties']
+        return HotelBatch.from_properties(response_data['data']['propertySearch']['properties'])
+
+
+def iter_property_pages(search, page_size, max_results):
+    """
+        Requests the hotels page by page (resultsStartingIndex), lazily.
+        The next page is requested only when the previous one has been consumed.
+        When the hotels4 budget runs out after the first page, the hotels already found are used.
+
+        :param search: SearchRequest (parameters of the user's search)
+        :param page_size: int
+        :param max_results: int (maximum number of hotels to look through)
+        :return: generator of HotelBatch
+        :raises QuotaExceeded: if the budget does not allow the first page
+    """
+    for starting_index in range(0, max_results, page_size):
+        try:
+            page = make_api_request(search._replace(starting_index=starting_index,
+                                                    results_size=min(page_size, max_results - starting_index)))
+        except QuotaExceeded as e:
+            if not starting_index:
+                raise
+            logger.warning(f'Hotels list paging stopped: {e}')
+            return
+        if not page:
+            return
+        yield page
+        if len(page) < page_size:
+            return
+
+
+def make_paged_api_request(search, page_size, max_results):
+    """
+        Requests the first page of hotels and returns all pages as a lazy iterator,
+        the following pages are requested while the iterator is being consumed.
+
+        :param search: SearchRequest (parameters of the user's search)
+        :param page_size: int
+        :param max_results: int (maximum number of hotels to look through)
+        :return: iterator of HotelBatch if the first page is not empty, None otherwise.
+        :rtype: iterator or None
+        :raises QuotaExceeded: if the hotels4 budget does not allow the first page
+    """
+    pages = iter_property_pages(search, page_size, max_results)
+    first_page = next(pages, None)
+    if not first_page:
+        return None
+    return chain([first_page], pages)
+
+
+def fetch_detail(id_item):
+    """
+        Requests the details of a single property, using the detail cache when possible.
+        Only the fields displayed to the user are kept: name, first address line
+        and the first DETAIL_CACHE_IMAGES image URLs.
+
+        :param id_item: str
+        :return: The property details if successful, None otherwise.
+        :rtype: dict or None
+    """
+    detail = detail_cache.get(id_item)
+    if detail is not None:
+        return detail
+    try:
+        return detail_flight.do(id_item, lambda: request_detail(id_item))
+    except requests.RequestException as e:
+        logger.error(f'Property detail request failed: {e}')
+        return None
+
+
+def request_detail(id_item):
+    """
+        Sends a properties/v2/detail request to the API and caches the parsed details.
+
+        :param id_item: str
+        :return: The property details if successful, None otherwise.
+        :rtype: dict or None
+    """
+    payload = dict(API.payload_detail, propertyId=id_item)
+    quota.acquire('detail')
+    resp = session.request("POST", API.url3, json=payload, headers=API.headers_list_detail,
+                           timeout=(API_CONNECT_TIMEOUT, DETAIL_READ_TIMEOUT))
+    try:
+        resp_json = resp.json()
+    except json.decoder.JSONDecodeError as e:
+        print(f"Error decoding response JSON: {e}")
+        return None
+
+    detail = parse_detail_response(resp.status_code, resp_json)
+    if detail is not None:
+        detail_cache.set(id_item, detail)
+    return detail
+
+
+def parse_detail_response(status_code, resp_json):
+    """
+        Converts the properties/v2/detail response into the compact form stored in the detail cache.
+
+        :param status_code: int
+        :param resp_json: dict (response in JSON format)
+        :return: The property details if successful, None otherwise.
+        :rtype: dict or None
+    """
+    if status_code == 200 and resp_json and 'data' in resp_json and 'propertyInfo' in resp_json['data']:
+        property_info = resp_json['data']['propertyInfo']
+        # у некоторых отелей нет галереи (propertyGallery или images равны null)
+        images = (property_info.get('propertyGallery') or {}).get('images') or []
+        return {
+            'name': property_info['summary']['name'],
+            'address': property_info['summary']['location']['address']['firstAddressLine'],
+            'images': [image['image']['url'] for image in images[:DETAIL_CACHE_IMAGES]]
+        }
+    return None
+
+
+def hotel_card(hotel, detail, total_days):
+    """
+        Builds the text of a hotel card.
+
+        :param hotel: HotelRecord
+        :param detail: dict (result of fetch_detail)
+        :param total_days: int
+        :return: str
+    """
+    name = detail['name']
+    address = detail['address']
+    price = format_price(hotel.price_cents, hotel.currency)
+    total_cost = format_price(hotel.price_cents * total_days, hotel.currency)
+    return f'Link: https://hotels.com/h{hotel.id}.Hotel-Information\nName: {name}\nAddress: {address}\nCost per night: {price}\nTotal cost: {total_cost}' \
+           f'\nDistance from center: {hotel.distance}'
+
+
+def hotel_media_group(sources, result_text):
+    """
+        Builds the media group of a hotel card, the card text is the caption of the first picture.
+
+        :param sources: list of str (file_id or URL of each picture, result of photo_sources)
+        :param result_text: str
+        :return: list of InputMediaPhoto
+    """
+    return [types.InputMediaPhoto(photo, caption=result_text if num == 0 else '') for num, photo in enumerate(sources)]
+
+
+def list_detail(hotel):
+    """
+        Builds the details of a property from its properties/v2/list entry (no address, no pictures),
+        used when the detail budget is used up. The details are marked as degraded:
+        they are not cached and do not replace the stored property in the history.
+
+        :param hotel: HotelRecord
+        :return: dict
+    """
+    quota.count_degraded(LEVEL_LIST_ONLY)
+    return {'name': hotel.name or f'Hotel {hotel.id}', 'address': 'not available', 'images': [], 'degraded': True}
+
+
+def history_property(hotel, detail):
+    """
+        Returns the property of a displayed hotel to record in the history:
+        without an address if the details were built from the list data.
+
+        :param hotel: HotelRecord
+        :param detail: dict
+        :return: (property id, name, address or None)
+        :rtype: tuple
+    """
+    if detail.get('degraded'):
+        return hotel.id, detail['name'], None
+    return hotel.id, detail['name'], detail['address']
+
+
+def fetch_hotel(hotel, pictures):
+    """
+        Requests the details of a property and selects the pictures to display.
+        While the detail budget is low (quota) fewer pictures are selected,
+        when it is used up only cached details are used and the others are built from the list entry.
+
+        :param hotel: HotelRecord
+        :param pictures: int (number of pictures requested)
+        :return: (details, pictures), details are None if the request failed
+        :rtype: tuple
+    """
+    if quota.level() == LEVEL_LIST_ONLY:
+        detail = detail_cache.get(hotel.id) or list_detail(hotel)
+    else:
+        detail = fetch_detail(hotel.id)
+        if detail is None and quota.level() == LEVEL_LIST_ONLY:
+            detail = list_detail(hotel)
+    if detail is None or not detail['images']:
+        return detail, []
+    return detail, select_images(hotel.id, detail['images'], quota.pictures(pictures))
 
 
-def make_api_request1(message, id_price, distance, data, user_id):
+def send_hotel(message, hotel, detail, images, data):
+    """
+        Displays one hotel card (with pictures if requested).
+
+        :param message: Message
+        :param hotel: HotelRecord
+        :param detail: dict (result of fetch_detail)
+        :param images: list of str (checked pictures, result of select_images)
+        :param data: dict
+        :return: None
+    """
+    result_text = hotel_card(hotel, detail, data['total_days'])
+    if data['pictures_question'] == 0 or not images:
+        bot.send_message(message.chat.id, text=result_text)
+    else:
+        sources = photo_sources(images)
+        media_group = hotel_media_group(sources, result_text)
+        media_stats.add(groups=1)
+        try:
+            messages = bot.send_media_group(chat_id=message.chat.id, media=media_group)
+            remember_file_ids(images, sources, messages)
+        except telebot.apihelper.ApiTelegramException as e:
+            logger.warning(f'Media group of hotel {hotel.id} failed: {e}')
+            media_stats.add(fallbacks=1)
+            forget_file_ids(images)
+            for url, photo in zip(images, media_group):
+                try:
+                    sent = bot.send_photo(chat_id=message.chat.id, photo=url, caption=photo.caption)
+                    remember_file_ids([url], [url], [sent])
+                except telebot.apihelper.ApiTelegramException:
+                    pass
+
+
+# результаты поиска загружаются заранее, пока пользователь отвечает на вопрос о фото
+prefetcher = Prefetcher(load_detail=fetch_detail, max_workers=PREFETCH_WORKERS, details=PREFETCH_DETAILS,
+                        max_chats=PREFETCH_MAX_CHATS)
+
+
+def make_api_request1(message, hotels, data, user_id, started=None):
     """"
         Makes a request to the API and displays hotels based on the specified parameters.
-        Records information about the command and the time of the request in the database.
-        Records parameters in the database.
+        Works as a pipeline: the details of a hotel are requested (and its pictures checked) as soon as
+        the hotel is taken from the hotels iterable (at most DETAIL_MAX_WORKERS hotels at a time),
+        and each card is displayed as soon as it and all the previous ones are ready.
+        The cards are sent with PRIORITY_RESULT, ahead of the dialog messages of other chats.
+        Logs the time to the first and to the last displayed hotel.
+        Records the command, the time of the request and the shown hotels in the database
+        through the history writer.
 
         :param message: Message
-        :param id_price: dict
-        :param distance: list
+        :param hotels: iterable of HotelRecord in display order
         :param data: dict
         :param user_id: int
-        :return: None
+        :param started: float (time.perf_counter() at the start of the search, default: now)
+        :return: The number of hotels taken from the iterable.
+        :rtype: int
     """
+    if started is None:
+        started = time.perf_counter()
+    created = int(time.time())
+    shown_hotels = []
+    pictures = int(data['pictures_question'])
+    count = 0
+    shown = 0
+    pending = deque()
 
-    index = 0
-    total_days = data['total_days']
+    def deliver():
+        nonlocal shown
+        hotel, future = pending.popleft()
+        detail, images = future.result()
+        if detail is None:
+            return
+        send_hotel(message, hotel, detail, images, data)
+        shown_hotels.append(history_property(hotel, detail))
+        shown += 1
+        if shown == 1:
+            logger.info(f'Time to first result: {time.perf_counter() - started:.2f} s')
 
-    user_record = User.create(command=data['command'], date=datetime.now().strftime('%d.%m.%Y - %H:%M:%S'),
-                          user_id=user_id)
-    for id_item, price in id_price.items():
-        API.payload_detail['propertyId'] = id_item
-        resp = requests.request("POST", API.url3, json=API.payload_detail, headers=API.headers_list_detail)
-
-        try:
-            resp_json = resp.json()
-
-        except json.decoder.JSONDecodeError as e:
-            print(f"Error decoding response JSON: {e}")
-            continue
-
-        if resp.status_code == 200 and resp_json and 'data' in resp_json and 'propertyInfo' in resp_json['data']:
-            name = resp_json['data']['propertyInfo']['summary']['name']
-            address = resp_json['data']['propertyInfo']['summary']['location']['address']['firstAddressLine']
-            result_text = f'Link: https://hotels.com/h{id_item}.Hotel-Information\nName: {name}\nAddress: {address}\nCost per night: {price}\nTotal cost: ${int(price[1:]) * total_days}' \
-                          f'\nDistance from center: {distance[index]}'
-            Hotel.create(name=name, address=address, req=user_record)
-            index += 1
-            if data['pictures_question'] == 0:
-                bot.send_message(message.chat.id, text=result_text)
-            else:
-                media_group = []
-                images = resp_json['data']['propertyInfo']['propertyGallery']['images']
-                for num in range(min(int(data['pictures_question']), len(images))):
-                    photo = images[num]['image']['url']
-                    caption = result_text if num == 0 else ''
-                    media_group.append(types.InputMediaPhoto(photo, caption=caption))
-                if media_group:
-                    try:
-                        bot.send_media_group(chat_id=message.chat.id, media=media_group)
-                    except telebot.apihelper.ApiTelegramException as e:
-                        for photo in media_group:
-                            try:
-                                bot.send_photo(chat_id=message.chat.id, photo=photo.media, caption=photo.caption)
-                            except telebot.apihelper.ApiTelegramException:
-                                pass
+    with ThreadPoolExecutor(max_workers=DETAIL_MAX_WORKERS) as executor, outbound.priority(PRIORITY_RESULT):
+        for hotel in hotels:
+            pending.append((hotel, executor.submit(fetch_hotel, hotel, pictures)))
+            count += 1
+            while pending and (pending[0][1].done() or len(pending) > DETAIL_MAX_WORKERS):
+                deliver()
+        while pending:
+            deliver()
+    if shown:
+        logger.info(f'Time to last result: {time.perf_counter() - started:.2f} s ({shown} hotels)')
     logger.info('Saving to database')
+    history_writer.add_search(search_columns(user_id, data['command'], created, SearchRequest.from_data(data),
+                                             data.get('query')), shown_hotels)
+    prefetcher.claim(message.chat.id, [hotel_id for hotel_id, _, _ in shown_hotels])
+    logger.info(f'Search cache: {search_cache.stats()}')
+    logger.info(f'Detail cache: {detail_cache.stats()}')
+    logger.info(f'Prefetch: {prefetcher.stats()}')
+    logger.info(f'hotels4 quota: {quota.stats()}')
+    logger.info(f'Shared requests: list {list_flight.stats()}, detail {detail_flight.stats()}, '
+                f'locations {location_flight.stats()}')
+    if pictures:
+        logger.info(f'Pictures: {media_stats.stats()}, file_id cache: {file_id_cache.stats()}')
+    return count
+
+
+def search_locations(query):
+    """
+        Requests the cities matching the query, using the location cache when possible.
+        Only the fields needed for the city keyboard are kept.
+
+        :param query: str
+        :return: list of cities
+        :rtype: list
+    """
+    key = query.casefold()
+    reply = location_cache.get(key)
+    if reply is not None:
+        logger.info('Location found in cache')
+        return reply
+    return location_flight.do(key, lambda: request_locations(query))
+
+
+def request_locations(query):
+    """
+        Sends a locations/v3/search request to the API and caches the cities found.
+
+        :param query: str
+        :return: list of cities
+        :rtype: list
+    """
+    key = query.casefold()
+    params = {'q': query.capitalize()}
+    quota.acquire('locations')
+    response = session.request("GET", API.url1, headers=API.headers_search, params=params,
+                               timeout=(API_CONNECT_TIMEOUT, LOCATIONS_READ_TIMEOUT))
+    reply = [{'gaiaId': city_data['gaiaId'], 'regionNames': {'fullName': city_data['regionNames']['fullName']}}
+             for city_data in response.json().get('sr', []) if city_data.get('type') == 'CITY']
+    logger.info('Requesting API by location name')
+    if reply:
+        location_cache.set(key, reply)
+    return reply
 
 
 @logger.catch()
@@ -156,11 +509,19 @@ def list_cities(message: types.Message, word) -> None:
         :return: None
     """
     if message.text.isalpha():
-        params = {'q': message.text.capitalize()}
-        response = requests.request("GET", API.url1, headers=API.headers_search, params=params)
-        reply = [city_data for city_data in response.json().get('sr', []) if city_data.get('type') == 'CITY']
-        logger.info('Requesting API by location name')
+        try:
+            reply = search_locations(message.text)
+        except QuotaExceeded as e:
+            bot.send_message(chat_id=message.chat.id, text='Too many searches right now. Please re-enter in a minute:')
+            logger.warning(f'Location request rejected: {e}')
+            return
+        except requests.RequestException as e:
+            bot.send_message(chat_id=message.chat.id, text='The search service is not responding. Please re-enter:')
+            logger.error(f'Location request failed: {e}')
+            return
         if reply:
+            with bot.retrieve_data(user_id=message.from_user.id, chat_id=message.chat.id) as data:
+                data['query'] = message.text
             cit_keyboard = generate_city_keyboard(word=word, reply=reply)
             bot.send_message(chat_id=message.chat.id, text='Please choose the location:', reply_markup=cit_keyboard)
             logger.info('Displaying locations.')
@@ -171,6 +532,13 @@ def list_cities(message: types.Message, word) -> None:
         bot.send_message(chat_id=message.chat.id, text='Incorrect input. Please enter letters only:')
 
 
+def search_rejected(chat_id, error):
+    """
+        Tells the user that the search was rejected because the hotels4 budget is used up.
 
-
-
+        :param chat_id: int
+        :param error: QuotaExceeded
+        :return: None
+    """
+    bot.send_message(chat_id=chat_id, text='Too many searches right now. Please repeat the search in a minute.')
+    logger.warning(f'Hotels list request rejected: {error}')
@@ -0,0 +1,352 @@
+import asyncio
+import threading
+import time
+import aiohttp
+from telebot import asyncio_helper
+from telebot.async_telebot import AsyncTeleBot
+from .api import API, detail_cache, search_cache, parse_list_response, parse_detail_response, hotel_card, \
+    hotel_media_group, prefetcher, list_detail, history_property, list_request
+from .media import select_images, media_stats, photo_sources, remember_file_ids, forget_file_ids
+from .quota import quota, QuotaExceeded, LEVEL_LIST_ONLY
+from .records import HotelBatch
+from .search_request import SearchRequest
+from universal_functions.ranking import collect_candidates, rank_candidates
+from database.writer import history_writer, search_columns
+from utils.sender import outbound, PRIORITY_RESULT
+from loader import TOKEN
+from config_data.config import DETAIL_MAX_WORKERS, API_CONNECT_TIMEOUT, API_READ_TIMEOUT, ASYNC_MAX_CONNECTIONS, \
+    BESTDEAL_PAGE_SIZE, BESTDEAL_MAX_RESULTS
+from loguru import logger
+
+
+class AsyncRuntime:
+    """
+    class contains the asyncio event loop (in its own thread) running the searches as coroutines
+    and the async bot sending their results
+    """
+    def __init__(self):
+        self.bot = AsyncTeleBot(token=TOKEN)
+        self.loop = asyncio.new_event_loop()
+        self.http = None
+        self.thread = threading.Thread(target=self.loop.run_forever, name='async-runtime', daemon=True)
+        self.thread.start()
+
+    def submit(self, coro):
+        """
+            Schedules the coroutine on the event loop from any thread.
+
+            :param coro: coroutine
+            :return: concurrent.futures.Future
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def session(self):
+        """
+            Returns the HTTP session for the hotels4 API (created on first use, inside the event loop).
+
+            :return: aiohttp.ClientSession
+        """
+        if self.http is None:
+            self.http = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=ASYNC_MAX_CONNECTIONS),
+                timeout=aiohttp.ClientTimeout(sock_connect=API_CONNECT_TIMEOUT, sock_read=API_READ_TIMEOUT),
+                headers={'Accept-Encoding': 'gzip, deflate'})
+        return self.http
+
+    async def close(self):
+        """
+            Closes the HTTP sessions of the hotels4 API and of the async bot.
+
+            :return: None
+        """
+        if self.http is not None:
+            await self.http.close()
+        if asyncio_helper.session_manager.session is not None:
+            await self.bot.close_session()
+
+
+runtime = None
+runtime_lock = threading.Lock()
+
+
+def get_runtime():
+    """
+        Returns the asyncio runtime, starting it on first use.
+
+        :return: AsyncRuntime
+    """
+    global runtime
+    with runtime_lock:
+        if runtime is None:
+            runtime = AsyncRuntime()
+            logger.info('Async runtime started')
+    return runtime
+
+
+def shutdown_runtime():
+    """
+        Closes the HTTP sessions and stops the event loop of the asyncio runtime if it was started.
+
+        :return: None
+    """
+    global runtime
+    with runtime_lock:
+        if runtime is None:
+            return
+        runtime.submit(runtime.close()).result()
+        runtime.loop.call_soon_threadsafe(runtime.loop.stop)
+        runtime.thread.join()
+        runtime = None
+        logger.info('Async runtime stopped')
+
+
+async def async_make_api_request(http, search):
+    """
+        Sends a properties/v2/list request (list_request) without blocking the event loop.
+        Fresh results are taken from the search cache, a stale result is returned if the request fails.
+        The list is cut to the number of hotels of the search.
+
+        :param http: aiohttp.ClientSession
+        :param search: SearchRequest (parameters of the user's search)
+        :return: The parsed hotels if successful, None otherwise.
+        :rtype: HotelBatch or None
+        :raises QuotaExceeded: if the hotels4 budget does not allow the request and there is no stale result
+    """
+    request = list_request(search)
+    key = request.cache_key()
+    hotels, fresh = search_cache.peek(key)
+    if not fresh:
+        payload = request.list_payload(API.payload_list)
+        try:
+            quota.acquire('list')
+            async with http.post(API.url2, json=payload, headers=API.headers_list_detail) as response:
+                response_data = await response.json(content_type=None)
+        except QuotaExceeded as e:
+            if not hotels:
+                raise
+            logger.warning(f'Hotels list request rejected, the stale result is used: {e}')
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            logger.error(f'Hotels list request failed: {e}')
+        else:
+            fetched = parse_list_response(response_data)
+            if fetched is not None:
+                search_cache.set(key, fetched)
+                hotels = fetched
+    return hotels.head(search.results_size) if hotels else hotels
+
+
+async def async_fetch_detail(http, id_item, semaphore):
+    """
+        Requests the details of a single property, using the detail cache when possible
+        (read and written in the default executor: its second tier may be in SQLite).
+
+        :param http: aiohttp.ClientSession
+        :param id_item: str
+        :param semaphore: asyncio.Semaphore (limits the detail requests of one search)
+        :return: The property details if successful, None otherwise.
+        :rtype: dict or None
+    """
+    loop = asyncio.get_running_loop()
+    detail = await loop.run_in_executor(None, detail_cache.get, id_item)
+    if detail is not None:
+        return detail
+    payload = dict(API.payload_detail, propertyId=id_item)
+    async with semaphore:
+        try:
+            quota.acquire('detail')
+            async with http.post(API.url3, json=payload, headers=API.headers_list_detail) as resp:
+                resp_json = await resp.json(content_type=None)
+                status_code = resp.status
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError, QuotaExceeded) as e:
+            logger.error(f'Property detail request failed: {e}')
+            return None
+    detail = parse_detail_response(status_code, resp_json)
+    if detail is not None:
+        await loop.run_in_executor(None, detail_cache.set, id_item, detail)
+    return detail
+
+
+async def async_best_hotels(http, search, data):
+    """
+        Pages through the hotels list until enough hotels within the user's ranges are collected
+        and ranks them (the /bestdeal selection of universal_functions.ranking.best_hotels).
+
+        :param http: aiohttp.ClientSession
+        :param search: SearchRequest (parameters of the user's search)
+        :param data: dict (state data with the ranges and the number of hotels)
+        :return: The best hotels in display order, None if the first page is empty.
+        :rtype: list or None
+        :raises QuotaExceeded: if the hotels4 budget does not allow the first page
+    """
+    candidates = HotelBatch()
+    for starting_index in range(0, BESTDEAL_MAX_RESULTS, BESTDEAL_PAGE_SIZE):
+        try:
+            page = await async_make_api_request(http, search._replace(
+                starting_index=starting_index,
+                results_size=min(BESTDEAL_PAGE_SIZE, BESTDEAL_MAX_RESULTS - starting_index)))
+        except QuotaExceeded as e:
+            if starting_index == 0:
+                raise
+            logger.warning(f'Hotels list paging stopped: {e}')
+            break
+        if not page:
+            if starting_index == 0:
+                return None
+            break
+        if collect_candidates(candidates, page, data) or len(page) < BESTDEAL_PAGE_SIZE:
+            break
+    return rank_candidates(candidates, data)
+
+
+async def async_fetch_hotel(http, hotel, pictures, semaphore):
+    """
+        Requests the details of a property and selects the pictures to display
+        (the HEAD checks run in the default executor). Degrades like fetch_hotel when the detail budget is low.
+
+        :param http: aiohttp.ClientSession
+        :param hotel: HotelRecord
+        :param pictures: int (number of pictures requested)
+        :param semaphore: asyncio.Semaphore (limits the detail requests of one search)
+        :return: (details, pictures), details are None if the request failed
+        :rtype: tuple
+    """
+    loop = asyncio.get_running_loop()
+    if quota.level() == LEVEL_LIST_ONLY:
+        detail = await loop.run_in_executor(None, detail_cache.get, hotel.id) or list_detail(hotel)
+    else:
+        detail = await async_fetch_detail(http, hotel.id, semaphore)
+        if detail is None and quota.level() == LEVEL_LIST_ONLY:
+            detail = list_detail(hotel)
+    if detail is None or not pictures or not detail['images']:
+        return detail, []
+    pictures = quota.pictures(pictures)
+    return detail, await loop.run_in_executor(None, select_images, hotel.id, detail['images'], pictures)
+
+
+async def async_send_hotel(chat_id, hotel, detail, images, data):
+    """
+        Displays one hotel card (with pictures if requested) through the async bot.
+        The messages wait for their turn in the outbound scheduler with PRIORITY_RESULT,
+        the cached file_ids are read and written in the default executor.
+
+        :param chat_id: int
+        :param hotel: HotelRecord
+        :param detail: dict (result of async_fetch_detail)
+        :param images: list of str (checked pictures, result of select_images)
+        :param data: dict
+        :return: None
+    """
+    bot = get_runtime().bot
+    result_text = hotel_card(hotel, detail, data['total_days'])
+    if data['pictures_question'] == 0 or not images:
+        await outbound.send_async(chat_id, lambda: bot.send_message(chat_id, text=result_text), PRIORITY_RESULT)
+    else:
+        # file_id хранятся в SQLite: чтение и запись идут в пуле потоков, не блокируя цикл событий
+        loop = asyncio.get_running_loop()
+        sources = await loop.run_in_executor(None, photo_sources, images)
+        media_group = hotel_media_group(sources, result_text)
+        media_stats.add(groups=1)
+        try:
+            messages = await outbound.send_async(
+                chat_id, lambda: bot.send_media_group(chat_id=chat_id, media=media_group), PRIORITY_RESULT)
+            await loop.run_in_executor(None, remember_file_ids, images, sources, messages)
+        except asyncio_helper.ApiTelegramException as e:
+            logger.warning(f'Media group of hotel {hotel.id} failed: {e}')
+            media_stats.add(fallbacks=1)
+            await loop.run_in_executor(None, forget_file_ids, images)
+            for url, photo in zip(images, media_group):
+                try:
+                    sent = await outbound.send_async(
+                        chat_id, lambda: bot.send_photo(chat_id=chat_id, photo=url, caption=photo.caption),
+                        PRIORITY_RESULT)
+                    await loop.run_in_executor(None, remember_file_ids, [url], [url], [sent])
+                except asyncio_helper.ApiTelegramException:
+                    pass
+
+
+async def run_search(chat_id, search, data, user_id, started, best=False):
+    """
+        Runs a whole search as a coroutine: the list request, concurrent detail requests
+        (at most DETAIL_MAX_WORKERS at a time) and the cards in the original order.
+        The messages wait for their turn in the outbound scheduler (send_async).
+        The search is recorded through the history writer (in the default executor, so a synchronous
+        write does not block the event loop).
+
+        :param chat_id: int
+        :param search: SearchRequest (parameters of the user's search)
+        :param data: dict (copy of the state data)
+        :param user_id: int
+        :param started: float (time.perf_counter() at the start of the search)
+        :param best: bool (True for /bestdeal: paged list and ranking)
+        :return: None
+    """
+    http = get_runtime().session()
+    bot = get_runtime().bot
+    try:
+        if best:
+            hotels = await async_best_hotels(http, search, data)
+        else:
+            hotels = await async_make_api_request(http, search)
+    except QuotaExceeded as e:
+        await outbound.send_async(chat_id, lambda: bot.send_message(
+            chat_id, text='Too many searches right now. Please repeat the search in a minute.'))
+        logger.warning(f'Hotels list request rejected: {e}')
+        return
+    if not hotels:
+        await outbound.send_async(chat_id, lambda: bot.send_message(chat_id, text='Hotels are not found.'))
+        logger.error('Hotels are not found.')
+        return
+    loop = asyncio.get_running_loop()
+    created = int(time.time())
+    shown_hotels = []
+    semaphore = asyncio.Semaphore(DETAIL_MAX_WORKERS)
+    hotels = list(hotels)
+    pictures = int(data['pictures_question'])
+    tasks = [asyncio.ensure_future(async_fetch_hotel(http, hotel, pictures, semaphore)) for hotel in hotels]
+    shown = 0
+    for hotel, task in zip(hotels, tasks):
+        detail, images = await task
+        if detail is None:
+            continue
+        await async_send_hotel(chat_id, hotel, detail, images, data)
+        shown_hotels.append(history_property(hotel, detail))
+        shown += 1
+        if shown == 1:
+            logger.info(f'Time to first result: {time.perf_counter() - started:.2f} s')
+    if shown:
+        logger.info(f'Time to last result: {time.perf_counter() - started:.2f} s ({shown} hotels)')
+    columns = search_columns(user_id, data['command'], created, search, data.get('query'))
+    await loop.run_in_executor(None, history_writer.add_search, columns, shown_hotels)
+    prefetcher.claim(chat_id, [hotel_id for hotel_id, _, _ in shown_hotels])
+    if best and len(hotels) < int(data['hotels_count']):
+        text = f'{len(hotels)} offers found according to your filters.'
+        await outbound.send_async(chat_id, lambda: bot.send_message(chat_id, text=text))
+
+
+def submit_search(message, data, user_id, started, best=False):
+    """
+        Schedules the search on the asyncio runtime and returns immediately,
+        so the bot worker thread is not blocked while hotels4 is being requested.
+
+        :param message: Message
+        :param data: dict (state data of the chat)
+        :param user_id: int
+        :param started: float (time.perf_counter() at the start of the search)
+        :param best: bool (True for /bestdeal)
+        :return: None
+    """
+    future = get_runtime().submit(run_search(message.chat.id, SearchRequest.from_data(data), dict(data), user_id,
+                                             started, best))
+    future.add_done_callback(log_search_failure)
+
+
+def log_search_failure(future):
+    """
+        Logs the exception of a failed search coroutine.
+
+        :param future: concurrent.futures.Future
+        :return: None
+    """
+    error = future.exception()
+    if error is not None:
+        logger.opt(exception=error).error('Search failed')
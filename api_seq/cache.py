@@ -0,0 +1,395 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from peewee import fn
+from database.classes import CacheEntry
+from .quota import quota
+
+
+class KeyWatch:
+    """
+    class contains a set of watched keys of a cache (the keys stored by the warm-up)
+    and counts the lookups served from them
+    """
+    def __init__(self):
+        self.keys = frozenset()
+        self.used = set()
+        self.hits = 0
+        self._lock = threading.Lock()
+
+    def watch(self, keys):
+        """
+            Replaces the watched keys and resets the counters.
+
+            :param keys: iterable of keys
+            :return: None
+        """
+        with self._lock:
+            self.keys = frozenset(keys)
+            self.used = set()
+            self.hits = 0
+
+    def hit(self, key):
+        """
+            Counts a cache hit if the key is watched.
+
+            :param key: str
+            :return: None
+        """
+        if key in self.keys:
+            with self._lock:
+                self.hits += 1
+                self.used.add(key)
+
+    def stats(self):
+        """
+            Returns the number of watched keys, how many of them were hit and the number of hits.
+
+            :return: dict
+        """
+        with self._lock:
+            return {'warmed': len(self.keys), 'used': len(self.used), 'hits': self.hits,
+                    'use_rate': len(self.used) / len(self.keys) if self.keys else 0.0}
+
+
+class MemoryCache:
+    """
+    class contains a bounded in-process cache with per-entry TTL and LRU eviction
+    """
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.watch = None
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+            Returns the cached value or None if the key is missing or expired.
+
+            :param key: str
+            :return: cached value or None
+        """
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or item[1] < time.time():
+                if item is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+        if self.watch is not None:
+            self.watch.hit(key)
+        return item[0]
+
+    def set(self, key, value, ttl=None):
+        """
+            Stores the value, evicting the least recently used entries above maxsize.
+
+            :param key: str
+            :param value: any JSON-serializable value
+            :param ttl: int (seconds, default: the cache TTL)
+            :return: None
+        """
+        expires = time.time() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        """
+            Removes the key from the cache.
+
+            :param key: str
+            :return: None
+        """
+        with self._lock:
+            self._data.pop(key, None)
+
+    def stats(self):
+        """
+            Returns the hit/miss counters of the cache.
+
+            :return: dict
+        """
+        total = self.hits + self.misses
+        return {'size': len(self._data), 'hits': self.hits, 'misses': self.misses,
+                'hit_ratio': self.hits / total if total else 0.0}
+
+
+class SqliteCache:
+    """
+    class contains a cache stored in the cache table of history.db (survives restarts).
+    The size of the namespace is checked every check_every writes, so it may exceed maxsize by that much.
+    """
+    def __init__(self, namespace, maxsize, ttl):
+        self.namespace = namespace
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.check_every = max(1, maxsize // 10)
+        self.writes = 0
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+            Returns the cached value or None if the key is missing or expired.
+
+            :param key: str
+            :return: cached value or None
+        """
+        entry = self.get_entry(key)
+        return None if entry is None else entry[0]
+
+    def get_entry(self, key):
+        """
+            Returns the cached value with its expiration time or None if the key is missing or expired.
+
+            :param key: str
+            :return: (value, expires) or None
+            :rtype: tuple
+        """
+        entry = CacheEntry.get_or_none(CacheEntry.namespace == self.namespace, CacheEntry.key == key)
+        with self._lock:
+            if entry is None or entry.expires < time.time():
+                self.misses += 1
+                return None
+            self.hits += 1
+        return json.loads(entry.value), entry.expires
+
+    def set(self, key, value, ttl=None):
+        """
+            Stores the value; every check_every writes removes expired entries and entries above maxsize.
+
+            :param key: str
+            :param value: any JSON-serializable value
+            :param ttl: int (seconds, default: the cache TTL)
+            :return: None
+        """
+        now = int(time.time())
+        expires = now + (self.ttl if ttl is None else ttl)
+        CacheEntry.replace(namespace=self.namespace, key=key, value=json.dumps(value, separators=(',', ':')),
+                           expires=expires).execute()
+        with self._lock:
+            self.writes += 1
+            if self.writes % self.check_every:
+                return
+        namespace_entries = CacheEntry.select().where(CacheEntry.namespace == self.namespace)
+        if namespace_entries.count() > self.maxsize:
+            CacheEntry.delete().where(CacheEntry.namespace == self.namespace, CacheEntry.expires < now).execute()
+            overflow = namespace_entries.count() - self.maxsize
+            if overflow > 0:
+                oldest = (CacheEntry.select(CacheEntry.key)
+                          .where(CacheEntry.namespace == self.namespace)
+                          .order_by(CacheEntry.expires).limit(overflow))
+                CacheEntry.delete().where(CacheEntry.namespace == self.namespace,
+                                          CacheEntry.key.in_(oldest)).execute()
+
+    def delete(self, key):
+        """
+            Removes the key from the cache.
+
+            :param key: str
+            :return: None
+        """
+        CacheEntry.delete().where(CacheEntry.namespace == self.namespace, CacheEntry.key == key).execute()
+
+    def stats(self):
+        """
+            Returns the hit/miss counters of the cache.
+
+            :return: dict
+        """
+        size = CacheEntry.select(fn.COUNT(CacheEntry.key)).where(CacheEntry.namespace == self.namespace).scalar()
+        total = self.hits + self.misses
+        return {'size': size, 'hits': self.hits, 'misses': self.misses,
+                'hit_ratio': self.hits / total if total else 0.0}
+
+
+class TieredCache:
+    """
+    class contains a two-tier cache: an in-process cache in front of a SQLite cache
+    """
+    def __init__(self, first, second):
+        self.first = first
+        self.second = second
+        self.watch = None
+
+    def get(self, key):
+        """
+            Looks the key up in the first tier, then in the second one (promoting the value
+            for the rest of its TTL).
+
+            :param key: str
+            :return: cached value or None
+        """
+        value = self.first.get(key)
+        if value is None:
+            entry = self.second.get_entry(key)
+            if entry is not None:
+                value, expires = entry
+                self.first.set(key, value, ttl=expires - time.time())
+        if value is not None and self.watch is not None:
+            self.watch.hit(key)
+        return value
+
+    def set(self, key, value, ttl=None):
+        """
+            Stores the value in both tiers.
+
+            :param key: str
+            :param value: any JSON-serializable value
+            :param ttl: int (seconds, default: the TTL of each tier)
+            :return: None
+        """
+        self.first.set(key, value, ttl)
+        self.second.set(key, value, ttl)
+
+    def delete(self, key):
+        """
+            Removes the key from both tiers.
+
+            :param key: str
+            :return: None
+        """
+        self.first.delete(key)
+        self.second.delete(key)
+
+    def stats(self):
+        """
+            Returns the hit/miss counters of both tiers.
+
+            :return: dict
+        """
+        return {'memory': self.first.stats(), 'sqlite': self.second.stats()}
+
+
+class RefreshingCache:
+    """
+    class contains an in-process cache of loaded values: fresh for ttl seconds, then served stale
+    for up to stale_ttl more seconds while it is reloaded in the background.
+    Concurrent requests for a key being loaded share the same load (flight).
+    """
+    def __init__(self, maxsize, ttl, stale_ttl, flight, refresh_workers=2):
+        self.ttl = ttl
+        self.entries = MemoryCache(maxsize=maxsize, ttl=ttl + stale_ttl)
+        self.flight = flight
+        self.executor = ThreadPoolExecutor(max_workers=refresh_workers, thread_name_prefix='cache-refresh')
+        self.watch = None
+        self.fresh_hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key, load):
+        """
+            Returns the cached value, calling load() on a miss (a stale value is returned at once
+            and reloaded in the background). None returned by load() is not cached.
+
+            :param key: str
+            :param load: callable returning the value
+            :return: value or None
+        """
+        entry = self.entries.get(key)
+        if entry is not None:
+            if self.watch is not None:
+                self.watch.hit(key)
+            value, fresh_until = entry
+            if fresh_until >= time.time():
+                self._count('fresh_hits')
+                return value
+            self._count('stale_hits')
+            self._refresh(key, load)
+            return value
+        self._count('misses')
+        return self._load(key, load)
+
+    def peek(self, key):
+        """
+            Returns the cached value (fresh or stale) without loading it.
+
+            :param key: str
+            :return: (value, fresh) or (None, False) if the key is missing
+            :rtype: tuple
+        """
+        entry = self.entries.get(key)
+        if entry is None:
+            self._count('misses')
+            return None, False
+        if self.watch is not None:
+            self.watch.hit(key)
+        value, fresh_until = entry
+        fresh = fresh_until >= time.time()
+        self._count('fresh_hits' if fresh else 'stale_hits')
+        return value, fresh
+
+    def set(self, key, value):
+        """
+            Stores a fresh value.
+
+            :param key: str
+            :param value: any value
+            :return: None
+        """
+        self.entries.set(key, (value, time.time() + self.ttl))
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def _load(self, key, load):
+        return self.flight.do(key, lambda: self._store(key, load()))
+
+    def _store(self, key, value):
+        if value is not None:
+            self.set(key, value)
+        return value
+
+    def _refresh(self, key, load):
+        if self.flight.in_flight(key):
+            return
+        self._count('refreshes')
+        # обновление идёт в потоке cache-refresh: запросы к API учитываются с приоритетом вызвавшего
+        self.executor.submit(self._load_with_priority, key, load, quota.current_priority())
+
+    def _load_with_priority(self, key, load, priority):
+        with quota.priority(priority):
+            return self._load(key, load)
+
+    def stats(self):
+        """
+            Returns the hit/miss counters, the number of coalesced requests and background refreshes.
+
+            :return: dict
+        """
+        size = self.entries.stats()['size']
+        with self._lock:
+            total = self.fresh_hits + self.stale_hits + self.misses
+            return {'size': size, 'fresh_hits': self.fresh_hits, 'stale_hits': self.stale_hits,
+                    'misses': self.misses, 'coalesced': self.flight.shared, 'refreshes': self.refreshes,
+                    'hit_ratio': (self.fresh_hits + self.stale_hits) / total if total else 0.0}
+
+
+def create_cache(namespace, maxsize, ttl, sqlite=False):
+    """
+        Creates an in-process cache, optionally backed by the SQLite cache table.
+
+        :param namespace: str (name of the cache in the cache table)
+        :param maxsize: int
+        :param ttl: int (seconds)
+        :param sqlite: bool
+        :return: MemoryCache or TieredCache
+    """
+    memory = MemoryCache(maxsize=maxsize, ttl=ttl)
+    if not sqlite:
+        return memory
+    return TieredCache(memory, SqliteCache(namespace=namespace, maxsize=maxsize, ttl=ttl))
@@ -0,0 +1,139 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from . import session
+from .cache import create_cache
+from config_data.config import IMAGE_CACHE_SIZE, IMAGE_CACHE_TTL, IMAGE_CACHE_SQLITE, IMAGE_MAX_BYTES, \
+    IMAGE_CHECK_TIMEOUT, IMAGE_CHECK_WORKERS, API_CONNECT_TIMEOUT, FILE_ID_CACHE_SIZE, FILE_ID_CACHE_TTL
+from loguru import logger
+
+# проверенные фото отелей: id отеля -> список ссылок, прошедших проверку
+image_cache = create_cache('images', maxsize=IMAGE_CACHE_SIZE, ttl=IMAGE_CACHE_TTL, sqlite=IMAGE_CACHE_SQLITE)
+# фото, уже отправленные ботом: ссылка -> file_id Telegram (повторная отправка без скачивания по ссылке)
+file_id_cache = create_cache('file_ids', maxsize=FILE_ID_CACHE_SIZE, ttl=FILE_ID_CACHE_TTL, sqlite=True)
+# проверки фото идут к CDN через свой пул соединений, не вытесняя соединения с hotels4,
+# и выполняются общим ограниченным пулом потоков
+image_session = session.create_session(pool_size=IMAGE_CHECK_WORKERS)
+image_executor = ThreadPoolExecutor(max_workers=IMAGE_CHECK_WORKERS, thread_name_prefix='image-check')
+
+
+class MediaStats:
+    """
+    class contains the counters of the hotel pictures pipeline
+    """
+    def __init__(self):
+        self.checked = 0
+        self.rejected = 0
+        self.groups = 0
+        self.fallbacks = 0
+        self._lock = threading.Lock()
+
+    def add(self, **counters):
+        """
+            Increments the counters.
+
+            :param counters: int values of checked, rejected, groups, fallbacks
+            :return: None
+        """
+        with self._lock:
+            for name, value in counters.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def stats(self):
+        """
+            Returns the counters and the share of media groups sent photo by photo.
+
+            :return: dict
+        """
+        with self._lock:
+            return {'checked': self.checked, 'rejected': self.rejected, 'groups': self.groups,
+                    'fallbacks': self.fallbacks, 'fallback_rate': self.fallbacks / self.groups if self.groups else 0.0}
+
+
+media_stats = MediaStats()
+
+
+def check_image(url):
+    """
+        Checks with a HEAD request that the picture can be sent by URL:
+        it is available, it is an image and it is not larger than IMAGE_MAX_BYTES
+        (a picture of unknown size, without a valid Content-Length, is accepted).
+
+        :param url: str
+        :return: bool
+    """
+    try:
+        response = image_session.request('HEAD', url, allow_redirects=True,
+                                         timeout=(API_CONNECT_TIMEOUT, IMAGE_CHECK_TIMEOUT))
+    except requests.RequestException:
+        return False
+    if response.status_code != 200 or not response.headers.get('Content-Type', '').startswith('image/'):
+        return False
+    size = response.headers.get('Content-Length')
+    if size is None:
+        return True
+    try:
+        return int(size) <= IMAGE_MAX_BYTES
+    except ValueError:
+        # испорченный заголовок: размер неизвестен, как и без заголовка
+        return True
+
+
+def select_images(id_item, urls, count):
+    """
+        Selects the first count pictures of the gallery that pass check_image.
+        All candidates are checked concurrently (image_executor), the result is cached per hotel.
+
+        :param id_item: str (id of the hotel)
+        :param urls: list of str (gallery of the hotel, in display order)
+        :param count: int (number of pictures requested)
+        :return: list of str
+    """
+    if count <= 0 or not urls:
+        return []
+    # проверяется вся галерея: сохранённого списка годных фото достаточно для любого count
+    good = image_cache.get(id_item)
+    if good is not None:
+        return good[:count]
+    results = list(image_executor.map(check_image, urls))
+    good = [url for url, ok in zip(urls, results) if ok]
+    media_stats.add(checked=len(urls), rejected=len(urls) - len(good))
+    if len(good) < len(urls):
+        logger.info(f'Hotel {id_item}: {len(urls) - len(good)} of {len(urls)} pictures rejected')
+    image_cache.set(id_item, good)
+    return good[:count]
+
+
+def photo_sources(urls):
+    """
+        Returns the Telegram file_id of each picture already sent by the bot, the URL otherwise.
+
+        :param urls: list of str
+        :return: list of str
+    """
+    return [file_id_cache.get(url) or url for url in urls]
+
+
+def remember_file_ids(urls, sources, messages):
+    """
+        Stores the file_id of the pictures that were sent by URL.
+
+        :param urls: list of str
+        :param sources: list of str (sent file_id or URL of each picture)
+        :param messages: list of Message (sent messages, in the same order)
+        :return: None
+    """
+    for url, source, message in zip(urls, sources, messages):
+        if source == url and message.photo:
+            file_id_cache.set(url, message.photo[-1].file_id)
+
+
+def forget_file_ids(urls):
+    """
+        Removes the file_id of the pictures (after a failed send).
+
+        :param urls: list of str
+        :return: None
+    """
+    for url in urls:
+        file_id_cache.delete(url)
@@ -0,0 +1,136 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from .quota import quota, PRIORITY_PREFETCH
+from loguru import logger
+
+
+class PrefetchJob:
+    """
+    class contains the prefetch of one chat's search and the ids of the hotels it has loaded
+    """
+    __slots__ = ('cancelled', 'hotel_ids', 'done')
+
+    def __init__(self):
+        self.cancelled = threading.Event()
+        self.hotel_ids = []
+        self.done = False
+
+
+class Prefetcher:
+    """
+    class contains the speculative loading of search results.
+    Once the region and the dates of a search are known, the list of hotels and the details (load_detail)
+    of the first hotels are requested in the background (at most max_workers searches at a time, within
+    the prefetch share of the hotels4 budget), so the caches are warm when the user has answered
+    the pictures question. A chat has at most one prefetch: a new one or /start and /help cancel it.
+    """
+    def __init__(self, load_detail, max_workers, details, max_chats):
+        self.load_detail = load_detail
+        self.details = details
+        self.max_chats = max_chats
+        self.jobs = OrderedDict()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='prefetch')
+        self.started = 0
+        self.cancelled = 0
+        self.completed = 0
+        self.failed = 0
+        self.used = 0
+        self.unused = 0
+        self.details_loaded = 0
+        self.details_used = 0
+        self._lock = threading.Lock()
+
+    def start(self, chat_id, load_hotels, count):
+        """
+            Starts the prefetch of the chat's search (replaces the previous prefetch of the chat).
+
+            :param chat_id: int
+            :param load_hotels: callable returning the hotels of the search in display order (or None)
+            :param count: int (number of hotels the user asked for)
+            :return: None
+        """
+        job = PrefetchJob()
+        with self._lock:
+            self._drop(chat_id)
+            self.jobs[chat_id] = job
+            while len(self.jobs) > self.max_chats:
+                self._drop(next(iter(self.jobs)))
+            self.started += 1
+        self.executor.submit(self._run, job, load_hotels, min(self.details, count))
+
+    def cancel(self, chat_id):
+        """
+            Cancels the prefetch of the chat (the request in progress is completed, the following are not sent).
+
+            :param chat_id: int
+            :return: None
+        """
+        with self._lock:
+            self._drop(chat_id)
+
+    def claim(self, chat_id, hotel_ids):
+        """
+            Records which of the prefetched hotels the search of the chat has displayed.
+
+            :param chat_id: int
+            :param hotel_ids: list of str (hotels displayed to the user)
+            :return: None
+        """
+        with self._lock:
+            job = self.jobs.pop(chat_id, None)
+            if job is None:
+                return
+            job.cancelled.set()
+            self.used += 1
+            self.details_used += len(set(job.hotel_ids) & set(hotel_ids))
+
+    def _drop(self, chat_id):
+        job = self.jobs.pop(chat_id, None)
+        if job is not None:
+            job.cancelled.set()
+            self.unused += 1
+            if not job.done:
+                self.cancelled += 1
+
+    def _run(self, job, load_hotels, count):
+        if job.cancelled.is_set():
+            return
+        try:
+            with quota.priority(PRIORITY_PREFETCH):
+                if not self._load(job, load_hotels, count):
+                    return
+        except Exception as e:
+            logger.error(f'Prefetch failed: {e}')
+            with self._lock:
+                job.done = True
+                self.failed += 1
+            return
+        with self._lock:
+            job.done = True
+            self.completed += 1
+
+    def _load(self, job, load_hotels, count):
+        for hotel in islice(load_hotels() or (), count):
+            if job.cancelled.is_set():
+                return False
+            if self.load_detail(hotel.id) is not None:
+                with self._lock:
+                    job.hotel_ids.append(hotel.id)
+                    self.details_loaded += 1
+        return True
+
+    def stats(self):
+        """
+            Returns the number of prefetches started, cancelled, completed, failed, used and unused,
+            and the share of the prefetched hotel details that were displayed.
+
+            :return: dict
+        """
+        with self._lock:
+            return {'started': self.started, 'cancelled': self.cancelled, 'completed': self.completed,
+                    'failed': self.failed, 'used': self.used, 'unused': self.unused,
+                    'details_loaded': self.details_loaded, 'details_used': self.details_used,
+                    'detail_use_rate': self.details_used / self.details_loaded if self.details_loaded else 0.0}
+
@@ -0,0 +1,262 @@
+import threading
+import time
+from contextlib import contextmanager
+import requests
+from peewee import EXCLUDED
+from loader import BOT_PROCESSES
+from database.classes import QuotaEntry
+from config_data.config import QUOTA_LIMITS, QUOTA_SHARES, QUOTA_FEWER_PICTURES, QUOTA_LIST_ONLY, \
+    QUOTA_FLUSH_INTERVAL
+from loguru import logger
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_PREFETCH = 1
+PRIORITY_WARMUP = 2
+
+LEVEL_NORMAL = 'normal'
+LEVEL_FEWER_PICTURES = 'fewer_pictures'
+LEVEL_LIST_ONLY = 'list_only'
+
+
+class QuotaExceeded(requests.RequestException):
+    """
+    exception raised instead of sending a hotels4 request the budget of the endpoint does not allow
+    """
+
+
+class EndpointUsage:
+    """
+    class contains the calls of one hotels4 endpoint in the current minute and day and their budgets
+    """
+    __slots__ = ('minute_limit', 'day_limit', 'minute', 'day', 'minute_calls', 'day_calls', 'total', 'rejected')
+
+    def __init__(self, minute_limit, day_limit):
+        self.minute_limit = minute_limit
+        self.day_limit = day_limit
+        self.minute = 0
+        self.day = 0
+        self.minute_calls = 0
+        self.day_calls = 0
+        self.total = 0
+        self.rejected = 0
+
+    def roll(self, now):
+        """
+            Starts new counters when the minute or the day (UTC) of the previous call has passed.
+
+            :param now: float (time.time())
+            :return: None
+        """
+        minute = int(now // 60)
+        if minute != self.minute:
+            self.minute = minute
+            self.minute_calls = 0
+        day = int(now // (24 * 60 * 60))
+        if day != self.day:
+            self.day = day
+            self.day_calls = 0
+
+    def usage(self):
+        """
+            Returns the used share of the budget (the larger of the minute and the day shares).
+
+            :return: float
+        """
+        return max(self.minute_calls / self.minute_limit, self.day_calls / self.day_limit)
+
+
+class QuotaManager:
+    """
+    class contains the accounting of the hotels4 (RapidAPI) calls.
+    Every call takes a unit of the per minute and per day budgets of its endpoint. Interactive requests
+    may use the whole budget, prefetch and warm-up requests (set with priority()) only their share of it.
+    As the detail budget runs low, fewer pictures are displayed, then the cards are built from the list data.
+    With several bot processes each one accounts for its calls and gets an equal part of the budgets.
+    The day counters are kept in the quota table of history.db (written every flush_interval seconds
+    by a background thread), so a restart does not reset the daily budget.
+    """
+    def __init__(self, limits, shares, fewer_pictures, list_only, processes=1, flush_interval=10):
+        self.endpoints = {endpoint: EndpointUsage(max(1, minute_limit // processes), max(1, day_limit // processes))
+                          for endpoint, (minute_limit, day_limit) in limits.items()}
+        self.shares = shares
+        self.fewer_pictures = fewer_pictures
+        self.list_only = list_only
+        self.degraded = {LEVEL_FEWER_PICTURES: 0, LEVEL_LIST_ONLY: 0}
+        self.processes = processes
+        self.flush_interval = flush_interval
+        self.pending = {}
+        self.thread = None
+        self.stopped = threading.Event()
+        self.local = threading.local()
+        self._lock = threading.Lock()
+
+    def load(self):
+        """
+            Restores the day counters from history.db (each process takes its part of the calls
+            made today by all processes) and removes the counters of the previous days.
+
+            :return: None
+        """
+        now = time.time()
+        day = int(now // (24 * 60 * 60))
+        QuotaEntry.delete().where(QuotaEntry.day < day).execute()
+        calls = dict(QuotaEntry.select(QuotaEntry.endpoint, QuotaEntry.calls).where(QuotaEntry.day == day).tuples())
+        with self._lock:
+            for endpoint, usage in self.endpoints.items():
+                usage.roll(now)
+                usage.day_calls = max(usage.day_calls, calls.get(endpoint, 0) // self.processes)
+
+    def start(self):
+        """
+            Starts the background thread writing the day counters to history.db.
+
+            :return: None
+        """
+        if self.thread is None:
+            self.stopped.clear()
+            self.thread = threading.Thread(target=self._work, name='quota-flush', daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        """
+            Writes the remaining calls and stops the background thread.
+
+            :return: None
+        """
+        if self.thread is None:
+            return
+        self.stopped.set()
+        self.thread.join()
+        self.thread = None
+        self.flush()
+
+    def flush(self):
+        """
+            Adds the calls made since the previous flush to the day counters in history.db.
+
+            :return: None
+        """
+        with self._lock:
+            pending, self.pending = self.pending, {}
+        if not pending:
+            return
+        rows = [{'endpoint': endpoint, 'day': day, 'calls': calls} for (endpoint, day), calls in pending.items()]
+        try:
+            (QuotaEntry.insert_many(rows)
+             .on_conflict(conflict_target=[QuotaEntry.endpoint, QuotaEntry.day],
+                          update={QuotaEntry.calls: QuotaEntry.calls + EXCLUDED.calls})
+             .execute())
+        except Exception as e:
+            logger.exception(f'Quota write failed: {e}')
+            with self._lock:
+                for key, calls in pending.items():
+                    self.pending[key] = self.pending.get(key, 0) + calls
+
+    def _work(self):
+        while not self.stopped.wait(self.flush_interval):
+            self.flush()
+
+    def current_priority(self):
+        """
+            Returns the priority of the hotels4 requests sent by the current thread.
+
+            :return: int
+        """
+        return getattr(self.local, 'priority', PRIORITY_INTERACTIVE)
+
+    @contextmanager
+    def priority(self, priority):
+        """
+            Sets the priority of the hotels4 requests sent by the current thread inside the with block.
+
+            :param priority: int (PRIORITY_INTERACTIVE, PRIORITY_PREFETCH or PRIORITY_WARMUP)
+        """
+        previous = self.current_priority()
+        self.local.priority = priority
+        try:
+            yield
+        finally:
+            self.local.priority = previous
+
+    def acquire(self, endpoint):
+        """
+            Takes a call from the budget of the endpoint.
+
+            :param endpoint: str (locations, list or detail)
+            :return: None
+            :raises QuotaExceeded: if the share of the budget of the current priority is used up
+        """
+        priority = self.current_priority()
+        share = self.shares[priority]
+        with self._lock:
+            usage = self.endpoints[endpoint]
+            usage.roll(time.time())
+            if usage.minute_calls + 1 > usage.minute_limit * share or usage.day_calls + 1 > usage.day_limit * share:
+                usage.rejected += 1
+                raise QuotaExceeded(f'hotels4 {endpoint} budget exceeded (priority {priority})')
+            usage.minute_calls += 1
+            usage.day_calls += 1
+            usage.total += 1
+            self.pending[(endpoint, usage.day)] = self.pending.get((endpoint, usage.day), 0) + 1
+
+    def level(self, endpoint='detail'):
+        """
+            Returns the degradation level of the endpoint: LEVEL_NORMAL, LEVEL_FEWER_PICTURES or LEVEL_LIST_ONLY.
+
+            :param endpoint: str (default: detail)
+            :return: str
+        """
+        with self._lock:
+            usage = self.endpoints[endpoint]
+            usage.roll(time.time())
+            used = usage.usage()
+        if used >= self.list_only:
+            return LEVEL_LIST_ONLY
+        if used >= self.fewer_pictures:
+            return LEVEL_FEWER_PICTURES
+        return LEVEL_NORMAL
+
+    def pictures(self, count):
+        """
+            Returns the number of pictures to display for each hotel: one while the detail budget is low.
+
+            :param count: int (number of pictures requested by the user)
+            :return: int
+        """
+        if count > 1 and self.level() != LEVEL_NORMAL:
+            self.count_degraded(LEVEL_FEWER_PICTURES)
+            return 1
+        return count
+
+    def count_degraded(self, level):
+        """
+            Counts a hotel displayed with the degradation level.
+
+            :param level: str (LEVEL_FEWER_PICTURES or LEVEL_LIST_ONLY)
+            :return: None
+        """
+        with self._lock:
+            self.degraded[level] += 1
+
+    def stats(self):
+        """
+            Returns the calls of each endpoint in the current minute and day, their budgets,
+            the total and rejected calls, and the number of hotels displayed degraded.
+
+            :return: dict
+        """
+        now = time.time()
+        with self._lock:
+            endpoints = {}
+            for endpoint, usage in self.endpoints.items():
+                usage.roll(now)
+                endpoints[endpoint] = {'minute': usage.minute_calls, 'minute_limit': usage.minute_limit,
+                                       'day': usage.day_calls, 'day_limit': usage.day_limit,
+                                       'total': usage.total, 'rejected': usage.rejected,
+                                       'usage': round(usage.usage(), 3)}
+            return {'endpoints': endpoints, 'degraded': dict(self.degraded)}
+
+
+# каждый рабочий процесс ведёт свой учёт и получает равную часть бюджета
+quota = QuotaManager(limits=QUOTA_LIMITS, shares=QUOTA_SHARES, fewer_pictures=QUOTA_FEWER_PICTURES,
+                     list_only=QUOTA_LIST_ONLY, processes=BOT_PROCESSES, flush_interval=QUOTA_FLUSH_INTERVAL)
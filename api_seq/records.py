@@ -0,0 +1,136 @@
+from array import array
+from decimal import Decimal, InvalidOperation
+from loguru import logger
+
+
+class HotelRecord:
+    """
+    class contains the fields of one properties/v2/list entry used by the bot
+    """
+    __slots__ = ('id', 'price_cents', 'distance', 'currency', 'review_score', 'name')
+
+    def __init__(self, id, price_cents, distance, currency, review_score=0.0, name=''):
+        self.id = id
+        self.price_cents = price_cents
+        self.distance = distance
+        self.currency = currency
+        self.review_score = review_score
+        self.name = name
+
+    def __repr__(self):
+        return f'HotelRecord(id={self.id!r}, price_cents={self.price_cents}, distance={self.distance}, ' \
+               f'currency={self.currency!r}, review_score={self.review_score}, name={self.name!r})'
+
+
+class HotelBatch:
+    """
+    class contains a page of properties/v2/list entries stored by columns
+    """
+    __slots__ = ('ids', 'price_cents', 'distances', 'currencies', 'review_scores', 'names')
+
+    def __init__(self):
+        self.ids = []
+        self.price_cents = array('q')
+        self.distances = array('d')
+        self.currencies = []
+        self.review_scores = array('d')
+        self.names = []
+
+    @classmethod
+    def from_properties(cls, properties):
+        """
+            Parses the entries of a properties/v2/list response once.
+            The entries with a malformed price are skipped.
+
+            :param properties: list (data.propertySearch.properties of the response)
+            :return: HotelBatch
+        """
+        batch = cls()
+        for hotel in properties:
+            try:
+                currency, cents = parse_price(hotel['price']['options'][0]['formattedDisplayPrice'])
+            except ValueError as e:
+                logger.warning(f'Property {hotel.get("id")} skipped: {e}')
+                continue
+            batch.ids.append(hotel['id'])
+            batch.price_cents.append(cents)
+            batch.distances.append(float(hotel['destinationInfo']['distanceFromDestination']['value']))
+            batch.currencies.append(currency)
+            batch.review_scores.append(float((hotel.get('reviews') or {}).get('score') or 0.0))
+            batch.names.append(hotel.get('name', ''))
+        return batch
+
+    def append(self, hotel):
+        """
+            Adds a parsed hotel to the batch.
+
+            :param hotel: HotelRecord
+            :return: None
+        """
+        self.ids.append(hotel.id)
+        self.price_cents.append(hotel.price_cents)
+        self.distances.append(hotel.distance)
+        self.currencies.append(hotel.currency)
+        self.review_scores.append(hotel.review_score)
+        self.names.append(hotel.name)
+
+    def head(self, count):
+        """
+            Returns a batch of the first count hotels.
+
+            :param count: int
+            :return: HotelBatch
+        """
+        if count >= len(self.ids):
+            return self
+        batch = HotelBatch()
+        batch.ids = self.ids[:count]
+        batch.price_cents = self.price_cents[:count]
+        batch.distances = self.distances[:count]
+        batch.currencies = self.currencies[:count]
+        batch.review_scores = self.review_scores[:count]
+        batch.names = self.names[:count]
+        return batch
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, index):
+        return HotelRecord(self.ids[index], self.price_cents[index], self.distances[index], self.currencies[index],
+                           self.review_scores[index], self.names[index])
+
+    def __iter__(self):
+        for index in range(len(self.ids)):
+            yield self[index]
+
+
+def parse_price(formatted_price):
+    """
+        Converts a formatted price ('$1,234' or '$99.50') into the currency symbol and the amount in cents.
+
+        :param formatted_price: str
+        :return: (currency, cents)
+        :rtype: tuple
+        :raises ValueError: if the price has no amount ('N/A', '')
+    """
+    digits_start = 0
+    while digits_start < len(formatted_price) and not formatted_price[digits_start].isdigit():
+        digits_start += 1
+    try:
+        amount = Decimal(formatted_price[digits_start:].replace(',', ''))
+    except InvalidOperation:
+        raise ValueError(f'malformed price {formatted_price!r}') from None
+    return formatted_price[:digits_start].strip(), int(amount * 100)
+
+
+def format_price(cents, currency):
+    """
+        Formats an amount in cents for display ('$1,234' or '$99.50').
+
+        :param cents: int
+        :param currency: str
+        :return: str
+    """
+    if cents % 100:
+        return f'{currency}{cents / 100:,.2f}'
+    return f'{currency}{cents // 100:,}'
@@ -0,0 +1,64 @@
+from copy import deepcopy
+from datetime import date
+from typing import NamedTuple
+
+
+class SearchRequest(NamedTuple):
+    """
+    class contains the immutable parameters of one user's search (properties/v2/list)
+    """
+    region_id: str
+    check_in: date
+    check_out: date
+    adults: int
+    results_size: int
+    sort: str
+    price_min: int
+    price_max: int
+    starting_index: int = 0
+
+    @classmethod
+    def from_data(cls, data):
+        """
+            Builds the search request from the state data of a chat.
+
+            :param data: dict (bot.retrieve_data state data)
+            :return: SearchRequest
+        """
+        return cls(
+            region_id=data['regionId'],
+            check_in=data['date_check_in'],
+            check_out=data['date_check_out'],
+            adults=int(data['people_count']),
+            results_size=int(data['hotels_count']),
+            sort=data['sort'],
+            price_min=int(data['price_min']),
+            price_max=int(data['price_max']),
+        )
+
+    def cache_key(self):
+        """
+            Returns the canonical form of the request used as the search cache key.
+
+            :return: str
+        """
+        return '|'.join(value.isoformat() if isinstance(value, date) else str(value) for value in self)
+
+    def list_payload(self, payload_list):
+        """
+            Fills a copy of the properties/v2/list payload template with the search parameters.
+
+            :param payload_list: dict (template of the properties/v2/list payload)
+            :return: dict
+        """
+        payload = deepcopy(payload_list)
+        payload['destination']['regionId'] = self.region_id
+        payload['checkInDate'] = {'day': self.check_in.day, 'month': self.check_in.month, 'year': self.check_in.year}
+        payload['checkOutDate'] = {'day': self.check_out.day, 'month': self.check_out.month,
+                                   'year': self.check_out.year}
+        payload['rooms'][0]['adults'] = self.adults
+        payload['resultsStartingIndex'] = self.starting_index
+        payload['resultsSize'] = self.results_size
+        payload['sort'] = self.sort
+        payload['filters']['price'] = {'max': self.price_max, 'min': self.price_min}
+        return payload
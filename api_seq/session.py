@@ -0,0 +1,49 @@
+import requests
+from requests.adapters import HTTPAdapter
+from loader import WEBHOOK_URL
+from config_data.config import BOT_NUM_THREADS, WEBHOOK_WORKERS, DETAIL_MAX_WORKERS, PREFETCH_WORKERS, \
+    API_CONNECT_TIMEOUT, API_READ_TIMEOUT
+
+
+def create_session(pool_size):
+    """
+        Creates an HTTP session with a keep-alive connection pool for the hotels4 API.
+
+        :param pool_size: int (maximum number of connections kept open per host)
+        :return: requests.Session
+    """
+    new_session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    new_session.mount('https://', adapter)
+    new_session.mount('http://', adapter)
+    new_session.headers['Accept-Encoding'] = 'gzip, deflate'
+    return new_session
+
+
+def api_pool_size(update_threads):
+    """
+        Returns the number of hotels4 connections the bot may use at a time: DETAIL_MAX_WORKERS for each
+        thread handling updates, plus the prefetch, search cache refresh and warm-up threads.
+
+        :param update_threads: int (threads handling updates in the process)
+        :return: int
+    """
+    # 2 потока обновления кэша поиска и 1 поток прогрева
+    return update_threads * DETAIL_MAX_WORKERS + PREFETCH_WORKERS + 2 + 1
+
+
+# обновления обрабатываются потоками вебхука (WEBHOOK_WORKERS) или потоками бота при long polling
+session = create_session(pool_size=api_pool_size(WEBHOOK_WORKERS if WEBHOOK_URL else BOT_NUM_THREADS))
+
+
+def request(method, url, **kwargs):
+    """
+        Sends a request through the shared session, reusing open connections.
+
+        :param method: str
+        :param url: str
+        :param kwargs: arguments of requests.Session.request
+        :return: requests.Response
+    """
+    kwargs.setdefault('timeout', (API_CONNECT_TIMEOUT, API_READ_TIMEOUT))
+    return session.request(method, url, **kwargs)
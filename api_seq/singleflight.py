@@ -0,0 +1,71 @@
+import threading
+from concurrent.futures import Future, TimeoutError
+import requests
+
+
+class SingleFlight:
+    """
+    class contains the upstream calls in flight for one endpoint.
+    Concurrent calls with the same key share one upstream call: its result, or its exception,
+    is returned to every caller. Callers waiting for a shared call give up after timeout seconds.
+    """
+    def __init__(self, name, timeout):
+        self.name = name
+        self.timeout = timeout
+        self.calls = 0
+        self.shared = 0
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, call):
+        """
+            Runs call() unless a call with the same key is already in flight, in which case waits for its result.
+
+            :param key: hashable
+            :param call: callable
+            :return: result of call()
+            :raises requests.Timeout: if the shared call did not finish in time
+        """
+        with self._lock:
+            future = self._in_flight.get(key)
+            owner = future is None
+            if owner:
+                future = self._in_flight[key] = Future()
+                self.calls += 1
+            else:
+                self.shared += 1
+        if not owner:
+            try:
+                return future.result(timeout=self.timeout)
+            except TimeoutError:
+                raise requests.Timeout(f'{self.name}: shared request did not finish in {self.timeout} s')
+        try:
+            result = call()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+
+    def in_flight(self, key):
+        """
+            Checks whether a call with the key is in flight.
+
+            :param key: hashable
+            :return: bool
+        """
+        with self._lock:
+            return key in self._in_flight
+
+    def stats(self):
+        """
+            Returns the number of upstream calls and of the calls that shared them.
+
+            :return: dict
+        """
+        with self._lock:
+            return {'calls': self.calls, 'shared': self.shared}
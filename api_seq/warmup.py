@@ -0,0 +1,199 @@
+import threading
+import time
+from datetime import date, timedelta
+import requests
+from peewee import fn
+from .cache import KeyWatch
+from .api import location_cache, detail_cache, search_cache, search_locations, make_api_request, fetch_detail
+from .quota import quota, QuotaExceeded, PRIORITY_WARMUP
+from .search_request import SearchRequest
+from database.classes import Search
+from config_data.config import BESTDEAL_PAGE_SIZE, LIST_RESULTS_SIZE, WARMUP_API_BUDGET, WARMUP_HISTORY_DAYS, \
+    WARMUP_DESTINATIONS, WARMUP_DETAILS
+from loguru import logger
+
+
+def popular_queries(since, limit):
+    """
+        Returns the locations most often entered by the users since the given time.
+
+        :param since: int (Unix time)
+        :param limit: int
+        :return: list of str
+    """
+    rows = (Search.select(Search.query)
+            .where(Search.created >= since, Search.query.is_null(False))
+            .group_by(Search.query)
+            .order_by(fn.COUNT(Search.id).desc())
+            .limit(limit * 2)
+            .tuples())
+    queries = {}
+    for query, in rows:
+        queries.setdefault(query.casefold(), query)
+    return list(queries.values())[:limit]
+
+
+def popular_searches(since, limit):
+    """
+        Returns the latest search of each of the most frequent (command, region) pairs since the given time.
+
+        :param since: int (Unix time)
+        :param limit: int
+        :return: list of Search, most frequent first
+    """
+    latest = (Search.select(fn.MAX(Search.id))
+              .where(Search.created >= since, Search.region_id.is_null(False), Search.check_in.is_null(False))
+              .group_by(Search.command, Search.region_id)
+              .order_by(fn.COUNT(Search.id).desc())
+              .limit(limit)
+              .tuples())
+    ids = [search_id for search_id, in latest]
+    searches = {search.id: search for search in Search.select().where(Search.id.in_(ids))}
+    return [searches[search_id] for search_id in ids]
+
+
+def upcoming_request(search, today=None):
+    """
+        Builds the request of a past search moved to upcoming dates: the same number of days
+        between the search and the check-in, the same length of stay.
+        /lowprice and /highprice request the list shared by any number of hotels, /bestdeal the first page.
+
+        :param search: Search
+        :param today: date (default: today)
+        :return: SearchRequest
+    """
+    if today is None:
+        today = date.today()
+    lead = max(0, (search.check_in - date.fromtimestamp(search.created)).days)
+    nights = max(1, (search.check_out - search.check_in).days)
+    check_in = today + timedelta(days=lead)
+    return SearchRequest(
+        region_id=search.region_id,
+        check_in=check_in,
+        check_out=check_in + timedelta(days=nights),
+        adults=search.adults,
+        results_size=BESTDEAL_PAGE_SIZE if search.command == '/bestdeal' else LIST_RESULTS_SIZE,
+        sort='PRICE_HIGH_TO_LOW' if search.command == '/highprice' else 'PRICE_LOW_TO_HIGH',
+        price_min=search.price_min,
+        price_max=search.price_max,
+    )
+
+
+class Warmup:
+    """
+    class contains the warm-up of the caches from the search history.
+    The most searched locations, the lists of the most searched destinations (moved to upcoming dates)
+    and the details of their first hotels are requested, spending at most budget API calls per run.
+    The keys stored by the last run are watched, so the hits on them show whether the warm-up pays off.
+    """
+    def __init__(self, budget, history_days, destinations, details):
+        self.budget = budget
+        self.history_days = history_days
+        self.destinations = destinations
+        self.details = details
+        self.watches = {}
+        for endpoint, cache in (('locations', location_cache), ('list', search_cache), ('detail', detail_cache)):
+            cache.watch = self.watches[endpoint] = KeyWatch()
+
+    def run(self):
+        """
+            Warms the location, search and detail caches up (within the warm-up share of the hotels4 budget).
+
+            :return: dict (report of the run)
+        """
+        with quota.priority(PRIORITY_WARMUP):
+            return self._run()
+
+    def _run(self):
+        started = time.perf_counter()
+        since = int(time.time()) - self.history_days * 24 * 60 * 60
+        calls = {'locations': 0, 'list': 0, 'detail': 0}
+        stored = {'locations': set(), 'list': set(), 'detail': set()}
+        skipped = 0
+        destinations = set()
+
+        def spend(endpoint):
+            if sum(calls.values()) >= self.budget:
+                return False
+            calls[endpoint] += 1
+            return True
+
+        for query in popular_queries(since, self.destinations):
+            if location_cache.get(query.casefold()) is not None:
+                skipped += 1
+            elif spend('locations'):
+                try:
+                    if search_locations(query):
+                        stored['locations'].add(query.casefold())
+                except requests.RequestException as e:
+                    logger.error(f'Warm-up location request failed: {e}')
+        lists = []
+        for search in popular_searches(since, self.destinations):
+            request = upcoming_request(search)
+            hotels, fresh = search_cache.peek(request.cache_key())
+            if not fresh:
+                if not spend('list'):
+                    break
+                try:
+                    hotels = make_api_request(request)
+                except QuotaExceeded as e:
+                    logger.warning(f'Warm-up stopped: {e}')
+                    break
+                if hotels:
+                    stored['list'].add(request.cache_key())
+            else:
+                skipped += 1
+            destinations.add((search.command, search.region_id))
+            if hotels:
+                lists.append(hotels)
+        for hotels in lists:
+            for hotel in list(hotels)[:self.details]:
+                if detail_cache.get(hotel.id) is not None:
+                    skipped += 1
+                elif spend('detail') and fetch_detail(hotel.id) is not None:
+                    stored['detail'].add(hotel.id)
+        # ключи отслеживаются после прогрева, чтобы собственные обращения прогрева не считались попаданиями
+        for endpoint, keys in stored.items():
+            self.watches[endpoint].watch(keys)
+        report = {'seconds': round(time.perf_counter() - started, 2), 'calls': calls,
+                  'budget': self.budget, 'cached': skipped, 'destinations': len(destinations)}
+        logger.info(f'Cache warm-up: {report}')
+        return report
+
+    def hit_rate(self):
+        """
+            Returns, for each cache, the number of keys stored by the last run, how many of them
+            have been hit since and the number of hits.
+
+            :return: dict
+        """
+        return {endpoint: watch.stats() for endpoint, watch in self.watches.items()}
+
+
+def start_warmup(warmup, interval):
+    """
+        Starts a background thread running the warm-up at once and then every interval seconds
+        (only once if interval is 0). Before each following run the hit rate of the previous one is logged.
+
+        :param warmup: Warmup
+        :param interval: int (seconds)
+        :return: threading.Event (set it to stop the thread)
+    """
+    stopped = threading.Event()
+
+    def work():
+        while True:
+            try:
+                warmup.run()
+            except Exception as e:
+                logger.exception(f'Cache warm-up failed: {e}')
+            if not interval or stopped.wait(interval):
+                return
+            logger.info(f'Warm-up hit rate: {warmup.hit_rate()}')
+
+    threading.Thread(target=work, name='cache-warmup', daemon=True).start()
+    return stopped
+
+
+warmup = Warmup(budget=WARMUP_API_BUDGET, history_days=WARMUP_HISTORY_DAYS, destinations=WARMUP_DESTINATIONS,
+                details=WARMUP_DETAILS)
@@ -0,0 +1,6 @@
+import os
+
+# loader.py читает настройки из окружения при импорте: бенчмарки работают с локальной заглушкой
+# вместо Telegram и hotels4 и не требуют ключей
+os.environ.setdefault('BOT_TOKEN', '1:benchmark')
+os.environ.setdefault('API_KEY', 'benchmark')
@@ -0,0 +1,126 @@
+"""
+Load test of the search runtimes: concurrent /lowprice searches started at once by the pictures answer,
+with the searches run in the bot worker threads (BOT_RUNTIME=sync) and on the asyncio runtime (BOT_RUNTIME=async).
+Searches per second, time to the recorded search (p50, p99) and the most concurrent searches served
+within the target time, against a local stub of the Bot API and hotels4.
+
+    python -m benchmarks.async_load [--sessions 10,50,100,200] [--delay 0.2] [--target 5]
+"""
+import argparse
+import statistics
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+from loguru import logger
+from telebot import types
+from benchmarks.fixtures import list_properties
+from benchmarks.stub_server import StubServer
+from loader import bot
+from api_seq.api import detail_cache
+from api_seq.async_api import shutdown_runtime
+from api_seq.quota import quota
+from database.classes import db, BaseModel
+from database.writer import history_writer
+from states.states_classes import LowState
+from config_data.config import BOT_NUM_THREADS, LIST_RESULTS_SIZE
+import handlers
+
+
+class Completions:
+    """
+    class contains the times the searches of the chats were recorded (history_writer.add_search)
+    """
+    def __init__(self, add_search):
+        self.add_search = add_search
+        self.times = {}
+        self._condition = threading.Condition()
+
+    def __call__(self, columns, hotels):
+        self.add_search(columns, hotels)
+        with self._condition:
+            self.times[columns['user_id']] = time.perf_counter()
+            self._condition.notify_all()
+
+    def wait(self, chats, timeout):
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while not chats <= self.times.keys() and time.monotonic() < deadline:
+                self._condition.wait(deadline - time.monotonic())
+        return {chat_id: self.times[chat_id] for chat_id in chats if chat_id in self.times}
+
+
+def prepare_session(chat_id):
+    # диалог пройден до вопроса о фотографиях: каждый чат ищет в своём регионе, кэш поиска не отвечает за API
+    check_in = date.today() + timedelta(days=30)
+    bot.set_state(user_id=chat_id, state=LowState.pictures_count, chat_id=chat_id)
+    bot.add_data(user_id=chat_id, chat_id=chat_id, command='/lowprice', sort='PRICE_LOW_TO_HIGH', price_min=10,
+                 price_max=30000, query='Paris', regionId=str(chat_id), people_count='2',
+                 hotels_count=str(LIST_RESULTS_SIZE), date_check_in=check_in,
+                 date_check_out=check_in + timedelta(days=2), total_days=2)
+
+
+def pictures_answer(chat_id):
+    user = {'id': chat_id, 'is_bot': False, 'first_name': 'User'}
+    return types.Update.de_json({'update_id': chat_id, 'callback_query': {
+        'id': str(chat_id), 'from': user, 'chat_instance': str(chat_id), 'data': 'get1_no',
+        'message': {'message_id': chat_id, 'date': 0, 'chat': {'id': chat_id, 'type': 'private'}}}})
+
+
+def run(completions, sessions, first_chat, timeout):
+    chats = set(range(first_chat, first_chat + sessions))
+    for chat_id in chats:
+        prepare_session(chat_id)
+    updates = [pictures_answer(chat_id) for chat_id in sorted(chats)]
+    started = time.perf_counter()
+    bot.process_new_updates(updates)
+    finished = completions.wait(chats, timeout)
+    latencies = sorted(finished_at - started for finished_at in finished.values())
+    if not latencies:
+        return 0.0, timeout, timeout, 0
+    elapsed = max(latencies)
+    return (len(latencies) / elapsed, statistics.median(latencies), latencies[int(len(latencies) * 0.99)],
+            len(latencies))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sessions', default='10,50,100,200', help='concurrent searches of each run')
+    parser.add_argument('--delay', type=float, default=0.2, help='seconds per hotels4 request')
+    parser.add_argument('--telegram-delay', type=float, default=0.02, help='seconds per Bot API request')
+    parser.add_argument('--target', type=float, default=5.0, help='seconds within which a search must be recorded')
+    args = parser.parse_args()
+    logger.remove()
+    # бенчмарк измеряет среду выполнения поиска, а не бюджет hotels4 и кэш деталей
+    quota.acquire = lambda endpoint: None
+    detail_cache.get = lambda key: None
+    stub = StubServer(api_delay=args.delay, telegram_delay=args.telegram_delay,
+                      properties=list_properties(LIST_RESULTS_SIZE))
+    stub.start()
+    completions = history_writer.add_search = Completions(history_writer.add_search)
+    sessions = [int(count) for count in args.sessions.split(',')]
+    with tempfile.TemporaryDirectory() as directory:
+        db.init(f'{directory}/history.db')
+        db.create_tables(BaseModel.__subclasses__())
+        print(f'/lowprice searches of {LIST_RESULTS_SIZE} hotels, hotels4 {args.delay:.2f} s per request, '
+              f'{BOT_NUM_THREADS} bot worker threads')
+        print(f'{"runtime":>8} {"sessions":>9} {"searches/s":>11} {"p50, s":>7} {"p99, s":>7} {"done":>5}')
+        first_chat = 1
+        for runtime in ('sync', 'async'):
+            handlers.lowprice.BOT_RUNTIME = runtime
+            sustained = 0
+            for count in sessions:
+                # поиск, не записанный за target * 20 секунд, считается неудачным (столбец done)
+                rate, p50, p99, done = run(completions, count, first_chat, timeout=args.target * 20)
+                first_chat += count
+                print(f'{runtime:>8} {count:>9} {rate:>11.1f} {p50:>7.2f} {p99:>7.2f} {done:>5}')
+                if done == count and p99 <= args.target:
+                    sustained = max(sustained, count)
+            print(f'{runtime:>8} sustains {sustained} concurrent searches within {args.target:.0f} s')
+        shutdown_runtime()
+        db.close()
+    stub.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""
+/bestdeal selection: the first hotels within the ranges in list order (as before) against the ranking
+by price, distance and review score. Time per search and the price, distance, review score and Pareto share
+of the displayed hotels, on a list of hotels4-shaped entries sorted by price like the /bestdeal request.
+
+    python -m benchmarks.bestdeal_ranking [--hotels 5] [--repeat 200]
+"""
+import argparse
+import statistics
+import time
+import numpy as np
+from loguru import logger
+from benchmarks.fixtures import list_properties
+from api_seq.records import HotelBatch
+from universal_functions.ranking import best_hotels, is_hotel_in_range, pareto_front
+from config_data.config import BESTDEAL_PAGE_SIZE, BESTDEAL_MAX_RESULTS
+
+RANGES = {
+    'wide': (1, 1000, 0.0, 30.0),
+    'medium': (100, 500, 0.0, 10.0),
+    'narrow': (40, 150, 0.0, 4.0),
+}
+
+
+def list_pages(hotels):
+    # /bestdeal запрашивает отели по возрастанию цены страницами по BESTDEAL_PAGE_SIZE
+    ordered = sorted(hotels, key=lambda hotel: hotel.price_cents)
+    pages = []
+    for start in range(0, len(ordered), BESTDEAL_PAGE_SIZE):
+        page = HotelBatch()
+        for hotel in ordered[start:start + BESTDEAL_PAGE_SIZE]:
+            page.append(hotel)
+        pages.append(page)
+    return pages
+
+
+def first_in_range(pages, data):
+    # отбор до ранжирования: первые hotels_count отелей в диапазонах, в порядке списка
+    price_min, price_max = int(data['price_min']), int(data['price_max'])
+    distance_min, distance_max = float(data['distance_min']), float(data['distance_max'])
+    selected = []
+    for page in pages:
+        for hotel in page:
+            if len(selected) == int(data['hotels_count']):
+                return selected
+            if is_hotel_in_range(hotel, price_min, price_max, distance_min, distance_max):
+                selected.append(hotel)
+    return selected
+
+
+def quality(shown, hotels, data):
+    in_range = [hotel for hotel in hotels if is_hotel_in_range(hotel, int(data['price_min']), int(data['price_max']),
+                                                                float(data['distance_min']),
+                                                                float(data['distance_max']))]
+    front = pareto_front(np.array([hotel.price_cents for hotel in in_range]),
+                         np.array([hotel.distance for hotel in in_range]))
+    front_ids = {hotel.id for hotel, optimal in zip(in_range, front) if optimal}
+    return (statistics.mean(hotel.price_cents for hotel in shown) / 100,
+            statistics.mean(hotel.distance for hotel in shown),
+            statistics.mean(hotel.review_score for hotel in shown),
+            sum(hotel.id in front_ids for hotel in shown) / len(shown))
+
+
+def median_time(select, pages, data, repeat):
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        select(pages, data)
+        times.append(time.perf_counter() - started)
+    return statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--hotels', type=int, default=5, help='hotels to display')
+    parser.add_argument('--repeat', type=int, default=200, help='selections per range and mode (median is shown)')
+    args = parser.parse_args()
+    logger.remove()
+    hotels = list(HotelBatch.from_properties(list_properties(BESTDEAL_MAX_RESULTS)))
+    pages = list_pages(hotels)
+    print(f'{len(hotels)} hotels by price, pages of {BESTDEAL_PAGE_SIZE}, {args.hotels} hotels to display')
+    print(f'{"ranges":>7} {"mode":>8} {"time, us":>9} {"price, $":>9} {"distance":>9} {"review":>7} {"pareto":>7}')
+    for name, (price_min, price_max, distance_min, distance_max) in RANGES.items():
+        data = {'hotels_count': args.hotels, 'price_min': price_min, 'price_max': price_max,
+                'distance_min': distance_min, 'distance_max': distance_max}
+        for mode, select in (('filter', first_in_range), ('ranking', best_hotels)):
+            elapsed = median_time(select, pages, data, args.repeat)
+            price, distance, review, pareto = quality(select(pages, data), hotels, data)
+            print(f'{name:>7} {mode:>8} {elapsed * 1e6:>9.0f} {price:>9.0f} {distance:>9.2f} {review:>7.2f} '
+                  f'{pareto:>7.0%}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+"""
+Wall-clock time of make_api_request1 for 1-7 hotels against a local stub of hotels4 and the Bot API:
+the property details requested one by one and concurrently (DETAIL_MAX_WORKERS).
+
+    python -m benchmarks.detail_fanout [--delay 0.6] [--runs 3]
+"""
+import argparse
+import itertools
+import statistics
+import tempfile
+import time
+from datetime import date, timedelta
+from types import SimpleNamespace
+from loguru import logger
+from benchmarks.stub_server import StubServer
+from api_seq import api
+from api_seq.quota import quota
+from api_seq.records import HotelRecord
+from database.classes import db, BaseModel
+from config_data.config import DETAIL_MAX_WORKERS
+
+hotel_ids = itertools.count(1)
+
+
+def search_data(hotels_count):
+    check_in = date.today() + timedelta(days=30)
+    return {'command': '/lowprice', 'regionId': '2734', 'date_check_in': check_in,
+            'date_check_out': check_in + timedelta(days=2), 'total_days': 2, 'people_count': 2,
+            'hotels_count': hotels_count, 'sort': 'PRICE_LOW_TO_HIGH', 'price_min': 10, 'price_max': 1000,
+            'pictures_question': 0}
+
+
+def hotels(count):
+    # новые id в каждом прогоне: детали не берутся из кэша
+    return [HotelRecord(str(next(hotel_ids)), 10000 + num, 1.5 + num, '$') for num in range(count)]
+
+
+def run_search(count, workers):
+    api.DETAIL_MAX_WORKERS = workers
+    started = time.perf_counter()
+    api.make_api_request1(message=SimpleNamespace(chat=SimpleNamespace(id=1)), hotels=hotels(count),
+                          data=search_data(count), user_id=1)
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--delay', type=float, default=0.6, help='seconds per properties/v2/detail request')
+    parser.add_argument('--runs', type=int, default=3, help='searches per number of hotels (median is shown)')
+    args = parser.parse_args()
+    logger.remove()
+    # бенчмарк измеряет задержку, а не бюджет hotels4
+    quota.acquire = lambda endpoint: None
+    stub = StubServer(api_delay=args.delay)
+    stub.start()
+    with tempfile.TemporaryDirectory() as directory:
+        db.init(f'{directory}/history.db')
+        db.create_tables(BaseModel.__subclasses__())
+        print(f'properties/v2/detail: {args.delay:.2f} s, DETAIL_MAX_WORKERS = {DETAIL_MAX_WORKERS}')
+        print(f'{"hotels":>6} {"sequential, s":>14} {"concurrent, s":>14} {"speedup":>8}')
+        for count in range(1, 8):
+            sequential = statistics.median(run_search(count, 1) for _ in range(args.runs))
+            concurrent = statistics.median(run_search(count, DETAIL_MAX_WORKERS) for _ in range(args.runs))
+            print(f'{count:>6} {sequential:>14.2f} {concurrent:>14.2f} {sequential / concurrent:>7.1f}x')
+        db.close()
+    stub.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""
+Synthetic data for the benchmarks: properties/v2/list entries with the fields and sizes of a hotels4 response
+and a search history in history.db.
+"""
+import random
+import time
+from datetime import date, timedelta
+from database.classes import db
+
+
+def list_property(num, rng):
+    """
+        Returns a properties/v2/list entry shaped like the ones hotels4 returns.
+
+        :param num: int (number of the hotel, its id)
+        :param rng: random.Random
+        :return: dict
+    """
+    price = rng.randint(40, 900)
+    distance = round(rng.uniform(0.1, 25.0), 2)
+    return {
+        '__typename': 'Property',
+        'id': str(10000 + num),
+        'name': f'Hotel {num} {rng.choice(("Central", "Plaza", "Garden", "Riverside", "Boutique"))}',
+        'availability': {'__typename': 'PropertyAvailability', 'available': True, 'minRoomsLeft': rng.randint(1, 9)},
+        'propertyImage': {'__typename': 'PropertyImage', 'alt': f'Hotel {num}', 'fallbackImage': None,
+                          'image': {'__typename': 'Image', 'description': f'Hotel {num}',
+                                    'url': f'https://images.trvl-media.com/lodging/{num}/{num}_1_z.jpg'},
+                          'subjectId': 1000},
+        'destinationInfo': {'__typename': 'PropertyDestinationInfo',
+                            'distanceFromDestination': {'__typename': 'Distance', 'unit': 'MILE', 'value': distance},
+                            'distanceFromMessaging': None, 'regionId': '2734'},
+        'legalDisclaimer': None,
+        'listingFooter': None,
+        'mapMarker': {'__typename': 'MapMarker', 'label': f'${price}',
+                      'latLong': {'__typename': 'Coordinates', 'latitude': 48.85 + rng.uniform(-0.1, 0.1),
+                                  'longitude': 2.35 + rng.uniform(-0.1, 0.1)}},
+        'neighborhood': {'__typename': 'Region', 'name': rng.choice(('Paris', 'Montmartre', 'Le Marais'))},
+        'offerBadge': None,
+        'offerSummary': {'__typename': 'OfferSummary', 'messages': [], 'attributes': []},
+        'pinnedDetails': None,
+        'price': {'__typename': 'PropertyPrice',
+                  'options': [{'__typename': 'PropertyPriceOption', 'strikeOut': None,
+                               'disclaimer': None, 'formattedDisplayPrice': f'${price:,}'}],
+                  'priceMessaging': None,
+                  'lead': {'__typename': 'Money', 'amount': price + rng.random(),
+                           'currencyInfo': {'__typename': 'Currency', 'code': 'USD', 'symbol': '$'},
+                           'formatted': f'${price:,}'},
+                  'strikeOut': None,
+                  'displayMessages': [{'__typename': 'PriceDisplayMessage', 'lineItems': [
+                      {'__typename': 'DisplayPrice', 'role': 'LEAD',
+                       'price': {'__typename': 'FormattedMoney', 'formatted': f'${price:,}',
+                                 'accessibilityLabel': f'The current price is ${price:,}'}}]},
+                      {'__typename': 'PriceDisplayMessage', 'lineItems': [
+                          {'__typename': 'LodgingEnrichedMessage', 'value': 'nightly'}]}],
+                  'strikeOutType': None,
+                  'priceMessages': [{'__typename': 'LodgingPlainMessage', 'value': 'nightly'}]},
+        'priceAfterLoyaltyPointsApplied': {'__typename': 'PropertyPrice', 'options': [
+            {'__typename': 'PropertyPriceOption', 'strikeOut': None, 'disclaimer': None,
+             'formattedDisplayPrice': f'${price:,}'}], 'lead': {'__typename': 'Money', 'amount': price}},
+        'propertyFees': [],
+        'reviews': {'__typename': 'PropertyReviewsSummary', 'score': round(rng.uniform(6.0, 10.0), 1),
+                    'total': rng.randint(0, 3000)},
+        'star': None,
+        'supportingMessages': None,
+        'regionId': '2734',
+        'priceMetadata': {'__typename': 'PropertyPriceMetadata', 'discountType': None, 'rateDiscount': None,
+                          'totalDiscountPercentage': None},
+        'saveTripItem': None,
+    }
+
+
+def list_properties(count, seed=1):
+    """
+        Returns the entries of count hotels (the same for the same seed).
+
+        :param count: int
+        :param seed: int
+        :return: list of dict
+    """
+    rng = random.Random(seed)
+    return [list_property(num, rng) for num in range(count)]
+
+
+def create_history(searches, users, hotels=7, properties=20000, days=365, seed=1):
+    """
+        Fills the searches, properties and search_properties tables of the current database
+        with searches of random users made during the last days (search ids grow with the time of the search).
+
+        :param searches: int
+        :param users: int (user ids 1..users)
+        :param hotels: int (hotels shown in each search)
+        :param properties: int (distinct hotels)
+        :param days: int
+        :param seed: int
+        :return: None
+    """
+    rng = random.Random(seed)
+    now = int(time.time())
+    first = now - days * 24 * 60 * 60
+    connection = db.connection()
+    with db.atomic():
+        connection.executemany('INSERT INTO properties (id, name, address) VALUES (?, ?, ?)',
+                               ((str(num), f'Hotel {num} {rng.choice(("Central", "Plaza", "Garden"))}',
+                                 f'{rng.randint(1, 200)} Street {num % 500}, Paris') for num in range(properties)))
+        step = (now - first) / searches
+        rows = []
+        for search_id in range(1, searches + 1):
+            check_in = date.today() + timedelta(days=rng.randint(1, 90))
+            rows.append((search_id, rng.randint(1, users), int(first + search_id * step),
+                         rng.choice(('/lowprice', '/highprice', '/bestdeal')), 'Paris', '2734', check_in.isoformat(),
+                         (check_in + timedelta(days=2)).isoformat(), 2, 10, 30000))
+        connection.executemany('INSERT INTO searches (id, user_id, created, command, query, region_id, check_in, '
+                               'check_out, adults, price_min, price_max) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                               rows)
+        connection.executemany('INSERT INTO search_properties (search_id, position, property_id) VALUES (?, ?, ?)',
+                               ((search_id, position, str(rng.randrange(properties)))
+                                for search_id in range(1, searches + 1) for position in range(hotels)))
@@ -0,0 +1,123 @@
+"""
+/history of users with few and many searches: Bot API messages sent and database rows read per call,
+all the searches as one message per search and per hotel (as before) and one page of searches per message.
+
+    python -m benchmarks.history_messages [--searches 5,50,500] [--hotels 7]
+"""
+import argparse
+import tempfile
+import time
+from loguru import logger
+from peewee import JOIN
+from benchmarks.fixtures import create_history
+from benchmarks.stub_server import StubServer
+from loader import bot
+from database.classes import db, BaseModel, Search, Property, SearchProperty
+from handlers.history import history_page
+from config_data.config import HISTORY_PAGE_SIZE
+
+
+class RowCounter:
+    """
+    class contains the number of queries sent to the database and of the rows they returned
+    """
+    def __init__(self):
+        self.queries = 0
+        self.rows = 0
+        self.execute_sql = db.execute_sql
+
+    def __call__(self, sql, params=None, *args, **kwargs):
+        cursor = self.execute_sql(sql, params, *args, **kwargs)
+        self.queries += 1
+        rows = cursor.fetchall()
+        self.rows += len(rows)
+        return ReplayCursor(cursor, rows)
+
+
+class ReplayCursor:
+    """
+    class contains the rows fetched from a cursor, returned again to peewee
+    """
+    def __init__(self, cursor, rows):
+        self.description = cursor.description
+        self.lastrowid = cursor.lastrowid
+        self.rowcount = cursor.rowcount
+        self.rows = iter(rows)
+
+    def fetchone(self):
+        return next(self.rows, None)
+
+    def fetchall(self):
+        return list(self.rows)
+
+    def __iter__(self):
+        return self.rows
+
+    def close(self):
+        pass
+
+
+def all_searches(chat_id, user_id):
+    # /history до постраничного вывода: все поиски пользователя, сообщение на поиск и на каждый отель
+    rows = (Search
+            .select(Search.id, Search.command, Search.created, Property.name, Property.address)
+            .join(SearchProperty, JOIN.LEFT_OUTER, on=(SearchProperty.search == Search.id))
+            .join(Property, JOIN.LEFT_OUTER, on=(Property.id == SearchProperty.property))
+            .where(Search.user_id == user_id)
+            .order_by(Search.id, SearchProperty.position)
+            .tuples())
+    search_id = None
+    for row_search_id, command, created, name, address in rows:
+        if row_search_id != search_id:
+            search_id = row_search_id
+            bot.send_message(chat_id=chat_id, text=f'Command: {command}\nDate of search: {created}\nHotels:')
+        if name is not None:
+            bot.send_message(chat_id=chat_id, text=f'Name: {name}\nAddress: {address}')
+
+
+def first_page(chat_id, user_id):
+    text, keyboard = history_page(user_id)
+    bot.send_message(chat_id=chat_id, text=text, reply_markup=keyboard)
+
+
+def measure(stub, show, user_id):
+    counter = db.execute_sql = RowCounter()
+    sent_before = stub.requests.get('sendMessage', 0)
+    started = time.perf_counter()
+    try:
+        show(user_id, user_id)
+    finally:
+        del db.execute_sql
+    return stub.requests['sendMessage'] - sent_before, counter.queries, counter.rows, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--searches', default='5,50,500', help='searches of the measured users')
+    parser.add_argument('--hotels', type=int, default=7, help='hotels shown in each search')
+    args = parser.parse_args()
+    logger.remove()
+    stub = StubServer(api_delay=0.0)
+    stub.start()
+    counts = [int(count) for count in args.searches.split(',')]
+    with tempfile.TemporaryDirectory() as directory:
+        db.init(f'{directory}/history.db')
+        db.create_tables(BaseModel.__subclasses__())
+        create_history(searches=sum(counts), users=1, hotels=args.hotels, properties=1000)
+        # пользователь с номером i сделал counts[i - 1] поисков
+        first = 1
+        for user_id, count in enumerate(counts, 1):
+            Search.update(user_id=user_id).where(Search.id.between(first, first + count - 1)).execute()
+            first += count
+        print(f'{args.hotels} hotels per search, pages of up to {HISTORY_PAGE_SIZE} searches')
+        print(f'{"searches":>9} {"mode":>6} {"messages":>9} {"queries":>8} {"rows read":>10} {"time, ms":>9}')
+        for user_id, count in enumerate(counts, 1):
+            for mode, show in (('all', all_searches), ('page', first_page)):
+                messages, queries, rows, elapsed = measure(stub, show, user_id)
+                print(f'{count:>9} {mode:>6} {messages:>9} {queries:>8} {rows:>10} {elapsed * 1000:>9.1f}')
+        db.close()
+    stub.stop()
+
+
+if __name__ == '__main__':
+    main()
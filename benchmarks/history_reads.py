@@ -0,0 +1,73 @@
+"""
+/history pages read from a synthetic history of 1M shown hotels: time to build the first and an older page
+(p50, p99) with the searches index on (user_id, id) and without it.
+
+    python -m benchmarks.history_reads [--rows 1000000] [--users 10000] [--pages 300]
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+from loguru import logger
+from benchmarks.fixtures import create_history
+from database.classes import db, BaseModel, Search
+from handlers.history import history_page
+
+HOTELS = 7
+
+
+def measure(users, pages, seed):
+    rng = random.Random(seed)
+    first, older = [], []
+    for _ in range(pages):
+        user_id = rng.randint(1, users)
+        started = time.perf_counter()
+        _, keyboard = history_page(user_id)
+        first.append(time.perf_counter() - started)
+        if keyboard is None:
+            continue
+        # кнопка «Older» первой страницы: history_older_<id самого старого показанного поиска>
+        search_id = int(keyboard.keyboard[0][0].callback_data.rsplit('_', 1)[1])
+        started = time.perf_counter()
+        history_page(user_id, before=search_id)
+        older.append(time.perf_counter() - started)
+    return first, older
+
+
+def percentiles(latencies):
+    latencies = sorted(latencies)
+    return statistics.median(latencies) * 1000, latencies[int(len(latencies) * 0.99)] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1000000, help='shown hotels (search_properties rows)')
+    parser.add_argument('--users', type=int, default=10000, help='users making the searches')
+    parser.add_argument('--pages', type=int, default=300, help='/history calls of random users in each mode')
+    args = parser.parse_args()
+    logger.remove()
+    with tempfile.TemporaryDirectory() as directory:
+        path = f'{directory}/history.db'
+        db.init(path, pragmas={'journal_mode': 'wal', 'synchronous': 'normal', 'foreign_keys': 1})
+        db.create_tables(BaseModel.__subclasses__())
+        started = time.perf_counter()
+        create_history(searches=args.rows // HOTELS, users=args.users, hotels=HOTELS)
+        db.execute_sql('ANALYZE')
+        print(f'{args.rows // HOTELS} searches of {args.users} users, {args.rows} shown hotels, '
+              f'{os.path.getsize(path) / 2 ** 20:.0f} MB, built in {time.perf_counter() - started:.0f} s')
+        print(f'{"searches index":>15} {"first p50, ms":>14} {"first p99, ms":>14} {"older p50, ms":>14} '
+              f'{"older p99, ms":>14}')
+        for indexed in (True, False):
+            if not indexed:
+                for index in Search._meta.fields_to_index():
+                    db.execute_sql(f'DROP INDEX "{index._name}"')
+            first, older = measure(args.users, args.pages, seed=7)
+            print(f'{"(user_id, id)" if indexed else "none":>15} {percentiles(first)[0]:>14.2f} '
+                  f'{percentiles(first)[1]:>14.2f} {percentiles(older)[0]:>14.2f} {percentiles(older)[1]:>14.2f}')
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
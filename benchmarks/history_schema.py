@@ -0,0 +1,170 @@
+"""
+Search history in the legacy users/hotels tables and in the searches/properties/search_properties tables
+(with and without the searches.created index): database size and query time on the same synthetic history
+(a /history page, the searches of the last WARMUP_HISTORY_DAYS days, the retention delete).
+
+    python -m benchmarks.history_schema [--rows 1000000] [--users 10000] [--repeat 20]
+"""
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+from datetime import datetime
+from loguru import logger
+from benchmarks.fixtures import create_history
+from database.classes import db, BaseModel
+from database.maintenance import LEGACY_DATE_FORMAT
+from config_data.config import HISTORY_PAGE_SIZE, WARMUP_HISTORY_DAYS
+
+HOTELS = 7
+RETENTION_DAYS = 180
+
+# схема истории до поисков с типизированными столбцами (с индексами /history)
+LEGACY_SCHEMA = '''
+CREATE TABLE users (id INTEGER NOT NULL PRIMARY KEY, command VARCHAR(255) NOT NULL, date VARCHAR(255) NOT NULL,
+                    user_id INTEGER NOT NULL);
+CREATE INDEX user_user_id ON users (user_id);
+CREATE TABLE hotels (id INTEGER NOT NULL PRIMARY KEY, name VARCHAR(255) NOT NULL, address VARCHAR(255) NOT NULL,
+                     req_id INTEGER NOT NULL REFERENCES users (id));
+CREATE INDEX hotel_req_id ON hotels (req_id);
+'''
+
+LEGACY_COPY = '''
+INSERT INTO users (id, command, date, user_id)
+    SELECT id, command, strftime('%d.%m.%Y - %H:%M:%S', created, 'unixepoch', 'localtime'), user_id
+    FROM compact.searches;
+INSERT INTO hotels (name, address, req_id)
+    SELECT properties.name, properties.address, search_properties.search_id
+    FROM compact.search_properties JOIN compact.properties ON properties.id = search_properties.property_id
+    ORDER BY search_properties.search_id, search_properties.position;
+'''
+
+
+class LegacyHistory:
+    """
+    class contains the queries of the legacy users/hotels tables: the date is a formatted string,
+    so the searches of a period are found by reading every search
+    """
+    def __init__(self, connection):
+        self.connection = connection
+
+    def page(self, user_id):
+        return self.connection.execute(
+            'SELECT users.id, users.command, users.date, hotels.name, hotels.address FROM users '
+            'LEFT JOIN hotels ON hotels.req_id = users.id '
+            'WHERE users.id IN (SELECT id FROM users WHERE user_id = ? ORDER BY id DESC LIMIT ?) '
+            'ORDER BY users.id DESC, hotels.id', (user_id, HISTORY_PAGE_SIZE)).fetchall()
+
+    def searches_since(self, since):
+        return [search_id for search_id, date in self.connection.execute('SELECT id, date FROM users')
+                if datetime.strptime(date, LEGACY_DATE_FORMAT).timestamp() >= since]
+
+    def delete_before(self, cutoff):
+        old = [(search_id,) for search_id, date in self.connection.execute('SELECT id, date FROM users')
+               if datetime.strptime(date, LEGACY_DATE_FORMAT).timestamp() < cutoff]
+        self.connection.executemany('DELETE FROM hotels WHERE req_id = ?', old)
+        self.connection.executemany('DELETE FROM users WHERE id = ?', old)
+
+
+class CompactHistory:
+    """
+    class contains the queries of the searches/properties/search_properties tables
+    (those of load_history, warmup and compact_history)
+    """
+    def __init__(self, connection):
+        self.connection = connection
+
+    def page(self, user_id):
+        return self.connection.execute(
+            'SELECT searches.id, searches.command, searches.created, properties.name, properties.address '
+            'FROM searches LEFT JOIN search_properties ON search_properties.search_id = searches.id '
+            'LEFT JOIN properties ON properties.id = search_properties.property_id '
+            'WHERE searches.id IN (SELECT id FROM searches WHERE user_id = ? ORDER BY id DESC LIMIT ?) '
+            'ORDER BY searches.id DESC, search_properties.position', (user_id, HISTORY_PAGE_SIZE)).fetchall()
+
+    def searches_since(self, since):
+        return [search_id for search_id, in self.connection.execute(
+            'SELECT id FROM searches WHERE created >= ? AND query IS NOT NULL', (since,))]
+
+    def delete_before(self, cutoff):
+        self.connection.execute('DELETE FROM search_properties WHERE search_id IN '
+                                '(SELECT id FROM searches WHERE created < ?)', (cutoff,))
+        self.connection.execute('DELETE FROM searches WHERE created < ?', (cutoff,))
+
+
+def median_ms(function, repeat):
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - started)
+    return statistics.median(times) * 1000
+
+
+def build(directory, rows, users):
+    compact = f'{directory}/compact.db'
+    db.init(compact)
+    db.create_tables(BaseModel.__subclasses__())
+    create_history(searches=rows // HOTELS, users=users, hotels=HOTELS)
+    db.execute_sql('ANALYZE')
+    db.execute_sql(f"VACUUM INTO '{directory}/no_index.db'")
+    db.close()
+    with sqlite3.connect(f'{directory}/no_index.db') as connection:
+        connection.execute('DROP INDEX search_created')
+    connection.close()
+    connection = sqlite3.connect(f'{directory}/legacy.db', isolation_level=None)
+    connection.executescript(LEGACY_SCHEMA)
+    connection.execute(f"ATTACH DATABASE '{compact}' AS compact")
+    connection.executescript(f'BEGIN; {LEGACY_COPY} COMMIT;')
+    connection.execute('DETACH DATABASE compact')
+    connection.execute('ANALYZE')
+    connection.close()
+    for name in ('compact', 'no_index', 'legacy'):
+        connection = sqlite3.connect(f'{directory}/{name}.db', isolation_level=None)
+        connection.execute('PRAGMA journal_mode=delete')
+        connection.execute('VACUUM')
+        connection.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1000000, help='shown hotels in the history')
+    parser.add_argument('--users', type=int, default=10000, help='users making the searches')
+    parser.add_argument('--repeat', type=int, default=20, help='runs of each query (median is shown)')
+    args = parser.parse_args()
+    logger.remove()
+    now = time.time()
+    since = now - WARMUP_HISTORY_DAYS * 24 * 60 * 60
+    cutoff = now - RETENTION_DAYS * 24 * 60 * 60
+    with tempfile.TemporaryDirectory() as directory:
+        build(directory, args.rows, args.users)
+        print(f'{args.rows // HOTELS} searches of {args.users} users, {args.rows} shown hotels; '
+              f'last {WARMUP_HISTORY_DAYS} days, delete older than {RETENTION_DAYS} days')
+        print(f'{"schema":>18} {"size, MB":>9} {"page, ms":>9} {"period, ms":>11} {"delete, ms":>11}')
+        for name, title, history_class in (('legacy', 'users/hotels', LegacyHistory),
+                                           ('no_index', 'searches, no index', CompactHistory),
+                                           ('compact', 'searches', CompactHistory)):
+            path = f'{directory}/{name}.db'
+            connection = sqlite3.connect(path, isolation_level=None)
+            history = history_class(connection)
+            rng = random.Random(7)
+            page = median_ms(lambda: history.page(rng.randint(1, args.users)), args.repeat * 10)
+            period = median_ms(lambda: history.searches_since(since), args.repeat)
+
+            def delete():
+                # удаление откатывается: каждый запуск удаляет те же поиски
+                connection.execute('BEGIN')
+                history.delete_before(cutoff)
+                connection.execute('ROLLBACK')
+
+            deleted = median_ms(delete, max(1, args.repeat // 4))
+            connection.close()
+            print(f'{title:>18} {os.path.getsize(path) / 2 ** 20:>9.1f} {page:>9.2f} {period:>11.1f} '
+                  f'{deleted:>11.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""
+Search history writes with the write-behind queue on and off: searches written per second
+and the time the handler threads spend recording a search (p50, p99).
+
+    python -m benchmarks.history_writes [--searches 2000] [--threads 4]
+"""
+import argparse
+import statistics
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+from loguru import logger
+from api_seq.search_request import SearchRequest
+from database.classes import db, BaseModel
+from database.writer import HistoryWriter, search_columns
+from config_data.config import HISTORY_BATCH_SIZE, BOT_NUM_THREADS
+
+
+def record_searches(writer, first, count, latencies):
+    check_in = date.today() + timedelta(days=30)
+    for num in range(first, first + count):
+        search = SearchRequest(region_id=str(num % 50), check_in=check_in, check_out=check_in + timedelta(days=2),
+                               adults=2, results_size=7, sort='PRICE_LOW_TO_HIGH', price_min=10, price_max=1000)
+        hotels = [(str(num * 7 + position), f'Hotel {num * 7 + position}', 'Street') for position in range(7)]
+        started = time.perf_counter()
+        writer.add_search(search_columns(num % 100, '/lowprice', int(time.time()), search, 'Paris'), hotels)
+        latencies.append(time.perf_counter() - started)
+
+
+def run(directory, queued, searches, threads):
+    db.init(f'{directory}/{"queued" if queued else "direct"}.db')
+    db.create_tables(BaseModel.__subclasses__())
+    writer = HistoryWriter(batch_size=HISTORY_BATCH_SIZE)
+    if queued:
+        writer.start()
+    latencies = []
+    per_thread = searches // threads
+    workers = [threading.Thread(target=record_searches, args=(writer, num * per_thread, per_thread, latencies))
+               for num in range(threads)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    # очередь записывается до конца: скорость считается по записанным поискам
+    writer.stop()
+    elapsed = time.perf_counter() - started
+    db.close()
+    latencies.sort()
+    return per_thread * threads / elapsed, statistics.median(latencies), latencies[int(len(latencies) * 0.99)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--searches', type=int, default=2000, help='searches recorded in each mode')
+    parser.add_argument('--threads', type=int, default=BOT_NUM_THREADS, help='handler threads recording searches')
+    args = parser.parse_args()
+    logger.remove()
+    print(f'{args.searches} searches of 7 hotels, {args.threads} handler threads, batch {HISTORY_BATCH_SIZE}')
+    print(f'{"queue":>6} {"searches/s":>11} {"p50, ms":>8} {"p99, ms":>8}')
+    with tempfile.TemporaryDirectory() as directory:
+        for queued in (False, True):
+            rate, p50, p99 = run(directory, queued, args.searches, args.threads)
+            print(f'{"on" if queued else "off":>6} {rate:>11.0f} {p50 * 1000:>8.2f} {p99 * 1000:>8.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""
+A properties/v2/list page of 400 hotels kept as the response dicts (as before) and parsed once into a HotelBatch:
+memory held by the page, time to parse the response and time to check the hotels against the /bestdeal ranges.
+
+    python -m benchmarks.hotel_records [--hotels 400] [--repeat 50]
+"""
+import argparse
+import gc
+import json
+import statistics
+import time
+import tracemalloc
+from loguru import logger
+from benchmarks.fixtures import list_properties
+from api_seq.records import HotelBatch
+from universal_functions.ranking import is_hotel_in_range
+
+PRICE_MIN, PRICE_MAX, DISTANCE_MIN, DISTANCE_MAX = 100, 500, 0.0, 10.0
+
+
+def dict_in_range(hotel, price_min, price_max, distance_min, distance_max):
+    # проверка до HotelBatch: цена и расстояние разбираются из словарей ответа при каждой проверке
+    price = float(hotel['price']['options'][0]['formattedDisplayPrice'].replace(',', '').strip('$'))
+    distance = float(hotel['destinationInfo']['distanceFromDestination']['value'])
+    return price_min <= price <= price_max and distance_min <= distance <= distance_max
+
+
+def parse_dicts(raw):
+    return json.loads(raw)['data']['propertySearch']['properties']
+
+
+def parse_batch(raw):
+    return HotelBatch.from_properties(json.loads(raw)['data']['propertySearch']['properties'])
+
+
+def held_memory(parse, raw):
+    gc.collect()
+    tracemalloc.start()
+    page = parse(raw)
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del page
+    return size
+
+
+def median_time(function, repeat):
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - started)
+    return statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--hotels', type=int, default=400, help='hotels in the page')
+    parser.add_argument('--repeat', type=int, default=50, help='runs of each measurement (median is shown)')
+    args = parser.parse_args()
+    logger.remove()
+    raw = json.dumps({'data': {'propertySearch': {'properties': list_properties(args.hotels)}}})
+    dicts = parse_dicts(raw)
+    batch = parse_batch(raw)
+    modes = (
+        ('dicts', parse_dicts,
+         lambda: [hotel for hotel in dicts if dict_in_range(hotel, PRICE_MIN, PRICE_MAX, DISTANCE_MIN, DISTANCE_MAX)]),
+        ('batch', parse_batch,
+         lambda: [hotel for hotel in batch if is_hotel_in_range(hotel, PRICE_MIN, PRICE_MAX, DISTANCE_MIN,
+                                                                DISTANCE_MAX)]),
+    )
+    print(f'{args.hotels} hotels, response {len(raw) / 1024:.0f} KB')
+    print(f'{"page":>6} {"held, KB":>9} {"parse, ms":>10} {"ranges, ms":>11}')
+    for name, parse, check in modes:
+        size = held_memory(parse, raw)
+        parse_time = median_time(lambda: parse(raw), args.repeat)
+        check_time = median_time(check, args.repeat)
+        print(f'{name:>6} {size / 1024:>9.0f} {parse_time * 1000:>10.2f} {check_time * 1000:>11.3f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""
+/bestdeal hotels list: one request of BESTDEAL_MAX_RESULTS hotels (as before) against pages of BESTDEAL_PAGE_SIZE
+requested until enough hotels are found. Requests, bytes downloaded (gzip) and time to the ranked hotels
+for wide and narrow price/distance ranges, the list answered by a local stub from hotels4-shaped entries.
+
+    python -m benchmarks.list_paging [--delay 0.2] [--runs 5]
+"""
+import argparse
+import itertools
+import statistics
+import time
+from datetime import date, timedelta
+from loguru import logger
+from benchmarks.fixtures import list_properties
+from benchmarks.stub_server import StubServer
+from api_seq import api
+from api_seq.quota import quota
+from api_seq.search_request import SearchRequest
+from universal_functions.ranking import best_hotels
+from config_data.config import BESTDEAL_PAGE_SIZE, BESTDEAL_MAX_RESULTS
+
+# диапазоны цены (USD) и расстояния (мили): в широкий попадает почти каждый отель первой страницы
+RANGES = {
+    'wide': (1, 1000, 0.0, 30.0),
+    'medium': (100, 500, 0.0, 10.0),
+    'narrow': (40, 150, 0.0, 4.0),
+}
+region_ids = itertools.count(1)
+
+
+def search_data(ranges, hotels_count):
+    price_min, price_max, distance_min, distance_max = ranges
+    check_in = date.today() + timedelta(days=30)
+    # новый регион на каждый поиск: кэш поиска не отвечает вместо API
+    return {'regionId': str(next(region_ids)), 'date_check_in': check_in,
+            'date_check_out': check_in + timedelta(days=2), 'people_count': 2, 'hotels_count': hotels_count,
+            'sort': 'DISTANCE', 'price_min': price_min, 'price_max': price_max, 'distance_min': distance_min,
+            'distance_max': distance_max}
+
+
+def single_request(data):
+    search = SearchRequest.from_data(data)._replace(results_size=BESTDEAL_MAX_RESULTS)
+    hotels = api.make_api_request(search)
+    return best_hotels([hotels], data) if hotels else []
+
+
+def paged_request(data):
+    pages = api.make_paged_api_request(SearchRequest.from_data(data), page_size=BESTDEAL_PAGE_SIZE,
+                                       max_results=BESTDEAL_MAX_RESULTS)
+    return best_hotels(pages, data) if pages else []
+
+
+def run(stub, find, ranges, hotels_count, runs):
+    requests_before = stub.requests.get('list', 0)
+    bytes_before = stub.bytes_sent.get('list', 0)
+    times = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        find(search_data(ranges, hotels_count))
+        times.append(time.perf_counter() - started)
+    return ((stub.requests['list'] - requests_before) / runs, (stub.bytes_sent['list'] - bytes_before) / runs,
+            statistics.median(times))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--delay', type=float, default=0.2, help='seconds per properties/v2/list request')
+    parser.add_argument('--runs', type=int, default=5, help='searches per range and mode (median time is shown)')
+    parser.add_argument('--hotels', type=int, default=5, help='hotels to display')
+    args = parser.parse_args()
+    logger.remove()
+    # бенчмарк измеряет трафик и задержку, а не бюджет hotels4
+    quota.acquire = lambda endpoint: None
+    stub = StubServer(api_delay=args.delay, properties=list_properties(BESTDEAL_MAX_RESULTS))
+    stub.start()
+    print(f'{BESTDEAL_MAX_RESULTS} hotels in the list, page {BESTDEAL_PAGE_SIZE}, {args.hotels} hotels to display, '
+          f'properties/v2/list: {args.delay:.2f} s')
+    print(f'{"ranges":>7} {"mode":>7} {"requests":>9} {"KB":>8} {"time, ms":>9}')
+    for name, ranges in RANGES.items():
+        for mode, find in (('single', single_request), ('paged', paged_request)):
+            requests_sent, size, elapsed = run(stub, find, ranges, args.hotels, args.runs)
+            print(f'{name:>7} {mode:>7} {requests_sent:>9.1f} {size / 1024:>8.1f} {elapsed * 1000:>9.1f}')
+    stub.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""
+Hotel cards with pictures from galleries with missing, oversized and non-image pictures, against a local stub
+of the image CDN and the Bot API: Bot API requests, HEAD checks, pictures shown and time per card,
+media groups of the first gallery pictures (as before) and of the checked pictures (select_images),
+with cold and with warm caches (known-good pictures and file_ids).
+
+    python -m benchmarks.media_pipeline [--hotels 50] [--pictures 5] [--bad 0.2]
+"""
+import argparse
+import random
+import tempfile
+import time
+from types import SimpleNamespace
+import telebot
+from loguru import logger
+from benchmarks.stub_server import StubServer, IMAGE_KINDS
+from loader import bot
+from api_seq import api
+from api_seq.media import select_images, media_stats
+from api_seq.records import HotelRecord
+from database.classes import db, BaseModel
+
+GALLERY = 10
+BAD_KINDS = sorted(set(IMAGE_KINDS) - {'good'})
+REQUESTS = ('sendMediaGroup', 'sendMediaGroup failed', 'sendPhoto', 'HEAD', 'photos')
+
+
+def galleries(stub, hotels, bad, seed=1):
+    rng = random.Random(seed)
+    return {str(num): [f'{stub.url}/images/{rng.choice(BAD_KINDS) if rng.random() < bad else "good"}_{num}_{pos}.jpg'
+                       for pos in range(GALLERY)]
+            for num in range(1, hotels + 1)}
+
+
+def send_first_pictures(message, hotel, detail, pictures, data):
+    # до проверки фото: группа из первых фото галереи, при ошибке фото отправляются по одному
+    urls = detail['images'][:pictures]
+    media_group = api.hotel_media_group(urls, api.hotel_card(hotel, detail, data['total_days']))
+    try:
+        bot.send_media_group(chat_id=message.chat.id, media=media_group)
+    except telebot.apihelper.ApiTelegramException:
+        for url, photo in zip(urls, media_group):
+            try:
+                bot.send_photo(chat_id=message.chat.id, photo=url, caption=photo.caption)
+            except telebot.apihelper.ApiTelegramException:
+                pass
+
+
+def send_checked_pictures(message, hotel, detail, pictures, data):
+    api.send_hotel(message, hotel, detail, select_images(hotel.id, detail['images'], pictures), data)
+
+
+def run(stub, send, gallery_of, pictures):
+    message = SimpleNamespace(chat=SimpleNamespace(id=1))
+    data = {'total_days': 2, 'pictures_question': 1}
+    before = {name: stub.requests.get(name, 0) for name in REQUESTS}
+    started = time.perf_counter()
+    for hotel_id, urls in gallery_of.items():
+        hotel = HotelRecord(hotel_id, 100, 1.5, '$')
+        send(message, hotel, {'name': f'Hotel {hotel_id}', 'address': 'Street', 'images': urls}, pictures, data)
+    elapsed = time.perf_counter() - started
+    return {name: stub.requests.get(name, 0) - before[name] for name in REQUESTS}, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--hotels', type=int, default=50, help='hotel cards shown in each mode')
+    parser.add_argument('--pictures', type=int, default=5, help='pictures requested per hotel')
+    parser.add_argument('--bad', type=float, default=0.2, help='share of unusable pictures in the galleries')
+    parser.add_argument('--telegram-delay', type=float, default=0.1, help='seconds per Bot API request')
+    parser.add_argument('--image-delay', type=float, default=0.05, help='seconds per HEAD request to the CDN')
+    args = parser.parse_args()
+    logger.remove()
+    stub = StubServer(api_delay=0.0, telegram_delay=args.telegram_delay, image_delay=args.image_delay)
+    stub.start()
+    gallery_of = galleries(stub, args.hotels, args.bad)
+    with tempfile.TemporaryDirectory() as directory:
+        db.init(f'{directory}/history.db')
+        db.create_tables(BaseModel.__subclasses__())
+        print(f'{args.hotels} hotels, {args.pictures} of {GALLERY} gallery pictures requested, '
+              f'{args.bad:.0%} unusable; Bot API {args.telegram_delay:.2f} s, HEAD {args.image_delay:.2f} s')
+        print(f'{"mode":>14} {"Bot API/card":>13} {"HEAD/card":>10} {"pictures/card":>14} {"fallbacks":>10} '
+              f'{"ms/card":>8}')
+        for mode, send in (('first', send_first_pictures), ('checked, cold', send_checked_pictures),
+                           ('checked, warm', send_checked_pictures)):
+            counts, elapsed = run(stub, send, gallery_of, args.pictures)
+            calls = counts['sendMediaGroup'] + counts['sendPhoto']
+            print(f'{mode:>14} {calls / args.hotels:>13.2f} {counts["HEAD"] / args.hotels:>10.1f} '
+                  f'{counts["photos"] / args.hotels:>14.2f} {counts["sendMediaGroup failed"] / args.hotels:>10.0%} '
+                  f'{elapsed / args.hotels * 1000:>8.0f}')
+        print(f'select_images: {media_stats.stats()}')
+        db.close()
+    stub.stop()
+
+
+if __name__ == '__main__':
+    main()
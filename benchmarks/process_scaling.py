@@ -0,0 +1,78 @@
+"""
+Updates handled per second by 1-8 worker processes (BOT_PROCESSES): dialog updates received with long polling
+from a local stub of the Bot API acting as the Telegram source, routed to the workers by chat.
+The handlers answer through the same stub of the Bot API and hotels4.
+
+    python -m benchmarks.process_scaling [--workers 1,2,4,8] [--chats 100] [--telegram-delay 0.02]
+"""
+import argparse
+import os
+import tempfile
+import time
+from loguru import logger
+from telebot import apihelper
+from telebot.custom_filters import StateFilter
+from benchmarks.stub_server import StubServer
+from benchmarks.webhook_replay import dialog
+from loader import bot
+from api_seq.quota import quota
+from database.classes import db, BaseModel
+from utils.processes import ProcessDispatcher
+from config_data.config import WEBHOOK_QUEUE_SIZE
+import handlers
+
+
+def poll(dispatcher, count):
+    # цикл run_processes, остановленный после count обновлений
+    offset = None
+    received = 0
+    while received < count:
+        for update in apihelper.get_updates(bot.token, offset=offset, timeout=1, long_polling_timeout=1):
+            offset = update['update_id'] + 1
+            dispatcher.put(update)
+            received += 1
+
+
+def run(stub, workers, chats, first_chat):
+    dialogs = [dialog(chat_id) for chat_id in range(first_chat, first_chat + chats)]
+    # обновления разных чатов чередуются, Telegram нумерует их в порядке получения
+    stub.updates = [dict(update, update_id=update_id) for update_id, update
+                    in enumerate((update for step in zip(*dialogs) for update in step), 1)]
+    started = time.perf_counter()
+    dispatcher = ProcessDispatcher(bot, processes=workers, queue_size=WEBHOOK_QUEUE_SIZE)
+    poll(dispatcher, len(stub.updates))
+    # рабочие процессы дообрабатывают свои очереди: скорость считается по обработанным обновлениям
+    dispatcher.stop()
+    return len(stub.updates) / (time.perf_counter() - started), dispatcher.routed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--workers', default='1,2,4,8', help='worker processes of each run')
+    parser.add_argument('--chats', type=int, default=100, help='dialogs received (6 updates each)')
+    parser.add_argument('--delay', type=float, default=0.05, help='seconds per hotels4 request')
+    parser.add_argument('--telegram-delay', type=float, default=0.02, help='seconds per Bot API request')
+    args = parser.parse_args()
+    logger.remove()
+    # бенчмарк измеряет обработку обновлений, а не бюджет hotels4
+    quota.acquire = lambda endpoint: None
+    stub = StubServer(api_delay=args.delay, telegram_delay=args.telegram_delay)
+    stub.start()
+    bot.add_custom_filter(StateFilter(bot))
+    with tempfile.TemporaryDirectory() as directory:
+        db.init(f'{directory}/history.db')
+        db.create_tables(BaseModel.__subclasses__())
+        print(f'{args.chats * 6} updates of {args.chats} chats, {os.cpu_count()} CPUs, '
+              f'Bot API {args.telegram_delay:.3f} s and hotels4 {args.delay:.3f} s per request')
+        print(f'{"workers":>7} {"updates/s":>10} {"speedup":>8} {"updates per worker":>19}')
+        single = None
+        for run_num, workers in enumerate(int(count) for count in args.workers.split(',')):
+            rate, routed = run(stub, workers, args.chats, first_chat=(run_num + 1) * 100000)
+            single = single or rate
+            print(f'{workers:>7} {rate:>10.0f} {rate / single:>8.2f} {f"{min(routed)}-{max(routed)}":>19}')
+        db.close()
+    stub.stop()
+
+
+if __name__ == '__main__':
+    main()
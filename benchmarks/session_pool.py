@@ -0,0 +1,76 @@
+"""
+hotels4 requests over HTTPS through the shared keep-alive session and with a new connection per request:
+requests per second and request latency (p50, p99) against a local HTTPS stub of hotels4.
+
+    python -m benchmarks.session_pool [--requests 400] [--threads 4] [--delay 0.005]
+"""
+import argparse
+import statistics
+import tempfile
+import threading
+import time
+import requests
+from loguru import logger
+from benchmarks.stub_server import StubServer, self_signed_certificate
+from api_seq.api import API
+from api_seq.session import create_session
+from config_data.config import BOT_NUM_THREADS, DETAIL_MAX_WORKERS, API_CONNECT_TIMEOUT, API_READ_TIMEOUT
+
+
+def send_requests(send, first, count, latencies):
+    for num in range(first, first + count):
+        payload = dict(API.payload_detail, propertyId=str(num))
+        started = time.perf_counter()
+        response = send('POST', API.url3, json=payload, headers=API.headers_list_detail,
+                        timeout=(API_CONNECT_TIMEOUT, API_READ_TIMEOUT))
+        response.raise_for_status()
+        latencies.append(time.perf_counter() - started)
+
+
+def run(send, total, threads):
+    latencies = []
+    per_thread = total // threads
+    workers = [threading.Thread(target=send_requests, args=(send, num * per_thread, per_thread, latencies))
+               for num in range(threads)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return len(latencies) / elapsed, statistics.median(latencies), latencies[int(len(latencies) * 0.99)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=400, help='properties/v2/detail requests in each mode')
+    parser.add_argument('--threads', type=int, default=BOT_NUM_THREADS * DETAIL_MAX_WORKERS,
+                        help='threads sending the requests')
+    parser.add_argument('--delay', type=float, default=0.005, help='seconds per hotels4 request')
+    args = parser.parse_args()
+    logger.remove()
+    with tempfile.TemporaryDirectory() as directory:
+        certificate = self_signed_certificate(directory)
+        stub = StubServer(api_delay=args.delay, certificate=certificate)
+        stub.start()
+        pooled = create_session(pool_size=args.threads)
+
+        def pooled_connection(method, url, **kwargs):
+            return pooled.request(method, url, verify=certificate[0], **kwargs)
+
+        def fresh_connection(method, url, **kwargs):
+            # так запросы отправлялись до общей сессии: новое TCP- и TLS-соединение на каждый запрос
+            return requests.request(method, url, verify=certificate[0], **kwargs)
+
+        print(f'{args.requests} HTTPS requests, {args.threads} threads, hotels4 answers in {args.delay * 1000:.0f} ms')
+        print(f'{"connections":>12} {"requests/s":>11} {"p50, ms":>8} {"p99, ms":>8}')
+        for name, send in (('per request', fresh_connection), ('pooled', pooled_connection)):
+            rate, p50, p99 = run(send, args.requests, args.threads)
+            print(f'{name:>12} {rate:>11.0f} {p50 * 1000:>8.2f} {p99 * 1000:>8.2f}')
+        pooled.close()
+        stub.stop()
+
+
+if __name__ == '__main__':
+    main()
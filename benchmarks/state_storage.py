@@ -0,0 +1,77 @@
+"""
+Conversation state storages (STATE_BACKEND=memory, sqlite and redis): latency of the state reads and writes
+of a dialog step (p50, p99) with the bot worker threads handling different chats at once.
+
+    python -m benchmarks.state_storage [--chats 200] [--steps 20] [--threads 4] [--redis localhost:6379]
+"""
+import argparse
+import statistics
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+from loguru import logger
+from database.classes import db, BaseModel
+from database.state_storage import create_state_storage
+from config_data.config import BOT_NUM_THREADS, STATE_TTL
+
+OPERATIONS = ('get_state', 'get_data', 'set_data', 'set_state')
+
+
+def dialog(storage, chats, steps, latencies):
+    # шаг диалога: фильтр состояния, чтение ответов, запись нового ответа и переход к следующему вопросу
+    check_in = date.today() + timedelta(days=30)
+    for chat_id in chats:
+        storage.set_state(chat_id, chat_id, 'LowState:city')
+        for step in range(steps):
+            for operation, call in (('get_state', lambda: storage.get_state(chat_id, chat_id)),
+                                    ('get_data', lambda: storage.get_data(chat_id, chat_id)),
+                                    ('set_data', lambda: storage.set_data(chat_id, chat_id, f'answer_{step}',
+                                                                          check_in + timedelta(days=step))),
+                                    ('set_state', lambda: storage.set_state(chat_id, chat_id, f'LowState:{step}'))):
+                started = time.perf_counter()
+                call()
+                latencies[operation].append(time.perf_counter() - started)
+
+
+def run(storage, chats, steps, threads):
+    latencies = {operation: [] for operation in OPERATIONS}
+    workers = [threading.Thread(target=dialog, args=(storage, range(num, chats, threads), steps, latencies))
+               for num in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    results = {}
+    for operation, times in latencies.items():
+        times.sort()
+        results[operation] = statistics.median(times), times[int(len(times) * 0.99)]
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--chats', type=int, default=200, help='chats going through the dialog')
+    parser.add_argument('--steps', type=int, default=20, help='dialog steps of each chat')
+    parser.add_argument('--threads', type=int, default=BOT_NUM_THREADS, help='bot worker threads')
+    parser.add_argument('--redis', help='host:port of a Redis server (the redis backend is skipped without it)')
+    args = parser.parse_args()
+    logger.remove()
+    print(f'{args.chats} chats of {args.steps} dialog steps, {args.threads} bot worker threads')
+    print(f'{"backend":>8} {"operation":>10} {"p50, us":>8} {"p99, us":>8}')
+    with tempfile.TemporaryDirectory() as directory:
+        db.init(f'{directory}/history.db', pragmas={'journal_mode': 'wal', 'synchronous': 'normal'})
+        db.create_tables(BaseModel.__subclasses__())
+        backends = ['memory', 'sqlite']
+        if args.redis:
+            backends.append('redis')
+        for backend in backends:
+            host, _, port = (args.redis or 'localhost:6379').partition(':')
+            storage = create_state_storage(backend, ttl=STATE_TTL, redis_host=host, redis_port=int(port or 6379))
+            for operation, (p50, p99) in run(storage, args.chats, args.steps, args.threads).items():
+                print(f'{backend:>8} {operation:>10} {p50 * 10 ** 6:>8.0f} {p99 * 10 ** 6:>8.0f}')
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
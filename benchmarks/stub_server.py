@@ -0,0 +1,220 @@
+import gzip
+import itertools
+import json
+import os
+import ssl
+import subprocess
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qsl
+from telebot import apihelper, asyncio_helper
+from api_seq.api import API
+
+
+# ответы CDN на HEAD-запрос фото: статус, Content-Type, Content-Length
+IMAGE_KINDS = {
+    'good': (200, 'image/jpeg', 150000),
+    'missing': (404, 'text/html', 0),
+    'huge': (200, 'image/jpeg', 20 * 2 ** 20),
+    'page': (200, 'text/html', 5000),
+}
+
+
+class StubHTTPServer(ThreadingHTTPServer):
+    """
+    class contains the HTTP server of the stub: the backlog holds the connections opened at once by a load test
+    """
+    request_queue_size = 256
+    daemon_threads = True
+
+
+class StubServer:
+    """
+    class contains a local HTTP server answering like hotels4 and the Bot API.
+    Each hotels4 request is answered after api_delay seconds, each Bot API request after telegram_delay seconds.
+    properties/v2/list returns the page (resultsStartingIndex, resultsSize) of properties,
+    getUpdates returns the updates (raw dicts, ids in ascending order) from the offset, as a Telegram source.
+    HEAD /images/<kind>_<num>.jpg answers after image_delay seconds like a CDN (IMAGE_KINDS),
+    sendPhoto and sendMediaGroup fail like Telegram if a picture sent by URL is not a good one.
+    With certificate ((certfile, keyfile)) the server answers over HTTPS.
+    """
+    def __init__(self, api_delay, telegram_delay=0.0, certificate=None, properties=(), updates=(), image_delay=0.0):
+        self.api_delay = api_delay
+        self.telegram_delay = telegram_delay
+        self.image_delay = image_delay
+        self.properties = list(properties)
+        self.updates = list(updates)
+        self.requests = {}
+        self.bytes_sent = {}
+        self.message_ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self.server = StubHTTPServer(('127.0.0.1', 0), self._handler_class())
+        scheme = 'http'
+        if certificate:
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            context.load_cert_chain(*certificate)
+            # рукопожатие выполняет поток обработчика, а не поток, принимающий соединения
+            self.server.socket = context.wrap_socket(self.server.socket, server_side=True,
+                                                     do_handshake_on_connect=False)
+            scheme = 'https'
+        self.url = f'{scheme}://127.0.0.1:{self.server.server_port}'
+
+    def start(self):
+        """
+            Starts the server and points the hotels4 URLs and the Bot API URLs (sync and async bot) to it.
+
+            :return: None
+        """
+        threading.Thread(target=self.server.serve_forever, name='stub-server', daemon=True).start()
+        API.url1 = f'{self.url}/locations/v3/search'
+        API.url2 = f'{self.url}/properties/v2/list'
+        API.url3 = f'{self.url}/properties/v2/detail'
+        apihelper.API_URL = f'{self.url}/bot{{0}}/{{1}}'
+        asyncio_helper.API_URL = apihelper.API_URL
+
+    def stop(self):
+        """
+            Stops the server.
+
+            :return: None
+        """
+        self.server.shutdown()
+        self.server.server_close()
+
+    def count(self, method, amount=1):
+        with self._lock:
+            self.requests[method] = self.requests.get(method, 0) + amount
+
+    def count_bytes(self, path, size):
+        method = path.rsplit('/', 1)[-1]
+        with self._lock:
+            self.bytes_sent[method] = self.bytes_sent.get(method, 0) + size
+
+    def answer(self, path, params, body):
+        method = path.rsplit('/', 1)[-1]
+        self.count(method)
+        if path.startswith('/bot'):
+            time.sleep(self.telegram_delay)
+            if method in ('sendPhoto', 'sendMediaGroup'):
+                return self.photo_answer(method, params)
+            if method.startswith(('send', 'edit')):
+                return {'ok': True, 'result': {'message_id': next(self.message_ids), 'date': 0,
+                                               'chat': {'id': int(params.get('chat_id', 0)), 'type': 'private'},
+                                               'text': params.get('text', '')}}
+            if method == 'getUpdates':
+                offset = int(params.get('offset') or 0)
+                pending = [update for update in self.updates if update['update_id'] >= offset]
+                return {'ok': True, 'result': pending[:int(params.get('limit') or 100)]}
+            return {'ok': True, 'result': True}
+        time.sleep(self.api_delay)
+        if method == 'search':
+            return {'sr': [{'type': 'CITY', 'gaiaId': '2734', 'regionNames': {'fullName': params.get('q', '')}}]}
+        if method == 'detail':
+            property_id = body['propertyId']
+            return {'data': {'propertyInfo': {
+                'summary': {'name': f'Hotel {property_id}', 'location': {'address': {'firstAddressLine': 'Street'}}},
+                'propertyGallery': {'images': []}}}}
+        start = body.get('resultsStartingIndex', 0)
+        page = self.properties[start:start + body.get('resultsSize', 0)]
+        return {'data': {'propertySearch': {'properties': page}}}
+
+    def photo_answer(self, method, params):
+        if method == 'sendPhoto':
+            photos = [params['photo']]
+        else:
+            photos = [item['media'] for item in json.loads(params['media'])]
+        # file_id отправляется без скачивания, ссылка скачивается и должна вести на годное фото
+        if any(photo.startswith('http') and image_kind(photo) != 'good' for photo in photos):
+            self.count(f'{method} failed')
+            return {'ok': False, 'error_code': 400, 'description': 'Bad Request: failed to get HTTP URL content'}
+        self.count('photos', len(photos))
+        messages = []
+        for photo in photos:
+            message_id = next(self.message_ids)
+            messages.append({'message_id': message_id, 'date': 0,
+                             'chat': {'id': int(params.get('chat_id', 0)), 'type': 'private'},
+                             'photo': [{'file_id': f'small_{message_id}', 'file_unique_id': f's{message_id}',
+                                        'width': 90, 'height': 60},
+                                       {'file_id': f'photo_{message_id}', 'file_unique_id': f'p{message_id}',
+                                        'width': 1000, 'height': 667}]})
+        return {'ok': True, 'result': messages if method == 'sendMediaGroup' else messages[0]}
+
+    def _handler_class(self):
+        stub = self
+
+        class StubHandler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def setup(self):
+                if isinstance(self.request, ssl.SSLSocket):
+                    self.request.do_handshake()
+                super().setup()
+
+            def do_GET(self):
+                self.reply()
+
+            def do_POST(self):
+                self.reply()
+
+            def do_HEAD(self):
+                stub.count('HEAD')
+                time.sleep(stub.image_delay)
+                status, content_type, size = IMAGE_KINDS.get(image_kind(self.path), IMAGE_KINDS['missing'])
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(size))
+                self.end_headers()
+
+            def reply(self):
+                url = urlsplit(self.path)
+                params = dict(parse_qsl(url.query))
+                length = int(self.headers.get('Content-Length', 0))
+                raw = self.rfile.read(length) if length else b''
+                try:
+                    body = json.loads(raw) if raw else {}
+                except ValueError:
+                    body = {}
+                    params.update(parse_qsl(raw.decode()))
+                data = json.dumps(stub.answer(url.path, params, body)).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                if 'gzip' in self.headers.get('Accept-Encoding', ''):
+                    data = gzip.compress(data, compresslevel=6)
+                    self.send_header('Content-Encoding', 'gzip')
+                stub.count_bytes(url.path, len(data))
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return StubHandler
+
+
+def image_kind(url):
+    """
+        Returns the kind of a stub picture (key of IMAGE_KINDS) from its URL.
+
+        :param url: str
+        :return: str
+    """
+    return urlsplit(url).path.rsplit('/', 1)[-1].split('_', 1)[0]
+
+
+def self_signed_certificate(directory):
+    """
+        Creates a self-signed certificate for 127.0.0.1 with the openssl command line tool.
+
+        :param directory: str
+        :return: (certfile, keyfile)
+        :rtype: tuple
+    """
+    certfile = os.path.join(directory, 'stub.crt')
+    keyfile = os.path.join(directory, 'stub.key')
+    subprocess.run(['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1',
+                    '-subj', '/CN=127.0.0.1', '-addext', 'subjectAltName=IP:127.0.0.1',
+                    '-keyout', keyfile, '-out', certfile], check=True, capture_output=True)
+    return certfile, keyfile
@@ -0,0 +1,112 @@
+"""
+Replay of dialog updates posted to the local webhook endpoint: updates processed per second
+and the time the updates wait in the worker queues, with one worker and with WEBHOOK_WORKERS.
+The handlers answer through a local stub of the Bot API and hotels4.
+
+    python -m benchmarks.webhook_replay [--chats 100] [--senders 8] [--telegram-delay 0.02]
+"""
+import argparse
+import itertools
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+from http.server import ThreadingHTTPServer
+import requests
+from loguru import logger
+from telebot.custom_filters import StateFilter
+from benchmarks.stub_server import StubServer
+from loader import bot
+from database.classes import db, BaseModel
+from utils.webhook import UpdateDispatcher, make_request_handler
+from config_data.config import WEBHOOK_WORKERS, WEBHOOK_QUEUE_SIZE
+import handlers
+
+PATH = '/webhook'
+update_ids = itertools.count(1)
+
+
+def dialog(chat_id):
+    """
+        Returns the updates of a /lowprice dialog up to the check-in date.
+
+        :param chat_id: int
+        :return: list of dict
+    """
+    user = {'id': chat_id, 'is_bot': False, 'first_name': 'User'}
+    check_in = date.today() + timedelta(days=30)
+
+    def message(text):
+        return {'update_id': next(update_ids), 'message': {
+            'message_id': next(update_ids), 'date': 0, 'text': text, 'from': user,
+            'chat': {'id': chat_id, 'type': 'private'}}}
+
+    def callback(data):
+        update_id = next(update_ids)
+        return {'update_id': update_id, 'callback_query': {
+            'id': str(update_id), 'from': user, 'chat_instance': str(chat_id), 'data': data,
+            'message': {'message_id': update_id, 'date': 0, 'chat': {'id': chat_id, 'type': 'private'}}}}
+
+    return [message('/lowprice'), message('Paris'), callback('city_id2734'), message('3'), message('2'),
+            callback(f'cbcal_1_s_d_{check_in.year}_{check_in.month}_{check_in.day}')]
+
+
+def post_dialogs(url, dialogs):
+    # обновления одного чата доставляются по порядку, обновления разных чатов чередуются
+    with requests.Session() as session:
+        for updates in itertools.zip_longest(*dialogs):
+            for update in updates:
+                if update is None:
+                    continue
+                # как Telegram, отклонённое при полной очереди обновление доставляется повторно
+                while session.post(url, json=update).status_code == 503:
+                    time.sleep(0.1)
+
+
+def replay(workers, chats, senders, first_chat):
+    dispatcher = UpdateDispatcher(bot, workers=workers, queue_size=WEBHOOK_QUEUE_SIZE)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), make_request_handler(dispatcher, PATH, None))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f'http://127.0.0.1:{server.server_port}{PATH}'
+    dialogs = [dialog(chat_id) for chat_id in range(first_chat, first_chat + chats)]
+    threads = [threading.Thread(target=post_dialogs, args=(url, dialogs[num::senders])) for num in range(senders)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    dispatcher.stop()
+    elapsed = time.perf_counter() - started
+    server.shutdown()
+    server.server_close()
+    return elapsed, dispatcher.stats()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--chats', type=int, default=100, help='dialogs replayed (6 updates each)')
+    parser.add_argument('--senders', type=int, default=8, help='connections posting the updates')
+    parser.add_argument('--telegram-delay', type=float, default=0.02, help='seconds per Bot API request')
+    args = parser.parse_args()
+    logger.remove()
+    stub = StubServer(api_delay=0.1, telegram_delay=args.telegram_delay)
+    stub.start()
+    bot.threaded = False
+    bot.add_custom_filter(StateFilter(bot))
+    with tempfile.TemporaryDirectory() as directory:
+        db.init(f'{directory}/history.db')
+        db.create_tables(BaseModel.__subclasses__())
+        print(f'{args.chats * 6} updates of {args.chats} chats, {args.senders} senders, '
+              f'Bot API {args.telegram_delay:.3f} s per request')
+        print(f'{"workers":>7} {"updates/s":>10} {"queue avg, ms":>14} {"queue max, ms":>14} {"rejected":>9}')
+        for run, workers in enumerate(sorted({1, WEBHOOK_WORKERS})):
+            elapsed, stats = replay(workers, args.chats, args.senders, first_chat=(run + 1) * 100000)
+            print(f'{workers:>7} {stats["processed"] / elapsed:>10.0f} {stats["latency_avg"] * 1000:>14.1f} '
+                  f'{stats["latency_max"] * 1000:>14.1f} {stats["rejected"]:>9}')
+        db.close()
+    stub.stop()
+
+
+if __name__ == '__main__':
+    main()
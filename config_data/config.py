@@ -6,3 +6,119 @@ DEFAULT_COMMANDS = (
     ("bestdeal", "Find the best deal by sorting by price and distance"),
     ("history", "Shows your search history"),
 )
+
+# максимальное число одновременных запросов properties/v2/detail на один поиск
+DETAIL_MAX_WORKERS = 4
+
+# число рабочих потоков бота (TeleBot num_threads)
+BOT_NUM_THREADS = 2
+
+# таймауты запросов к hotels4 в секундах: (соединение, чтение)
+API_CONNECT_TIMEOUT = 5
+API_READ_TIMEOUT = 20
+# таймауты чтения (сек) для каждого метода hotels4: поиск города, список отелей, детали отеля;
+# столько же (плюс API_CONNECT_TIMEOUT) ждут ответа одинаковые запросы, объединённые с уже отправленным
+LOCATIONS_READ_TIMEOUT = 10
+LIST_READ_TIMEOUT = 20
+DETAIL_READ_TIMEOUT = 15
+
+# кэш результатов locations/v3/search: размер, время жизни (сек), хранение второго уровня в history.db
+LOCATION_CACHE_SIZE = 1000
+LOCATION_CACHE_TTL = 24 * 60 * 60
+LOCATION_CACHE_SQLITE = True
+
+# кэш деталей отелей (properties/v2/detail): размер, время жизни (сек),
+# число хранимых фото (с запасом на случай недоступных), хранение в history.db
+DETAIL_CACHE_SIZE = 5000
+DETAIL_CACHE_TTL = 7 * 24 * 60 * 60
+DETAIL_CACHE_IMAGES = 6
+DETAIL_CACHE_SQLITE = False
+
+# /bestdeal: размер страницы properties/v2/list (не меньше BESTDEAL_CANDIDATES: обычно хватает одного запроса)
+# и максимальное число просматриваемых отелей (не больше BESTDEAL_MAX_RESULTS / BESTDEAL_PAGE_SIZE запросов)
+BESTDEAL_PAGE_SIZE = 50
+BESTDEAL_MAX_RESULTS = 400
+
+# /bestdeal: число отелей в диапазоне, из которых выбираются лучшие,
+# веса цены, расстояния и оценки гостей, отбор по фронту Парето (цена, расстояние)
+BESTDEAL_CANDIDATES = 50
+BESTDEAL_WEIGHTS = (0.5, 0.4, 0.1)
+BESTDEAL_PARETO = True
+
+# асинхронный режим (BOT_RUNTIME=async): максимальное число одновременных соединений с hotels4
+ASYNC_MAX_CONNECTIONS = 100
+
+# режим webhook: число обработчиков обновлений и размер очереди каждого из них
+WEBHOOK_WORKERS = 8
+WEBHOOK_QUEUE_SIZE = 100
+
+# /history: число поисков на странице и максимальная длина сообщения Telegram
+HISTORY_PAGE_SIZE = 10
+MESSAGE_MAX_LENGTH = 4096
+
+# запись истории поисков: отдельный поток с очередью (False — запись в потоке обработчика), размер пакета
+HISTORY_WRITE_BEHIND = True
+HISTORY_BATCH_SIZE = 100
+
+# хранение истории: срок хранения поисков (дни, 0 — без ограничения) и период очистки базы (сек)
+HISTORY_RETENTION_DAYS = 365
+HISTORY_COMPACT_INTERVAL = 24 * 60 * 60
+
+# время (сек), через которое незавершённый диалог (состояние пользователя) удаляется
+STATE_TTL = 24 * 60 * 60
+
+# ограничение исходящих запросов к Telegram: сообщений в секунду всего, в секунду на чат и запас для чата
+OUTBOUND_GLOBAL_RATE = 30
+OUTBOUND_CHAT_RATE = 1
+OUTBOUND_CHAT_BURST = 5
+
+# проверка фото перед отправкой: кэш проверенных ссылок (размер, время жизни, хранение в history.db),
+# максимальный размер фото, отправляемого по ссылке (байт), и время ожидания ответа (сек)
+IMAGE_CACHE_SIZE = 5000
+IMAGE_CACHE_TTL = 24 * 60 * 60
+IMAGE_CACHE_SQLITE = True
+IMAGE_MAX_BYTES = 5 * 1024 * 1024
+IMAGE_CHECK_TIMEOUT = 3
+# число одновременных проверок фото (общее для всех поисков, отдельный пул соединений)
+IMAGE_CHECK_WORKERS = 8
+
+# кэш file_id отправленных фото (хранится в history.db): размер и время жизни (сек)
+FILE_ID_CACHE_SIZE = 20000
+FILE_ID_CACHE_TTL = 30 * 24 * 60 * 60
+
+# кэш результатов properties/v2/list: размер, время актуальности (сек) и время (сек),
+# в течение которого устаревший результат отдаётся, пока запрашивается новый
+SEARCH_CACHE_SIZE = 500
+SEARCH_CACHE_TTL = 5 * 60
+SEARCH_CACHE_STALE_TTL = 15 * 60
+# /lowprice и /highprice всегда запрашивают столько отелей, сколько можно выбрать (7), и показывают первые:
+# поиски с разным числом отелей (и прогрев) используют один результат в кэше
+LIST_RESULTS_SIZE = 7
+
+# упреждающая загрузка результатов, пока пользователь отвечает на вопрос о фото: число потоков,
+# сколько первых отелей загружать (детали) и для скольких чатов хранить сведения о загрузке
+PREFETCH_WORKERS = 2
+PREFETCH_DETAILS = 7
+PREFETCH_MAX_CHATS = 1000
+
+# прогрев кэшей по истории поисков за WARMUP_HISTORY_DAYS дней: при запуске и затем каждые WARMUP_INTERVAL сек
+# (0 — только при запуске; с BOT_PROCESSES > 1 всегда только при запуске, до запуска рабочих процессов);
+# число направлений, отелей с деталями на направление
+# и лимит запросов к API за один прогрев
+WARMUP_ENABLED = True
+WARMUP_INTERVAL = 60 * 60
+WARMUP_HISTORY_DAYS = 30
+WARMUP_DESTINATIONS = 10
+WARMUP_DETAILS = 3
+WARMUP_API_BUDGET = 40
+
+# бюджет запросов к hotels4 (RapidAPI) для каждого метода: (в минуту, в сутки)
+QUOTA_LIMITS = {'locations': (30, 500), 'list': (30, 1000), 'detail': (60, 3000)}
+# доля бюджета, доступная запросам: пользователя, упреждающей загрузки, прогрева кэшей
+QUOTA_SHARES = (1.0, 0.6, 0.3)
+# доля использованного бюджета деталей, с которой показывается одно фото, и с которой детали не запрашиваются
+# (карточка строится по данным списка)
+QUOTA_FEWER_PICTURES = 0.7
+QUOTA_LIST_ONLY = 0.9
+# как часто (в секундах) суточные счётчики запросов записываются в history.db
+QUOTA_FLUSH_INTERVAL = 10
@@ -1 +1,4 @@
 from . import classes
+from . import writer
+from . import maintenance
+from . import state_storage
@@ -1,6 +1,9 @@
-from peewee import SqliteDatabase, Model, CharField, IntegerField, ForeignKeyField
+from peewee import SqliteDatabase, Model, CharField, IntegerField, SmallIntegerField, DateField, ForeignKeyField, \
+    TextField, CompositeKey
 
-db = SqliteDatabase('history.db')
+# WAL: запись истории не блокирует чтение, synchronous=normal убирает fsync на каждой транзакции,
+# foreign_keys включает каскадное удаление отелей поиска
+db = SqliteDatabase('history.db', pragmas={'journal_mode': 'wal', 'synchronous': 'normal', 'foreign_keys': 1})
 
 class BaseModel(Model):
     """
@@ -10,25 +13,84 @@ class BaseModel(Model):
         database = db
 
 
-class User(BaseModel):
+class Search(BaseModel):
     """
-    User table class
+    Search table class (one row per search of a user, with the search parameters)
     """
     class Meta:
-        db_table = 'users'
-    command = CharField()
-    date = CharField()
+        db_table = 'searches'
+        # /history читает страницы поисков пользователя по searches.id (keyset pagination)
+        indexes = ((('user_id', 'id'), False),)
     user_id = IntegerField()
+    # по времени поиска выбираются старые поиски (compact_history) и поиски для прогрева кэшей (warmup)
+    created = IntegerField(index=True)
+    command = CharField()
+    query = CharField(null=True)
+    region_id = CharField(null=True)
+    check_in = DateField(null=True)
+    check_out = DateField(null=True)
+    adults = SmallIntegerField(null=True)
+    price_min = IntegerField(null=True)
+    price_max = IntegerField(null=True)
 
 
-class Hotel(BaseModel):
+class Property(BaseModel):
     """
-    Hotel table class
+    Property table class (hotels.com properties shown to the users, stored once)
     """
     class Meta:
-        db_table = 'hotels'
+        db_table = 'properties'
+    id = CharField(primary_key=True)
     name = CharField()
     address = CharField()
-    req = ForeignKeyField(User, related_name='hotels')
 
 
+class SearchProperty(BaseModel):
+    """
+    Table class of the properties shown in a search, in display order
+    """
+    class Meta:
+        db_table = 'search_properties'
+        primary_key = CompositeKey('search', 'position')
+    search = ForeignKeyField(Search, backref='properties', on_delete='CASCADE', index=False)
+    position = SmallIntegerField()
+    property = ForeignKeyField(Property)
+
+
+class CacheEntry(BaseModel):
+    """
+    Cache table class (second tier of the API response caches)
+    """
+    class Meta:
+        db_table = 'cache'
+        primary_key = CompositeKey('namespace', 'key')
+    namespace = CharField()
+    key = CharField()
+    value = TextField()
+    expires = IntegerField(index=True)
+
+
+class QuotaEntry(BaseModel):
+    """
+    Quota table class (hotels4 calls of an endpoint in a day (UTC), kept across restarts)
+    """
+    class Meta:
+        db_table = 'quota'
+        primary_key = CompositeKey('endpoint', 'day')
+    endpoint = CharField()
+    day = IntegerField()
+    calls = IntegerField()
+
+
+class StateEntry(BaseModel):
+    """
+    Conversation state table class (state and data of a user in a chat)
+    """
+    class Meta:
+        db_table = 'states'
+        primary_key = CompositeKey('chat_id', 'user_id')
+    chat_id = IntegerField()
+    user_id = IntegerField()
+    state = CharField(null=True)
+    data = TextField()
+    expires = IntegerField(index=True)
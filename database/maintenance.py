@@ -0,0 +1,116 @@
+import hashlib
+import threading
+import time
+from datetime import datetime
+from peewee import chunked
+from .classes import db, Search, Property, SearchProperty, CacheEntry, StateEntry
+from loguru import logger
+
+LEGACY_DATE_FORMAT = '%d.%m.%Y - %H:%M:%S'
+
+
+def legacy_property_id(name, address):
+    """
+    Returns a stable property id for a hotel of the legacy schema (which did not store the hotels.com id).
+
+    :param name: str
+    :param address: str
+    :return: str
+    """
+    return 'legacy-' + hashlib.sha1(f'{name}\n{address}'.encode('utf-8')).hexdigest()[:16]
+
+
+def migrate_legacy_history():
+    """
+    Moves the history of the legacy users/hotels tables into the searches/properties tables
+    and drops the legacy tables. Does nothing if there are no legacy tables.
+
+    :return: The number of migrated searches.
+    :rtype: int
+    """
+    tables = db.get_tables()
+    if 'users' not in tables:
+        return 0
+    started = time.perf_counter()
+    with db.atomic():
+        searches = []
+        for search_id, command, date, user_id in db.execute_sql('SELECT id, command, date, user_id FROM users'):
+            created = int(datetime.strptime(date, LEGACY_DATE_FORMAT).timestamp())
+            searches.append({'id': search_id, 'user_id': user_id, 'created': created, 'command': command})
+        for batch in chunked(searches, 100):
+            Search.insert_many(batch).execute()
+        properties = {}
+        links = []
+        positions = {}
+        if 'hotels' in tables:
+            search_ids = {search['id'] for search in searches}
+            for name, address, search_id in db.execute_sql('SELECT name, address, req_id FROM hotels ORDER BY id'):
+                if search_id not in search_ids:
+                    continue
+                property_id = legacy_property_id(name, address)
+                properties[property_id] = {'id': property_id, 'name': name, 'address': address}
+                position = positions.get(search_id, 0)
+                positions[search_id] = position + 1
+                links.append({'search': search_id, 'position': position, 'property': property_id})
+        for batch in chunked(list(properties.values()), 100):
+            Property.insert_many(batch).on_conflict_ignore().execute()
+        for batch in chunked(links, 100):
+            SearchProperty.insert_many(batch).execute()
+        db.execute_sql('DROP TABLE IF EXISTS hotels')
+        db.execute_sql('DROP TABLE users')
+    db.execute_sql('VACUUM')
+    logger.info(f'Migrated {len(searches)} searches and {len(links)} hotels of the legacy history '
+                f'in {time.perf_counter() - started:.2f} s')
+    return len(searches)
+
+
+def compact_history(retention_days):
+    """
+    Deletes the searches older than retention_days, the properties no longer referenced,
+    the expired cache entries and abandoned conversation states, then checkpoints the WAL file.
+
+    :param retention_days: int (0 keeps all searches)
+    :return: The number of deleted searches.
+    :rtype: int
+    """
+    now = int(time.time())
+    deleted = 0
+    with db.atomic():
+        if retention_days:
+            cutoff = now - retention_days * 24 * 60 * 60
+            old_searches = Search.select(Search.id).where(Search.created < cutoff)
+            SearchProperty.delete().where(SearchProperty.search.in_(old_searches)).execute()
+            deleted = Search.delete().where(Search.created < cutoff).execute()
+        Property.delete().where(Property.id.not_in(SearchProperty.select(SearchProperty.property))).execute()
+        CacheEntry.delete().where(CacheEntry.expires < now).execute()
+        if StateEntry.table_exists():
+            StateEntry.delete().where(StateEntry.expires < now).execute()
+    db.execute_sql('PRAGMA wal_checkpoint(TRUNCATE)')
+    logger.info(f'History compaction: {deleted} searches deleted')
+    return deleted
+
+
+def start_compaction(retention_days, interval):
+    """
+    Starts a background thread running compact_history every interval seconds.
+
+    :param retention_days: int
+    :param interval: int (seconds)
+    :return: threading.Event (set it to stop the thread)
+    """
+    stopped = threading.Event()
+
+    def work():
+        while not stopped.wait(interval):
+            try:
+                compact_history(retention_days)
+            except Exception as e:
+                logger.exception(f'History compaction failed: {e}')
+
+    threading.Thread(target=work, name='history-compaction', daemon=True).start()
+    return stopped
+
+
+if __name__ == '__main__':
+    db.create_tables([Search, Property, SearchProperty, CacheEntry], safe=True)
+    migrate_legacy_history()
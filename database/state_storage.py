@@ -0,0 +1,166 @@
+import json
+import time
+from datetime import date
+from telebot.storage import StateStorageBase, StateContext, StateMemoryStorage, StateRedisStorage
+from .classes import db, StateEntry
+
+
+def encode_value(value):
+    """
+    Encodes the values json does not support (dates of the search).
+
+    :param value: date
+    :return: dict
+    """
+    if isinstance(value, date):
+        return {'$date': value.toordinal()}
+    raise TypeError(f'{type(value).__name__} is not serializable')
+
+
+def decode_value(value):
+    """
+    Restores the values encoded by encode_value.
+
+    :param value: dict
+    :return: date or dict
+    """
+    if len(value) == 1 and '$date' in value:
+        return date.fromordinal(value['$date'])
+    return value
+
+
+def dump_state(value):
+    """
+    Serializes the state data to compact JSON.
+
+    :param value: dict
+    :return: str
+    """
+    return json.dumps(value, separators=(',', ':'), default=encode_value)
+
+
+def load_state(text):
+    """
+    Deserializes the state data stored by dump_state.
+
+    :param text: str
+    :return: dict
+    """
+    return json.loads(text, object_hook=decode_value)
+
+
+class SqliteStateStorage(StateStorageBase):
+    """
+    class contains the conversation states stored in the states table of history.db.
+    The states survive restarts and are shared by all bot processes using the same file.
+    States not updated for ttl seconds are treated as abandoned.
+    """
+    def __init__(self, ttl):
+        super().__init__()
+        self.ttl = ttl
+        db.create_tables([StateEntry], safe=True)
+
+    def _get(self, chat_id, user_id):
+        return (StateEntry.select()
+                .where(StateEntry.chat_id == chat_id, StateEntry.user_id == user_id,
+                       StateEntry.expires >= int(time.time()))
+                .first())
+
+    def _update(self, chat_id, user_id, **fields):
+        return StateEntry.update(expires=int(time.time()) + self.ttl, **fields).where(
+            StateEntry.chat_id == chat_id, StateEntry.user_id == user_id,
+            StateEntry.expires >= int(time.time())).execute() > 0
+
+    def set_state(self, chat_id, user_id, state):
+        if hasattr(state, 'name'):
+            state = state.name
+        if not self._update(chat_id, user_id, state=state):
+            StateEntry.replace(chat_id=chat_id, user_id=user_id, state=state, data='{}',
+                               expires=int(time.time()) + self.ttl).execute()
+        return True
+
+    def delete_state(self, chat_id, user_id):
+        return StateEntry.delete().where(StateEntry.chat_id == chat_id, StateEntry.user_id == user_id).execute() > 0
+
+    def get_state(self, chat_id, user_id):
+        entry = self._get(chat_id, user_id)
+        return entry.state if entry else None
+
+    def get_data(self, chat_id, user_id):
+        entry = self._get(chat_id, user_id)
+        return load_state(entry.data) if entry else None
+
+    def reset_data(self, chat_id, user_id):
+        return self._update(chat_id, user_id, data='{}')
+
+    def set_data(self, chat_id, user_id, key, value):
+        # запись начинается сразу: чтение в отложенной транзакции не может перейти в запись,
+        # если другой поток или процесс успел изменить базу (database is locked)
+        with db.atomic('IMMEDIATE'):
+            data = self.get_data(chat_id, user_id)
+            if data is None:
+                raise RuntimeError('chat_id {} and user_id {} does not exist'.format(chat_id, user_id))
+            data[key] = value
+            return self._update(chat_id, user_id, data=dump_state(data))
+
+    def get_interactive_data(self, chat_id, user_id):
+        return StateContext(self, chat_id, user_id)
+
+    def save(self, chat_id, user_id, data):
+        return self._update(chat_id, user_id, data=dump_state(data))
+
+
+class RedisStateStorage(StateRedisStorage):
+    """
+    class contains the conversation states stored in Redis (or a Redis-compatible server),
+    serialized with dump_state and expiring after ttl seconds without updates
+    """
+    def __init__(self, ttl, **kwargs):
+        super().__init__(**kwargs)
+        self.ttl = ttl
+
+    def get_record(self, key):
+        connection = self.connection()
+        result = connection.get(self.prefix + str(key))
+        connection.close()
+        if result:
+            return load_state(result)
+        return None
+
+    def set_record(self, key, value):
+        connection = self.connection()
+        connection.set(self.prefix + str(key), dump_state(value), ex=self.ttl)
+        connection.close()
+        return True
+
+    def delete_record(self, key):
+        connection = self.connection()
+        connection.delete(self.prefix + str(key))
+        connection.close()
+        return True
+
+    def connection(self):
+        """
+            Returns a connection of the Redis connection pool.
+
+            :return: redis.Redis
+        """
+        from redis import Redis
+        return Redis(connection_pool=self.redis)
+
+
+def create_state_storage(backend, ttl, redis_host='localhost', redis_port=6379):
+    """
+    Creates the conversation state storage of the bot.
+
+    :param backend: str (memory, sqlite or redis)
+    :param ttl: int (seconds after which an abandoned conversation expires, sqlite and redis only)
+    :param redis_host: str
+    :param redis_port: int
+    :return: StateStorageBase
+    """
+    if backend == 'sqlite':
+        return SqliteStateStorage(ttl=ttl)
+    if backend == 'redis':
+        return RedisStateStorage(ttl=ttl, host=redis_host, port=redis_port)
+    return StateMemoryStorage()
@@ -0,0 +1,143 @@
+import queue
+import threading
+import time
+from peewee import chunked
+from .classes import db, Search, Property, SearchProperty
+from config_data.config import HISTORY_BATCH_SIZE
+from loguru import logger
+
+
+def write_searches(searches):
+    """
+    Writes searches with their properties in a single transaction (one commit for the whole batch).
+    Properties already stored are updated in place, so each property is stored once.
+    A property without an address (card built from the list data) never overwrites a stored property.
+
+    :param searches: list of (search columns, list of (property id, name, address or None))
+    :return: None
+    """
+    properties = {}
+    links = []
+    with db.atomic():
+        for columns, hotels in searches:
+            search_id = Search.insert(**columns).execute()
+            for position, (property_id, name, address) in enumerate(hotels):
+                if address is not None or property_id not in properties:
+                    properties[property_id] = {'id': property_id, 'name': name, 'address': address}
+                links.append({'search': search_id, 'position': position, 'property': property_id})
+        complete = [row for row in properties.values() if row['address'] is not None]
+        partial = [dict(row, address='') for row in properties.values() if row['address'] is None]
+        for batch in chunked(complete, 100):
+            (Property.insert_many(batch)
+             .on_conflict(conflict_target=[Property.id], preserve=[Property.name, Property.address])
+             .execute())
+        for batch in chunked(partial, 100):
+            Property.insert_many(batch).on_conflict_ignore().execute()
+        for batch in chunked(links, 100):
+            SearchProperty.insert_many(batch).execute()
+
+
+def search_columns(user_id, command, created, search, query=None):
+    """
+    Returns the searches table columns of a search.
+
+    :param user_id: int
+    :param command: str
+    :param created: int (Unix time of the search)
+    :param search: SearchRequest (parameters of the search)
+    :param query: str (location entered by the user)
+    :return: dict
+    """
+    return {'user_id': user_id, 'created': created, 'command': command, 'query': query,
+            'region_id': search.region_id, 'check_in': search.check_in, 'check_out': search.check_out,
+            'adults': search.adults, 'price_min': search.price_min, 'price_max': search.price_max}
+
+
+class HistoryWriter:
+    """
+    class contains the write-behind queue of the search history.
+    Searches are written by a background thread in batches, until start() is called
+    they are written synchronously by the calling thread.
+    """
+    def __init__(self, batch_size):
+        self.batch_size = batch_size
+        self.queue = queue.Queue()
+        self.thread = None
+        self.written = 0
+        self.batches = 0
+        self.write_time = 0.0
+
+    def start(self):
+        """
+            Starts the background writer thread.
+
+            :return: None
+        """
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._work, name='history-writer', daemon=True)
+            self.thread.start()
+            logger.info('History writer started')
+
+    def add_search(self, columns, hotels):
+        """
+            Records a search with the hotels shown to the user.
+
+            :param columns: dict (result of search_columns)
+            :param hotels: list of (property id, name, address)
+            :return: None
+        """
+        search = (columns, list(hotels))
+        if self.thread is None:
+            self._write([search])
+        else:
+            self.queue.put(search)
+
+    def stop(self):
+        """
+            Writes the queued searches and stops the background thread.
+
+            :return: None
+        """
+        if self.thread is None:
+            return
+        self.queue.put(None)
+        self.thread.join()
+        self.thread = None
+        logger.info(f'History writer stopped: {self.stats()}')
+
+    def _work(self):
+        stopping = False
+        while not stopping:
+            searches = [self.queue.get()]
+            while len(searches) < self.batch_size:
+                try:
+                    searches.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            if None in searches:
+                stopping = True
+                searches = [search for search in searches if search is not None]
+            if searches:
+                try:
+                    self._write(searches)
+                except Exception as e:
+                    logger.exception(f'History write failed: {e}')
+
+    def _write(self, searches):
+        started = time.perf_counter()
+        write_searches(searches)
+        self.write_time += time.perf_counter() - started
+        self.written += len(searches)
+        self.batches += 1
+
+    def stats(self):
+        """
+            Returns the number of written searches and batches, the write rate and the queue depth.
+
+            :return: dict
+        """
+        return {'searches': self.written, 'batches': self.batches, 'queued': self.queue.qsize(),
+                'searches_per_second': self.written / self.write_time if self.write_time else 0.0}
+
+
+history_writer = HistoryWriter(batch_size=HISTORY_BATCH_SIZE)
@@ -1,11 +1,17 @@
 from telebot import types
 import requests
-from datetime import date, timedelta
+import time
+from datetime import timedelta
 from telegram_bot_calendar import DetailedTelegramCalendar
-from loader import bot
+from loader import bot, BOT_RUNTIME
 from states.states_classes import BestState
-from api_seq.api import API, list_cities, make_api_request1, make_api_request
+from api_seq.api import list_cities, search_rejected, make_api_request1, make_paged_api_request, prefetcher
+from api_seq.search_request import SearchRequest
+from api_seq.quota import QuotaExceeded
+from api_seq.async_api import submit_search
 from universal_functions.functions import check_hotels
+from universal_functions.ranking import best_hotels
+from config_data.config import BESTDEAL_PAGE_SIZE, BESTDEAL_MAX_RESULTS
 from keyboards.reply import pictures_question, calendar_part1, calendar_part2
 from loguru import logger
 
@@ -21,10 +27,9 @@ def bestdeal_selected(message: types.Message) -> None:
     """
     bot.set_state(user_id=message.from_user.id, state=BestState.location, chat_id=message.chat.id)
     logger.info('Command /bestdeal. Starting state.')
-    API.payload_list['resultsSize'] = 400
-    API.payload_list['sort'] = "PRICE_LOW_TO_HIGH"
     with bot.retrieve_data(user_id=message.from_user.id, chat_id=message.chat.id) as data:
         data['command'] = message.text
+        data['sort'] = 'PRICE_LOW_TO_HIGH'
     bot.send_message(chat_id=message.chat.id, text='Please enter a location:')
 
 
@@ -56,7 +61,6 @@ def bestdeal_request_hotels(call):
     region_id = call.data.strip('bestdeal')
     with bot.retrieve_data(user_id=call.from_user.id, chat_id=call.message.chat.id) as data:
         data['regionId'] = region_id
-    API.payload_list['destination']['regionId'] = data['regionId']
     bot.set_state(user_id=call.from_user.id, state=BestState.minp, chat_id=call.message.chat.id)
     bot.delete_message(chat_id=call.message.chat.id, message_id=call.message.id)
     bot.send_message(chat_id=call.from_user.id, text='Please enter the minimum price for your search:')
@@ -92,7 +96,6 @@ def bestdeal_minprice(message: types.Message) -> None:
         bot.set_state(user_id=message.from_user.id, state=BestState.maxp, chat_id=message.chat.id)
         with bot.retrieve_data(user_id=message.from_user.id, chat_id=message.chat.id) as data:
             data['price_min'] = message.text
-            API.payload_list['filters']['price']['min'] = int(data['price_min'])
         logger.info('Saving the minimum price')
     else:
         bot.send_message(chat_id=message.chat.id, text='Incorrect input. Please enter digits only:')
@@ -115,7 +118,6 @@ def bestdeal_maxprice(message: types.Message) -> None:
                 bot.send_message(chat_id=message.chat.id, text='Please enter the minimum distance from center:')
                 bot.set_state(user_id=message.from_user.id, state=BestState.mind, chat_id=message.chat.id)
                 data['price_max'] = message.text
-                API.payload_list['filters']['price']['max'] = int(data['price_max'])
                 logger.info('Saving the maximum price')
             else:
                 bot.send_message(chat_id=message.chat.id,
@@ -200,7 +202,6 @@ def bestdeal_start_calendar(message: types.Message) -> None:
         calendar_part1(message, 5)
         with bot.retrieve_data(user_id=message.from_user.id, chat_id=message.chat.id) as data:
             data['people_count'] = message.text
-            API.payload_list['rooms'][0]['adults'] = int(data['people_count'])
         logger.info('Saving the number of guests.')
     else:
         bot.send_message(chat_id=message.chat.id, text='Incorrect input. Please enter digits only:')
@@ -212,7 +213,7 @@ def bestdeal_handle_calendar(call):
     """
         Calls the second part of the calendar and gets the check-in date.
         Calls the first part of the calendar, passing it the ID to get the check-out date.
-        Sets the min_date (API class).
+        Saves the check-in date to the user's state data.
 
         :param call: The callback object representing the user's interaction.
         :type call: telebot.types.CallbackQuery
@@ -220,18 +221,12 @@ def bestdeal_handle_calendar(call):
     """
     res = calendar_part2(call, 5)
     if res:
-        date_list = str(res).split('-')
         with bot.retrieve_data(user_id=call.from_user.id, chat_id=call.message.chat.id) as data:
-            data['date_in'] = {'d': date_list[2], 'm': date_list[1], 'y': date_list[0]}
             data['date_check_in'] = res
-            API.min_date = date(int(data['date_in']['y']), int(data['date_in']['m']), int(data['date_in']['d']))
-            API.payload_list['checkInDate']['day'] = int(data['date_in']['d'])
-            API.payload_list['checkInDate']['month'] = int(data['date_in']['m'])
-            API.payload_list['checkInDate']['year'] = int(data['date_in']['y'])
         logger.info('Saving the check-in date.')
         bot.send_message(chat_id=call.from_user.id, text='Please enter the check-out date:')
-        calendar_part1(message=call.message, cal_id=6, min_date=API.min_date + timedelta(days=1),
-                       max_date=API.min_date + timedelta(days=180))
+        calendar_part1(message=call.message, cal_id=6, min_date=res + timedelta(days=1),
+                       max_date=res + timedelta(days=180))
 
 
 @logger.catch()
@@ -240,29 +235,43 @@ def bestdeal_end_calendar(call):
     """
         Gets the check-out date and completes working with the calendar.
         Calculates the total number of days of stay.
+        Starts loading the hotels in the background (prefetcher).
         Sends a request to the user about the need for pictures.
 
         :param call: The callback object representing the user's interaction.
         :type call: telebot.types.CallbackQuery
         :return: None
     """
-    res = calendar_part2(call, 6, min_date=API.min_date + timedelta(days=1),
-                         max_date=API.min_date + timedelta(days=180))
+    with bot.retrieve_data(user_id=call.from_user.id, chat_id=call.message.chat.id) as data:
+        min_date = data['date_check_in']
+    res = calendar_part2(call, 6, min_date=min_date + timedelta(days=1),
+                         max_date=min_date + timedelta(days=180))
     if res:
-        date_list = str(res).split('-')
         with bot.retrieve_data(user_id=call.from_user.id, chat_id=call.message.chat.id) as data:
-            data['date_out'] = {'d': date_list[2], 'm': date_list[1], 'y': date_list[0]}
             data['date_check_out'] = res
             delta = data['date_check_out'] - data['date_check_in']
             data['total_days'] = delta.days
-            API.payload_list['checkOutDate']['day'] = int(data['date_out']['d'])
-            API.payload_list['checkOutDate']['month'] = int(data['date_out']['m'])
-            API.payload_list['checkOutDate']['year'] = int(data['date_out']['y'])
+        search, best_data = SearchRequest.from_data(data), dict(data)
+        prefetcher.start(call.message.chat.id, load_hotels=lambda: load_best_hotels(search, best_data),
+                         count=int(data['hotels_count']))
         logger.info('Saving the check-out date and requesting if pictures needed.')
         pic_markup = pictures_question('get3')
         bot.send_message(chat_id=call.from_user.id, text='Would you like to see pictures of the hotels?', reply_markup=pic_markup)
 
 
+def load_best_hotels(search, data):
+    """
+        Requests the hotels page by page and ranks them (the hotels loaded by the prefetcher).
+
+        :param search: SearchRequest (parameters of the user's search)
+        :param data: dict (copy of the state data)
+        :return: The best hotels in display order if found, None otherwise.
+        :rtype: list or None
+    """
+    get_data = make_paged_api_request(search, page_size=BESTDEAL_PAGE_SIZE, max_results=BESTDEAL_MAX_RESULTS)
+    return best_hotels(get_data, data) if get_data else None
+
+
 @logger.catch()
 @bot.callback_query_handler(func=lambda call: call.data.startswith('get3'))
 def bestdeal_photo_handler(call: types.CallbackQuery):
@@ -282,7 +291,7 @@ def bestdeal_photo_handler(call: types.CallbackQuery):
 def bestdeal_photos_question(call, photos_needed):
     """
         Handles the user's response.
-        Sends a request to the API through the make_api_request and make_api_request1 functions if photos are not needed.
+        Sends a request to the API through the make_paged_api_request and make_api_request1 functions if photos are not needed.
         If photos are needed, changes the state and proceeds to the bestdeal_pictures_confirmed function.
 
         :param call: The callback object representing the user's interaction.
@@ -299,30 +308,24 @@ def bestdeal_photos_question(call, photos_needed):
         logger.info('No need of pictures. Requesting API.')
         with bot.retrieve_data(user_id=call.from_user.id, chat_id=call.message.chat.id) as data:
             data['pictures_question'] = 0
-        get_data = make_api_request()
-        if not get_data:
-            bot.send_message(chat_id=call.message.chat.id, text='Hotels are not found.')
-            logger.error('Hotels are not found. Ending the state.')
+        started = time.perf_counter()
+        if BOT_RUNTIME == 'async':
+            submit_search(message=call.message, data=data, user_id=call.from_user.id, started=started, best=True)
         else:
-            id_price = dict()
-            distance = list()
-            for i in get_data:
-                i['price']['options'][0]['formattedDisplayPrice'] = i['price']['options'][0][
-                    'formattedDisplayPrice'].replace(',', '.') if ',' in i['price']['options'][0][
-                    'formattedDisplayPrice'] else i['price']['options'][0]['formattedDisplayPrice']
-            get_list = list(filter(lambda elem: is_hotel_in_range(elem, int(data['price_min']), int(data['price_max']),
-                                                                  float(data['distance_min']),
-                                                                  float(data['distance_max'])), get_data))
-            if len(get_list) >= int(data['hotels_count']):
-                length = int(data['hotels_count'])
+            try:
+                get_data = make_paged_api_request(SearchRequest.from_data(data), page_size=BESTDEAL_PAGE_SIZE,
+                                                  max_results=BESTDEAL_MAX_RESULTS)
+            except QuotaExceeded as e:
+                search_rejected(chat_id=call.message.chat.id, error=e)
             else:
-                length = len(get_list)
-                bot.send_message(call.message.chat.id, text=f'{length} offers found according to your filters.')
-            for hotel in range(length):
-                id_price[get_list[hotel]['id']] = get_list[hotel]['price']['options'][0]['formattedDisplayPrice']
-                distance.append(get_list[hotel]['destinationInfo']['distanceFromDestination']['value'])
-            make_api_request1(message=call.message, id_price=id_price, distance=distance, data=data,
-                              user_id=call.from_user.id)
+                if not get_data:
+                    bot.send_message(chat_id=call.message.chat.id, text='Hotels are not found.')
+                    logger.error('Hotels are not found. Ending the state.')
+                else:
+                    length = make_api_request1(message=call.message, hotels=best_hotels(get_data, data), data=data,
+                                               user_id=call.from_user.id, started=started)
+                    if length < int(data['hotels_count']):
+                        bot.send_message(call.message.chat.id, text=f'{length} offers found according to your filters.')
         bot.delete_state(call.from_user.id, call.message.chat.id)
 
 
@@ -330,7 +333,7 @@ def bestdeal_photos_question(call, photos_needed):
 @bot.message_handler(state=BestState.pictures_count)
 def bestdeal_pictures_confirmed(message: types.Message) -> None:
     """
-        Sends a request to the API through the make_api_request and make_api_request1 functions and displays hotels.
+        Sends a request to the API through the make_paged_api_request and make_api_request1 functions and displays hotels.
 
         :param message: The user's message.
         :type message: telebot.types.Message
@@ -339,56 +342,25 @@ def bestdeal_pictures_confirmed(message: types.Message) -> None:
     if message.text.isdigit() and 0 < int(message.text) <= 3:
         with bot.retrieve_data(user_id=message.from_user.id, chat_id=message.chat.id) as data:
             data['pictures_question'] = message.text
-        get_data = make_api_request()
-        if not get_data:
-            bot.send_message(chat_id=message.chat.id, text='Hotels are not found.')
-            logger.error('Hotels are not found. Ending the state.')
+        started = time.perf_counter()
+        if BOT_RUNTIME == 'async':
+            submit_search(message=message, data=data, user_id=message.from_user.id, started=started, best=True)
         else:
-            id_price = dict()
-            distance = list()
-            logger.info('Requesting API.')
-            for i in get_data:
-                i['price']['options'][0]['formattedDisplayPrice'] = i['price']['options'][0][
-                    'formattedDisplayPrice'].replace(',', '.') if ',' in i['price']['options'][0][
-                    'formattedDisplayPrice'] else i['price']['options'][0]['formattedDisplayPrice']
-            get_list = list(filter(lambda elem: is_hotel_in_range(elem, int(data['price_min']), int(data['price_max']),
-                                                                  float(data['distance_min']),
-                                                                  float(data['distance_max'])), get_data))
-            if len(get_list) >= int(data['hotels_count']):
-                length = int(data['hotels_count'])
+            try:
+                get_data = make_paged_api_request(SearchRequest.from_data(data), page_size=BESTDEAL_PAGE_SIZE,
+                                                  max_results=BESTDEAL_MAX_RESULTS)
+            except QuotaExceeded as e:
+                search_rejected(chat_id=message.chat.id, error=e)
             else:
-                length = len(get_list)
-                bot.send_message(message.chat.id, text=f'{length} offers found according to your filters.')
-            for hotel in range(length):
-                id_price[get_list[hotel]['id']] = get_list[hotel]['price']['options'][0]['formattedDisplayPrice']
-                distance.append(get_list[hotel]['destinationInfo']['distanceFromDestination']['value'])
-            make_api_request1(message=message, id_price=id_price, distance=distance, data=data,
-                              user_id=message.from_user.id)
+                if not get_data:
+                    bot.send_message(chat_id=message.chat.id, text='Hotels are not found.')
+                    logger.error('Hotels are not found. Ending the state.')
+                else:
+                    logger.info('Requesting API.')
+                    length = make_api_request1(message=message, hotels=best_hotels(get_data, data), data=data,
+                                               user_id=message.from_user.id, started=started)
+                    if length < int(data['hotels_count']):
+                        bot.send_message(message.chat.id, text=f'{length} offers found according to your filters.')
         bot.delete_state(message.from_user.id, message.chat.id)
     else:
         bot.send_message(chat_id=message.chat.id, text='Incorrect input. Please enter digits only:')
-
-
-def is_hotel_in_range(hotel, price_min, price_max, distance_min, distance_max):
-    """
-        Checks whether a hotel is within specified price and distance ranges.
-
-        :param hotel: A dictionary containing hotel information.
-        :type hotel: dict
-        :param price_min: The minimum price.
-        :type price_min: float
-        :param price_max: The maximum price.
-        :type price_max: float
-        :param distance_min: The minimum distance to the destination.
-        :type distance_min: float
-        :param distance_max: The maximum distance to the destination.
-        :type distance_max: float
-        :return: True if the hotel is within the price and distance ranges, otherwise False.
-        :rtype: bool
-    """
-    price = float(hotel['price']['options'][0]['formattedDisplayPrice'].strip('$'))
-    distance = float(hotel['destinationInfo']['distanceFromDestination']['value'])
-    return price_min <= price <= price_max and distance_min <= distance <= distance_max
-
-
-
@@ -1,17 +1,19 @@
 from loader import bot
+from api_seq.api import prefetcher
 from loguru import logger
 
 
 @bot.message_handler(commands=['help'])
 def help_user(message) -> None:
     """
-    Function to end any user state and provide a list of available bot commands.
+    Function to end any user state (and the prefetch of the chat) and provide a list of available bot commands.
 
     :param message: The message object representing the user's command.
     :type message: telebot.types.Message
     :return: None
     """
     bot.delete_state(message.from_user.id, message.chat.id)
+    prefetcher.cancel(message.chat.id)
     text = """
     Bot commands:
     /lowprice - Get the cheapest hotels at the chosen location
@@ -1,26 +1,138 @@
+from datetime import datetime
+from itertools import groupby
 from telebot import types
+from peewee import JOIN
 from loader import bot
-from database.classes import User, Hotel
+from database.classes import Search, Property, SearchProperty
+from keyboards.reply import history_keyboard
+from config_data.config import HISTORY_PAGE_SIZE, MESSAGE_MAX_LENGTH
 from loguru import logger
 
 
+def load_history(user_id, before=None, after=None, size=HISTORY_PAGE_SIZE):
+    """
+    Loads one page of the user's searches (newest first) with their hotels.
+    The page is selected by keyset pagination on searches.id, so only the rows of the page are read.
+
+    :param user_id: Telegram id of the user.
+    :type user_id: int
+    :param before: load the searches older than this search id
+    :type before: int or None
+    :param after: load the searches newer than this search id
+    :type after: int or None
+    :param size: maximum number of searches on the page
+    :type size: int
+    :return: list of (search id, command, date, list of (name, address)), newest search first
+    :rtype: list
+    """
+    searches = Search.select(Search.id).where(Search.user_id == user_id)
+    if after is not None:
+        searches = searches.where(Search.id > after).order_by(Search.id)
+    else:
+        if before is not None:
+            searches = searches.where(Search.id < before)
+        searches = searches.order_by(Search.id.desc())
+    rows = (Search
+            .select(Search.id, Search.command, Search.created, Property.name, Property.address)
+            .join(SearchProperty, JOIN.LEFT_OUTER, on=(SearchProperty.search == Search.id))
+            .join(Property, JOIN.LEFT_OUTER, on=(Property.id == SearchProperty.property))
+            .where(Search.id.in_(searches.limit(size)))
+            .order_by(Search.id.desc(), SearchProperty.position)
+            .tuples())
+    history = []
+    for (search_id, command, created), search_rows in groupby(rows, key=lambda row: row[:3]):
+        hotels = [(name, address) for _, _, _, name, address in search_rows if name is not None]
+        date = datetime.fromtimestamp(created).strftime('%d.%m.%Y - %H:%M:%S')
+        history.append((search_id, command, date, hotels))
+    return history
+
+
+def render_history(history, keep_oldest=False):
+    """
+    Renders the searches into one message no longer than MESSAGE_MAX_LENGTH.
+    The searches that do not fit are left for the next page: the oldest ones,
+    or the newest ones with keep_oldest=True (a page of newer searches must start right after the current one).
+
+    :param history: result of load_history
+    :type history: list
+    :param keep_oldest: fill the message from the oldest search
+    :type keep_oldest: bool
+    :return: the message text and the searches it contains, newest first
+    :rtype: tuple
+    """
+    blocks = []
+    length = 0
+    for search in (reversed(history) if keep_oldest else history):
+        _, command, date, hotels = search
+        lines = [f'Command: {command}', f'Date of search: {date}', 'Hotels:']
+        lines.extend(f'- {name}, {address}' for name, address in hotels)
+        block = '\n'.join(lines)
+        if blocks and length + len(block) + 2 > MESSAGE_MAX_LENGTH:
+            break
+        blocks.append((search, block[:MESSAGE_MAX_LENGTH]))
+        length += len(block) + 2
+    if keep_oldest:
+        blocks.reverse()
+    return '\n\n'.join(block for _, block in blocks), [search for search, _ in blocks]
+
+
+def history_page(user_id, before=None, after=None):
+    """
+    Builds a /history page: the message text and the navigation keyboard.
+
+    :param user_id: Telegram id of the user.
+    :type user_id: int
+    :param before: show the searches older than this search id
+    :type before: int or None
+    :param after: show the searches newer than this search id
+    :type after: int or None
+    :return: (text, keyboard), text is None if there are no searches
+    :rtype: tuple
+    """
+    text, history = render_history(load_history(user_id, before=before, after=after), keep_oldest=after is not None)
+    if not history:
+        return None, None
+    newest_id, oldest_id = history[0][0], history[-1][0]
+    user_searches = Search.select().where(Search.user_id == user_id)
+    has_older = user_searches.where(Search.id < oldest_id).exists()
+    has_newer = user_searches.where(Search.id > newest_id).exists()
+    return text, history_keyboard(oldest_id if has_older else None, newest_id if has_newer else None)
+
+
 @logger.catch()
 @bot.message_handler(commands=['history'])
 def get_db(message: types.Message) -> None:
     """
-    Retrieves information from the database and sends it to the chat.
+    Retrieves the latest searches from the database and sends them to the chat as one page.
 
     :param message: The message object representing the user's command.
     :type message: telebot.types.Message
     :return: None
     """
     logger.info('Command /history.')
-    if not User.select().where(User.user_id == message.from_user.id):
+    text, keyboard = history_page(message.from_user.id)
+    if text is None:
         bot.send_message(message.chat.id, text='Data not found')
         logger.error('User history not found')
-    for user in User.select().where(User.user_id == message.from_user.id):
-        bot.send_message(chat_id=message.chat.id, text=f'Command: {user.command}\nDate of search: {user.date}\nHotels:')
+        return
+    bot.send_message(chat_id=message.chat.id, text=text, reply_markup=keyboard)
 
-        for hotel in Hotel.select().where(Hotel.req == user.id):
-            bot.send_message(chat_id=message.chat.id, text=f'Name: {hotel.name}\nAddress: {hotel.address}')
 
+@logger.catch()
+@bot.callback_query_handler(func=lambda call: call.data.startswith('history_'))
+def history_navigation(call: types.CallbackQuery) -> None:
+    """
+    Replaces the /history page with the older or newer searches.
+
+    :param call: The callback query of a navigation button.
+    :type call: telebot.types.CallbackQuery
+    :return: None
+    """
+    _, direction, search_id = call.data.split('_')
+    if direction == 'older':
+        text, keyboard = history_page(call.from_user.id, before=int(search_id))
+    else:
+        text, keyboard = history_page(call.from_user.id, after=int(search_id))
+    bot.answer_callback_query(call.id)
+    if text is not None:
+        bot.edit_message_text(text, call.message.chat.id, call.message.message_id, reply_markup=keyboard)
@@ -1,10 +1,14 @@
 from telebot import types
 import requests
-from datetime import date, timedelta
+import time
+from datetime import timedelta
 from telegram_bot_calendar import DetailedTelegramCalendar
-from loader import bot
+from loader import bot, BOT_RUNTIME
 from states.states_classes import LowState
-from api_seq.api import API, list_cities, make_api_request1, make_api_request
+from api_seq.api import list_cities, search_rejected, make_api_request1, make_api_request, prefetcher
+from api_seq.search_request import SearchRequest
+from api_seq.quota import QuotaExceeded
+from api_seq.async_api import submit_search
 from universal_functions.functions import check_hotels
 from keyboards.reply import pictures_question, calendar_part1, calendar_part2
 from loguru import logger   
@@ -20,12 +24,12 @@ def lowprice_selected(message: types.Message) -> None:
         :return: None
     """
     bot.set_state(user_id=message.from_user.id, state=LowState.location, chat_id=message.chat.id)
-    API.payload_list['filters']['price']['min'] = 10
-    API.payload_list['filters']['price']['max'] = 30000
-    API.payload_list['sort'] = "PRICE_LOW_TO_HIGH"
     logger.info('Command /lowprice. Starting state.')
     with bot.retrieve_data(user_id=message.from_user.id, chat_id=message.chat.id) as data:
         data['command'] = message.text
+        data['sort'] = 'PRICE_LOW_TO_HIGH'
+        data['price_min'] = 10
+        data['price_max'] = 30000
     bot.send_message(chat_id=message.chat.id, text='Please enter a location:')
 
 
@@ -57,7 +61,6 @@ def lowprice_request_hotels(call):
     region_id = call.data.strip('city_id')
     with bot.retrieve_data(user_id=call.from_user.id, chat_id=call.message.chat.id) as data:
         data['regionId'] = region_id
-    API.payload_list['destination']['regionId'] = data['regionId']
     bot.set_state(user_id=call.from_user.id, state=LowState.offers_count, chat_id=call.message.chat.id)
     bot.send_message(chat_id=call.from_user.id, text='How many hotel offers to display? (max 7):')
     logger.info('Saving the city id and requesting the number of offers.')
@@ -106,8 +109,6 @@ def lowprice_start_calendar(message: types.Message) -> None:
         calendar_part1(message, 1)
         with bot.retrieve_data(user_id=message.from_user.id, chat_id=message.chat.id) as data:
             data['people_count'] = message.text
-            API.payload_list['rooms'][0]['adults'] = int(data['people_count'])
-            API.payload_list['resultsSize'] = int(data['hotels_count'])
         logger.info('Saving the number of guests.')
     else:
         bot.send_message(chat_id=message.chat.id, text='Incorrect input. Please enter digits only:')
@@ -119,7 +120,7 @@ def lowprice_handle_calendar(call):
     """
         Calls the second part of the calendar and gets the check-in date.
         Calls the first part of the calendar, passing it the ID to get the check-out date.
-        Sets the min_date (API class).
+        Saves the check-in date to the user's state data.
 
         :param call: The callback object representing the user's interaction.
         :type call: telebot.types.CallbackQuery
@@ -127,17 +128,11 @@ def lowprice_handle_calendar(call):
     """
     res = calendar_part2(call, 1)
     if res:
-        date_list = str(res).split('-')
         with bot.retrieve_data(user_id=call.from_user.id, chat_id=call.message.chat.id) as data:
-            data['date_in'] = {'d': date_list[2], 'm': date_list[1], 'y': date_list[0]}
             data['date_check_in'] = res
-            API.min_date = date(int(data['date_in']['y']), int(data['date_in']['m']), int(data['date_in']['d']))
-            API.payload_list['checkInDate']['day'] = int(data['date_in']['d'])
-            API.payload_list['checkInDate']['month'] = int(data['date_in']['m'])
-            API.payload_list['checkInDate']['year'] = int(data['date_in']['y'])
         logger.info('Saving the check-in date.')
         bot.send_message(chat_id=call.from_user.id, text='Please enter the check-out date:')
-        calendar_part1(message=call.message, cal_id=2, min_date=API.min_date + timedelta(days=1), max_date=API.min_date + timedelta(days=180))
+        calendar_part1(message=call.message, cal_id=2, min_date=res + timedelta(days=1), max_date=res + timedelta(days=180))
 
 
 @logger.catch()
@@ -146,23 +141,24 @@ def lowprice_end_calendar(call):
     """
         Gets the check-out date and completes working with the calendar.
         Calculates the total number of days of stay.
+        Starts loading the hotels in the background (prefetcher).
         Sends a request to the user about the need for pictures.
 
         :param call: The callback object representing the user's interaction.
         :type call: telebot.types.CallbackQuery
         :return: None
     """
-    res = calendar_part2(call, 2, min_date=API.min_date + timedelta(days=1), max_date=API.min_date + timedelta(days=180))
+    with bot.retrieve_data(user_id=call.from_user.id, chat_id=call.message.chat.id) as data:
+        min_date = data['date_check_in']
+    res = calendar_part2(call, 2, min_date=min_date + timedelta(days=1), max_date=min_date + timedelta(days=180))
     if res:
-        date_list = str(res).split('-')
         with bot.retrieve_data(user_id=call.from_user.id, chat_id=call.message.chat.id) as data:
-            data['date_out'] = {'d': date_list[2], 'm': date_list[1], 'y': date_list[0]}
             data['date_check_out'] = res
             delta = data['date_check_out'] - data['date_check_in']
             data['total_days'] = delta.days
-            API.payload_list['checkOutDate']['day'] = int(data['date_out']['d'])
-            API.payload_list['checkOutDate']['month'] = int(data['date_out']['m'])
-            API.payload_list['checkOutDate']['year'] = int(data['date_out']['y'])
+        search = SearchRequest.from_data(data)
+        prefetcher.start(call.message.chat.id, load_hotels=lambda: make_api_request(search),
+                         count=int(data['hotels_count']))
         logger.info('Saving the check-out date and requesting if pictures needed.')
         pic_markup = pictures_question('get1')
         bot.send_message(chat_id=call.from_user.id, text='Would you like to see pictures of the hotels?', reply_markup=pic_markup)
@@ -204,15 +200,21 @@ def lowprice_photos_question(call, photos_needed):
         logger.info('No need of pictures. Requesting API.')
         with bot.retrieve_data(user_id=call.from_user.id, chat_id=call.message.chat.id) as data:
             data['pictures_question'] = 0
-        get_data = make_api_request()
-        if not get_data:
-            bot.send_message(chat_id=call.message.chat.id, text='Hotels are not found.')
-            logger.error('Hotels are not found. Ending the state.')
+        started = time.perf_counter()
+        if BOT_RUNTIME == 'async':
+            submit_search(message=call.message, data=data, user_id=call.from_user.id, started=started)
         else:
-            id_price = {hotel['id']: hotel['price']['options'][0]['formattedDisplayPrice'] for hotel in get_data}
-            distance = [hotel['destinationInfo']['distanceFromDestination']['value'] for hotel in get_data]
-            make_api_request1(message=call.message, id_price=id_price, distance=distance, data=data,
-                              user_id=call.from_user.id)
+            try:
+                get_data = make_api_request(SearchRequest.from_data(data))
+            except QuotaExceeded as e:
+                search_rejected(chat_id=call.message.chat.id, error=e)
+            else:
+                if not get_data:
+                    bot.send_message(chat_id=call.message.chat.id, text='Hotels are not found.')
+                    logger.error('Hotels are not found. Ending the state.')
+                else:
+                    make_api_request1(message=call.message, hotels=get_data, data=data,
+                                      user_id=call.from_user.id, started=started)
         bot.delete_state(call.from_user.id, call.message.chat.id)
 
 
@@ -229,15 +231,22 @@ def lowprice_pictures_confirmed(message: types.Message) -> None:
     if message.text.isdigit() and 0 < int(message.text) <= 3:
         with bot.retrieve_data(user_id=message.from_user.id, chat_id=message.chat.id) as data:
             data['pictures_question'] = message.text
-        get_data = make_api_request()
-        logger.info('Requesting API.')
-        if not get_data:
-            bot.send_message(chat_id=message.chat.id, text='Hotels are not found.')
-            logger.error('Hotels are not found. Ending the state.')
+        started = time.perf_counter()
+        if BOT_RUNTIME == 'async':
+            submit_search(message=message, data=data, user_id=message.from_user.id, started=started)
         else:
-            id_price = {hotel['id']: hotel['price']['options'][0]['formattedDisplayPrice'] for hotel in get_data}
-            distance = [hotel['destinationInfo']['distanceFromDestination']['value'] for hotel in get_data]
-            make_api_request1(message=message, id_price=id_price, distance=distance, data=data, user_id=message.from_user.id)
+            try:
+                get_data = make_api_request(SearchRequest.from_data(data))
+            except QuotaExceeded as e:
+                search_rejected(chat_id=message.chat.id, error=e)
+            else:
+                logger.info('Requesting API.')
+                if not get_data:
+                    bot.send_message(chat_id=message.chat.id, text='Hotels are not found.')
+                    logger.error('Hotels are not found. Ending the state.')
+                else:
+                    make_api_request1(message=message, hotels=get_data, data=data,
+                                      user_id=message.from_user.id, started=started)
         bot.delete_state(message.from_user.id, message.chat.id)
     else:
         bot.send_message(chat_id=message.chat.id, text='Incorrect input. Please enter digits only:')
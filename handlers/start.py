@@ -1,18 +1,20 @@
 from telebot import types
 from loader import bot
+from api_seq.api import prefetcher
 from loguru import logger
 
 
 @bot.message_handler(commands=['start'])
 def start(message: types.Message) -> None:
     """
-    Handler for the /start command, resets the user's state.
+    Handler for the /start command, resets the user's state and cancels the prefetch of the chat.
 
     :param message: The message object representing the user's command.
     :type message: telebot.types.Message
     :return: None
     """
     bot.delete_state(message.from_user.id, message.chat.id)
+    prefetcher.cancel(message.chat.id)
     logger.info('Command /start.')
 
     bot.send_sticker(message.chat.id, 'CAACAgIAAxkBAAIOAmTzyzFZCaDHtp26eViYaUXK5uowAAKoAgACnNbnCoCh_glxM4XJMAQ')
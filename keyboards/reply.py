@@ -74,3 +74,23 @@ def generate_city_keyboard(word, reply):
     else:
         city_keyboard.add(InlineKeyboardButton(text='-Retry search-', callback_data='ireturn'))
     return city_keyboard
+
+
+def history_keyboard(older_id, newer_id):
+    """
+        Creates the navigation keyboard of a /history page.
+
+        :param older_id: int (id of the oldest search on the page, None if there are no older searches)
+        :param newer_id: int (id of the newest search on the page, None if there are no newer searches)
+        :return: InlineKeyboardMarkup or None if there is nothing to navigate to
+    """
+    buttons = []
+    if newer_id is not None:
+        buttons.append(InlineKeyboardButton(text='< Newer', callback_data=f'history_newer_{newer_id}'))
+    if older_id is not None:
+        buttons.append(InlineKeyboardButton(text='Older >', callback_data=f'history_older_{older_id}'))
+    if not buttons:
+        return None
+    history_keyboard = InlineKeyboardMarkup()
+    history_keyboard.add(*buttons)
+    return history_keyboard
@@ -1,13 +1,30 @@
 from telebot import TeleBot
-from telebot.storage import StateMemoryStorage
+from database.state_storage import create_state_storage
 import os
 from dotenv import load_dotenv
+from config_data.config import BOT_NUM_THREADS, STATE_TTL
 
 load_dotenv()
 
 
 TOKEN = os.getenv('BOT_TOKEN')
 API_KEY = os.getenv('API_KEY')
+# sync - поиск выполняется в рабочих потоках бота, async - в событийном цикле asyncio (api_seq/async_api.py)
+BOT_RUNTIME = os.getenv('BOT_RUNTIME', 'sync')
+# если задан WEBHOOK_URL, обновления принимаются локальным HTTP-сервером вместо long polling
+WEBHOOK_URL = os.getenv('WEBHOOK_URL')
+WEBHOOK_HOST = os.getenv('WEBHOOK_HOST', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8443'))
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET')
+# число процессов-обработчиков: при значении больше 1 обновления получает процесс-диспетчер
+# и передаёт каждый чат всегда одному и тому же процессу (long polling, без webhook)
+BOT_PROCESSES = int(os.getenv('BOT_PROCESSES', '1'))
 
-storage = StateMemoryStorage()
-bot = TeleBot(token=TOKEN, state_storage=storage)
+# хранилище состояний диалогов: memory (по умолчанию), sqlite (history.db) или redis,
+# sqlite и redis сохраняют состояния при перезапуске и позволяют запускать несколько процессов бота
+STATE_BACKEND = os.getenv('STATE_BACKEND', 'memory')
+REDIS_HOST = os.getenv('REDIS_HOST', 'localhost')
+REDIS_PORT = int(os.getenv('REDIS_PORT', '6379'))
+
+storage = create_state_storage(STATE_BACKEND, ttl=STATE_TTL, redis_host=REDIS_HOST, redis_port=REDIS_PORT)
+bot = TeleBot(token=TOKEN, state_storage=storage, num_threads=BOT_NUM_THREADS)
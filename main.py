@@ -1,9 +1,21 @@
+import signal
 from telebot import types
 from telebot.custom_filters import StateFilter
-from loader import bot
+from loader import bot, BOT_RUNTIME, BOT_PROCESSES, WEBHOOK_URL, WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_SECRET
 from utils.set_bot_commands import set_default_commands
-from database.classes import db, User, Hotel
+from utils.webhook import run_webhook
+from utils.processes import run_processes
+from utils.sender import outbound
+from config_data.config import WEBHOOK_WORKERS, WEBHOOK_QUEUE_SIZE, HISTORY_WRITE_BEHIND, HISTORY_RETENTION_DAYS, \
+    HISTORY_COMPACT_INTERVAL, WARMUP_ENABLED, WARMUP_INTERVAL
+from urllib.parse import urlparse
+from database.classes import db, Search, Property, SearchProperty, CacheEntry, QuotaEntry
+from database.maintenance import migrate_legacy_history, compact_history, start_compaction
+from database.writer import history_writer
 import handlers
+from api_seq.async_api import shutdown_runtime
+from api_seq.warmup import warmup, start_warmup
+from api_seq.quota import quota
 from loguru import logger
 
 
@@ -20,6 +32,30 @@ def wrong_message(message: types.Message):
         bot.send_message(message.from_user.id, text='Please enter /help to see bot commands.')
 
 
+def stop_bot(signum, frame):
+    """
+        SIGTERM handler: stops the bot like Ctrl+C.
+
+        :param signum: int
+        :param frame: frame
+        :return: None
+    """
+    raise KeyboardInterrupt
+
+
+def stop_worker():
+    """
+        Run by each worker process when it stops (BOT_PROCESSES > 1): stops the async runtime
+        and logs the hits of the worker on the warmed up cache entries.
+
+        :return: None
+    """
+    if BOT_RUNTIME == 'async':
+        shutdown_runtime()
+    if WARMUP_ENABLED:
+        logger.info(f'Warm-up hit rate: {warmup.hit_rate()}')
+
+
 if __name__ == '__main__':
     """
         Starts the bot and handles commands.
@@ -29,6 +65,47 @@ if __name__ == '__main__':
     error_log_handler = logger.add("errors.log", rotation="100 MB", encoding='utf-8', level="ERROR")
     set_default_commands(bot)
     bot.add_custom_filter(StateFilter(bot))
-    if not User.table_exists() or not Hotel.table_exists():
-        db.create_tables([User, Hotel])
-    bot.infinity_polling()
+    # safe=True создаёт недостающие таблицы и индексы, в том числе в существующем history.db
+    db.create_tables([Search, Property, SearchProperty, CacheEntry, QuotaEntry], safe=True)
+    quota.load()
+    migrate_legacy_history()
+    compact_history(HISTORY_RETENTION_DAYS)
+    start_compaction(HISTORY_RETENTION_DAYS, HISTORY_COMPACT_INTERVAL)
+    # SIGTERM останавливает бота так же, как Ctrl+C: очереди дообрабатываются, история записывается
+    signal.signal(signal.SIGTERM, stop_bot)
+    try:
+        if BOT_PROCESSES > 1:
+            # кэши в памяти прогреваются до запуска рабочих процессов и наследуются ими
+            if WARMUP_ENABLED:
+                # у каждого процесса свои кэши в памяти: повторный прогрев в одном процессе не дойдёт до остальных
+                if WARMUP_INTERVAL:
+                    logger.info('Cache warm-up runs once at startup with BOT_PROCESSES > 1, WARMUP_INTERVAL is ignored')
+                warmup.run()
+                # вызовы прогрева записываются до запуска процессов, чтобы не записать их повторно
+                quota.flush()
+            # рабочие процессы сами запускают запись истории и планировщик отправки сообщений
+            run_processes(bot, processes=BOT_PROCESSES, queue_size=WEBHOOK_QUEUE_SIZE, on_exit=stop_worker)
+        else:
+            outbound.start()
+            quota.start()
+            if HISTORY_WRITE_BEHIND:
+                history_writer.start()
+            if WARMUP_ENABLED:
+                start_warmup(warmup, WARMUP_INTERVAL)
+            if WEBHOOK_URL:
+                bot.remove_webhook()
+                bot.set_webhook(url=WEBHOOK_URL, secret_token=WEBHOOK_SECRET)
+                run_webhook(bot, host=WEBHOOK_HOST, port=WEBHOOK_PORT, path=urlparse(WEBHOOK_URL).path or '/',
+                            secret=WEBHOOK_SECRET, workers=WEBHOOK_WORKERS, queue_size=WEBHOOK_QUEUE_SIZE)
+            else:
+                bot.infinity_polling()
+    finally:
+        if BOT_RUNTIME == 'async':
+            shutdown_runtime()
+        history_writer.stop()
+        quota.stop()
+        logger.info(f'Outbound requests: {outbound.stats()}')
+        logger.info(f'hotels4 quota: {quota.stats()}')
+        # с несколькими процессами попадания считаются в рабочих процессах (stop_worker)
+        if WARMUP_ENABLED and BOT_PROCESSES == 1:
+            logger.info(f'Warm-up hit rate: {warmup.hit_rate()}')
@@ -0,0 +1,24 @@
+import os
+
+# loader.py читает настройки из окружения при импорте: бот в тестах не подключается к Telegram
+os.environ.setdefault('BOT_TOKEN', '1:test')
+os.environ.setdefault('API_KEY', 'test')
+os.environ['STATE_BACKEND'] = 'memory'
+os.environ['BOT_PROCESSES'] = '1'
+os.environ.pop('WEBHOOK_URL', None)
+
+import pytest
+from database.classes import db, Search, Property, SearchProperty, CacheEntry, QuotaEntry
+
+
+@pytest.fixture
+def database(tmp_path):
+    """
+        Points history.db to an empty database in a temporary directory.
+    """
+    db.close()
+    db.init(str(tmp_path / 'history.db'), pragmas={'journal_mode': 'wal', 'synchronous': 'normal',
+                                                    'foreign_keys': 1})
+    db.create_tables([Search, Property, SearchProperty, CacheEntry, QuotaEntry])
+    yield db
+    db.close()
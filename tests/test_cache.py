@@ -0,0 +1,186 @@
+import json
+import random
+import threading
+import time
+import requests
+from api_seq import api, session
+from api_seq.quota import quota
+from api_seq.cache import MemoryCache, SqliteCache, TieredCache, RefreshingCache, KeyWatch
+from api_seq.singleflight import SingleFlight
+from database.classes import CacheEntry
+
+
+class SlowLoad:
+    """
+    stub of a list request: counts the calls, each one returns the number of the call
+    """
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        with self._lock:
+            self.calls += 1
+            call = self.calls
+        time.sleep(self.delay)
+        return [call]
+
+
+def test_refreshing_cache_coalesces_concurrent_misses():
+    cache = RefreshingCache(maxsize=10, ttl=60, stale_ttl=60, flight=SingleFlight('test', timeout=5))
+    load = SlowLoad(delay=0.1)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get('key', load))) for _ in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    assert load.calls == 1
+    assert results == [[1]] * 10
+    assert cache.get('key', load) == [1]
+    assert load.calls == 1
+
+
+def test_refreshing_cache_serves_stale_value_while_refreshing():
+    cache = RefreshingCache(maxsize=10, ttl=0, stale_ttl=60, flight=SingleFlight('test', timeout=5))
+    load = SlowLoad()
+    assert cache.get('key', load) == [1]
+    # значение устарело сразу (ttl=0): возвращается старое, новое загружается в фоне
+    assert cache.get('key', load) == [1]
+    deadline = time.time() + 5
+    while cache.peek('key')[0] != [2] and time.time() < deadline:
+        time.sleep(0.01)
+    assert cache.peek('key')[0] == [2]
+    assert cache.stats()['stale_hits'] >= 1
+
+
+def test_refreshing_cache_does_not_store_failed_loads():
+    cache = RefreshingCache(maxsize=10, ttl=60, stale_ttl=60, flight=SingleFlight('test', timeout=5))
+    assert cache.get('key', lambda: None) is None
+    assert cache.peek('key') == (None, False)
+
+
+def test_tiered_cache_promotes_with_remaining_ttl(database):
+    cache = TieredCache(MemoryCache(maxsize=10, ttl=600), SqliteCache('test', maxsize=10, ttl=600))
+    cache.set('key', {'name': 'Hotel'}, ttl=30)
+    cache.first.delete('key')
+    assert cache.get('key') == {'name': 'Hotel'}
+    assert cache.first._data['key'][1] - time.time() <= 30
+
+
+def test_sqlite_cache_stays_near_maxsize(database):
+    cache = SqliteCache('test', maxsize=20, ttl=600)
+    for num in range(100):
+        cache.set(str(num), num)
+    assert cache.stats()['size'] <= cache.maxsize + cache.check_every
+    assert cache.get('99') == 99
+
+
+def test_key_watch_counts_hits_on_watched_keys_only():
+    cache = MemoryCache(maxsize=10, ttl=600)
+    cache.watch = KeyWatch()
+    cache.set('warm', 1)
+    cache.set('cold', 2)
+    cache.watch.watch(['warm'])
+    cache.get('warm')
+    cache.get('warm')
+    cache.get('cold')
+    assert cache.watch.stats() == {'warmed': 1, 'used': 1, 'hits': 2, 'use_rate': 1.0}
+
+
+class LocationsStub:
+    """
+    stub of locations/v3/search: counts the requests, finds one city for each query
+    """
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, method, url, params=None, **kwargs):
+        self.calls += 1
+        reply = requests.Response()
+        reply.status_code = 200
+        reply._content = json.dumps({'sr': [{'type': 'CITY', 'gaiaId': str(len(params['q'])),
+                                             'regionNames': {'fullName': params['q']}}]}).encode()
+        return reply
+
+
+def test_skewed_query_log_replay(monkeypatch):
+    # журнал запросов с распределением Ципфа: несколько городов вводятся намного чаще остальных,
+    # кэш меньше числа городов, так что редкие города вытесняются (LRU)
+    rng = random.Random(7)
+    cities = [f'city{num}' for num in range(300)]
+    weights = [1 / rank ** 1.1 for rank in range(1, len(cities) + 1)]
+    log = [rng.choice((city, city.capitalize(), city.upper())) for city in rng.choices(cities, weights, k=5000)]
+    locations = LocationsStub()
+    monkeypatch.setattr(session, 'request', locations)
+    # промахи не ограничиваются бюджетом hotels4: считается, сколько запросов сэкономил кэш
+    monkeypatch.setattr(quota, 'acquire', lambda endpoint: None)
+    monkeypatch.setattr(api, 'location_cache', MemoryCache(maxsize=100, ttl=600))
+    for query in log:
+        assert api.search_locations(query)[0]['regionNames']['fullName'] == query.capitalize()
+    stats = api.location_cache.stats()
+    saved = len(log) - locations.calls
+    print(f'hit ratio {stats["hit_ratio"]:.1%}, API calls {locations.calls} of {len(log)}, saved {saved}')
+    assert locations.calls == stats['misses']
+    assert stats['hit_ratio'] > 0.75
+
+
+def detail_response(property_id, images):
+    return {'data': {'propertyInfo': {
+        'summary': {'name': f'Hotel {property_id}', 'tagline': 'x' * 500,
+                    'location': {'address': {'firstAddressLine': 'Street 1', 'city': 'Paris'}}},
+        'propertyGallery': {'images': [{'image': {'url': f'https://images.test/{num}.jpg', 'description': 'Room'}}
+                                       for num in range(images)]},
+        'reviewInfo': {'summary': {'overallScoreWithDescriptionA11y': {'value': '9.0/10'}}}}}}
+
+
+class DetailStub:
+    """
+    stub of properties/v2/detail: counts the requests, returns a property with a gallery of 10 pictures
+    """
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, method, url, **kwargs):
+        self.calls += 1
+        reply = requests.Response()
+        reply.status_code = 200
+        reply._content = json.dumps(detail_response(kwargs['json']['propertyId'], images=10)).encode()
+        return reply
+
+
+def test_detail_response_is_reduced_to_the_displayed_fields():
+    detail = api.parse_detail_response(200, detail_response('1', images=10))
+    assert detail == {'name': 'Hotel 1', 'address': 'Street 1',
+                      'images': [f'https://images.test/{num}.jpg' for num in range(api.DETAIL_CACHE_IMAGES)]}
+    assert api.parse_detail_response(429, detail_response('1', images=10)) is None
+    assert api.parse_detail_response(200, {'errors': [{'message': 'not found'}]}) is None
+
+
+def test_detail_response_without_gallery_has_no_images():
+    response = detail_response('1', images=0)
+    response['data']['propertyInfo']['propertyGallery'] = None
+    assert api.parse_detail_response(200, response)['images'] == []
+    del response['data']['propertyInfo']['propertyGallery']
+    assert api.parse_detail_response(200, response)['images'] == []
+    response['data']['propertyInfo']['propertyGallery'] = {'images': None}
+    assert api.parse_detail_response(200, response)['images'] == []
+
+
+def test_cached_detail_is_not_requested_again(monkeypatch, database):
+    details = DetailStub()
+    monkeypatch.setattr(session, 'request', details)
+    monkeypatch.setattr(quota, 'acquire', lambda endpoint: None)
+    monkeypatch.setattr(api, 'detail_cache', TieredCache(MemoryCache(maxsize=10, ttl=600),
+                                                         SqliteCache('details', maxsize=10, ttl=600)))
+    detail = api.fetch_detail('7')
+    assert api.fetch_detail('7') == detail
+    assert details.calls == 1
+    # в SQLite хранится только сокращённая форма ответа
+    stored = json.loads(CacheEntry.get(CacheEntry.namespace == 'details', CacheEntry.key == '7').value)
+    assert stored == detail
+    assert set(stored) == {'name', 'address', 'images'}
+    api.detail_cache.first.delete('7')
+    assert api.fetch_detail('7') == detail
+    assert details.calls == 1
@@ -0,0 +1,45 @@
+import re
+from database.classes import Search, Property, SearchProperty
+from handlers.history import history_page
+
+USER_ID = 1
+
+
+def create_history(searches, hotels):
+    Property.insert_many([{'id': str(num), 'name': f'Hotel {num} ' + 'x' * 60, 'address': f'Street {num}'}
+                          for num in range(hotels)]).execute()
+    for num in range(1, searches + 1):
+        search = Search.create(id=num, user_id=USER_ID, created=1700000000 + num, command=f'/lowprice{num}')
+        SearchProperty.insert_many([{'search': search.id, 'position': position, 'property': str(position)}
+                                    for position in range(hotels)]).execute()
+
+
+def shown_searches(text):
+    return [int(num) for num in re.findall(r'Command: /lowprice(\d+)', text)]
+
+
+def test_newer_page_starts_right_after_the_current_page(database):
+    # каждый поиск занимает около 850 символов: в сообщение помещается 4 поиска
+    create_history(searches=25, hotels=10)
+    text, _ = history_page(USER_ID, before=16)
+    assert shown_searches(text) == [15, 14, 13, 12]
+    text, _ = history_page(USER_ID, after=15)
+    assert shown_searches(text) == [19, 18, 17, 16]
+    text, _ = history_page(USER_ID, after=23)
+    assert shown_searches(text) == [25, 24]
+
+
+def test_history_pages_are_read_by_index(database):
+    searches = (Search.select(Search.id).where(Search.user_id == USER_ID, Search.id < 100)
+                .order_by(Search.id.desc()).limit(10))
+    sql, params = searches.sql()
+    plan = ' '.join(row[-1] for row in database.execute_sql('EXPLAIN QUERY PLAN ' + sql, params))
+    assert 'TEMP B-TREE' not in plan
+
+
+def test_searches_by_date_are_read_by_index(database):
+    # удаление старых поисков и прогрев кэшей выбирают поиски по времени, не просматривая всю таблицу
+    searches = Search.select(Search.id).where(Search.created < 1700000000)
+    sql, params = searches.sql()
+    plan = ' '.join(row[-1] for row in database.execute_sql('EXPLAIN QUERY PLAN ' + sql, params))
+    assert 'INDEX search_created' in plan
@@ -0,0 +1,176 @@
+import itertools
+import threading
+import time
+from types import SimpleNamespace
+import pytest
+import requests
+from telebot import apihelper, types
+from api_seq import media, api
+from api_seq.cache import create_cache
+from api_seq.records import HotelRecord
+from config_data.config import IMAGE_MAX_BYTES
+
+
+class HeadSession:
+    """
+    stub of the image session: answers HEAD requests with the given status and headers
+    """
+    def __init__(self, status_code=200, headers=None, error=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.error = error
+
+    def request(self, method, url, **kwargs):
+        if self.error is not None:
+            raise self.error
+        reply = requests.Response()
+        reply.status_code = self.status_code
+        reply.headers.update(self.headers)
+        return reply
+
+
+class Checks:
+    """
+    stub of check_image: the pictures named bad* are rejected, the first pictures are answered last
+    """
+    def __init__(self):
+        self.checked = []
+        self._lock = threading.Lock()
+
+    def __call__(self, url):
+        time.sleep(0.05 if url.endswith('0') else 0.0)
+        with self._lock:
+            self.checked.append(url)
+        return not url.startswith('bad')
+
+
+class PhotoBot:
+    """
+    stub of the bot: records the pictures of each sent media group and photo,
+    answers with two sizes of each picture and fails the requests whose pictures are in failing
+    """
+    def __init__(self):
+        self.groups = []
+        self.photos = []
+        self.failing = set()
+        self.message_ids = itertools.count(1)
+
+    def sent_message(self):
+        message_id = next(self.message_ids)
+        return types.Message.de_json({
+            'message_id': message_id, 'date': 0, 'chat': {'id': 1, 'type': 'private'},
+            'photo': [{'file_id': f'small_{message_id}', 'file_unique_id': f's{message_id}', 'width': 90, 'height': 60},
+                      {'file_id': f'large_{message_id}', 'file_unique_id': f'l{message_id}', 'width': 1000,
+                       'height': 667}]})
+
+    def fail_if_failing(self, method, photos):
+        if self.failing & set(photos):
+            raise apihelper.ApiTelegramException(method, None, {
+                'ok': False, 'error_code': 400, 'description': 'Bad Request: wrong file identifier/HTTP URL specified'})
+
+    def send_media_group(self, chat_id, media):
+        self.groups.append([photo.media for photo in media])
+        self.fail_if_failing('sendMediaGroup', self.groups[-1])
+        return [self.sent_message() for _ in media]
+
+    def send_photo(self, chat_id, photo, caption=None):
+        self.photos.append(photo)
+        self.fail_if_failing('sendPhoto', [photo])
+        return self.sent_message()
+
+
+def show_hotel(images):
+    api.send_hotel(SimpleNamespace(chat=SimpleNamespace(id=1)), HotelRecord('1', 100, 1.5, '$'),
+                   {'name': 'Hotel 1', 'address': 'Street', 'images': images}, images,
+                   {'total_days': 2, 'pictures_question': 1})
+
+
+@pytest.fixture
+def photo_bot(database, monkeypatch):
+    bot = PhotoBot()
+    monkeypatch.setattr(api, 'bot', bot)
+    monkeypatch.setattr(media, 'file_id_cache', create_cache('file_ids', maxsize=100, ttl=60, sqlite=True))
+    monkeypatch.setattr(api, 'media_stats', media.MediaStats())
+    return bot
+
+
+@pytest.fixture
+def checks(monkeypatch):
+    checks = Checks()
+    monkeypatch.setattr(media, 'check_image', checks)
+    monkeypatch.setattr(media, 'image_cache', create_cache('images', maxsize=100, ttl=60))
+    monkeypatch.setattr(media, 'media_stats', media.MediaStats())
+    return checks
+
+
+@pytest.mark.parametrize('session, usable', [
+    (HeadSession(headers={'Content-Type': 'image/jpeg', 'Content-Length': '150000'}), True),
+    (HeadSession(headers={'Content-Type': 'image/jpeg'}), True),
+    (HeadSession(headers={'Content-Type': 'image/jpeg', 'Content-Length': 'abc'}), True),
+    (HeadSession(headers={'Content-Type': 'image/jpeg', 'Content-Length': str(IMAGE_MAX_BYTES + 1)}), False),
+    (HeadSession(headers={'Content-Type': 'text/html', 'Content-Length': '5000'}), False),
+    (HeadSession(status_code=404, headers={'Content-Type': 'image/jpeg'}), False),
+    (HeadSession(error=requests.ConnectTimeout('timed out')), False),
+])
+def test_check_image(monkeypatch, session, usable):
+    monkeypatch.setattr(media, 'image_session', session)
+    assert media.check_image('https://images.example/1.jpg') is usable
+
+
+def test_rejected_pictures_are_skipped_in_gallery_order(checks):
+    urls = ['good0', 'bad1', 'good2', 'bad3', 'good4', 'good5']
+    assert media.select_images('1', urls, 3) == ['good0', 'good2', 'good4']
+    # проверки идут одновременно: первое фото проверено последним, порядок галереи сохранён
+    assert checks.checked[-1] == 'good0'
+    assert sorted(checks.checked) == sorted(urls)
+    stats = media.media_stats.stats()
+    assert (stats['checked'], stats['rejected']) == (6, 2)
+
+
+def test_known_good_pictures_are_not_checked_again(checks):
+    urls = ['good0', 'bad1', 'good2', 'bad3', 'good4']
+    assert media.select_images('1', urls, 2) == ['good0', 'good2']
+    assert media.select_images('1', urls, 3) == ['good0', 'good2', 'good4']
+    assert len(checks.checked) == 5
+    # годных фото меньше, чем запрошено, но вся галерея уже проверена
+    assert media.select_images('1', urls, 5) == ['good0', 'good2', 'good4']
+    assert len(checks.checked) == 5
+    assert media.select_images('2', ['good0', 'good1'], 0) == []
+    assert media.select_images('2', [], 3) == []
+    assert len(checks.checked) == 5
+
+
+def test_gallery_without_usable_pictures_is_not_checked_again(checks):
+    urls = ['bad0', 'bad1']
+    assert media.select_images('1', urls, 2) == []
+    assert media.select_images('1', urls, 2) == []
+    assert len(checks.checked) == 2
+
+
+def test_file_id_of_the_largest_size_is_stored_and_reused(photo_bot):
+    show_hotel(['https://images.test/1.jpg', 'https://images.test/2.jpg'])
+    assert media.file_id_cache.get('https://images.test/1.jpg') == 'large_1'
+    assert media.file_id_cache.get('https://images.test/2.jpg') == 'large_2'
+    # file_id хранится в history.db и переживает перезапуск (новый кэш в памяти)
+    assert create_cache('file_ids', maxsize=100, ttl=60, sqlite=True).get('https://images.test/2.jpg') == 'large_2'
+    show_hotel(['https://images.test/2.jpg', 'https://images.test/3.jpg'])
+    assert photo_bot.groups[-1] == ['large_2', 'https://images.test/3.jpg']
+    # фото, отправленное по file_id, не меняет сохранённый file_id
+    assert media.file_id_cache.get('https://images.test/2.jpg') == 'large_2'
+    assert media.file_id_cache.get('https://images.test/3.jpg') == 'large_4'
+
+
+def test_file_ids_are_forgotten_after_a_failed_media_group(photo_bot):
+    urls = ['https://images.test/1.jpg', 'https://images.test/2.jpg']
+    show_hotel(urls)
+    photo_bot.failing = {'large_1', 'https://images.test/1.jpg'}
+    show_hotel(urls)
+    assert photo_bot.groups[-1] == ['large_1', 'large_2']
+    # группа не отправлена: фото отправляются по ссылкам, file_id сохраняются заново только для отправленных
+    assert photo_bot.photos == urls
+    assert media.file_id_cache.get('https://images.test/1.jpg') is None
+    assert media.file_id_cache.get('https://images.test/2.jpg') == 'large_3'
+    assert api.media_stats.stats()['fallbacks'] == 1
+    photo_bot.failing = set()
+    show_hotel(urls)
+    assert photo_bot.groups[-1] == ['https://images.test/1.jpg', 'large_3']
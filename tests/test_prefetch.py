@@ -0,0 +1,115 @@
+import sys
+import threading
+from types import SimpleNamespace
+import pytest
+from api_seq.prefetch import Prefetcher
+from handlers.start import start
+from handlers.help import help_user
+
+
+class Details:
+    """
+    stub of load_detail: records the requested hotels, the first request waits until the test releases it
+    """
+    def __init__(self):
+        self.requested = []
+        self.started = threading.Event()
+        self.released = threading.Event()
+
+    def __call__(self, hotel_id):
+        self.requested.append(hotel_id)
+        self.started.set()
+        self.released.wait(5)
+        return {'name': f'Hotel {hotel_id}'}
+
+
+class ChatBot:
+    """
+    stub of the bot used by the /start and /help handlers
+    """
+    def __init__(self):
+        self.sent = []
+
+    def delete_state(self, user_id, chat_id):
+        pass
+
+    def send_sticker(self, chat_id, sticker):
+        self.sent.append(sticker)
+
+    def send_message(self, chat_id, text):
+        self.sent.append(text)
+
+
+def hotels(chat_id, count=7):
+    return [SimpleNamespace(id=f'{chat_id}-{num}') for num in range(1, count + 1)]
+
+
+def finish(prefetcher):
+    # пул потоков дожидается всех начатых и запланированных загрузок
+    prefetcher.executor.shutdown(wait=True)
+    return prefetcher.stats()
+
+
+@pytest.mark.parametrize('command', [start, help_user])
+def test_start_and_help_stop_the_remaining_detail_loads(monkeypatch, command):
+    details = Details()
+    prefetcher = Prefetcher(load_detail=details, max_workers=1, details=5, max_chats=10)
+    handler_module = sys.modules[command.__module__]
+    monkeypatch.setattr(handler_module, 'prefetcher', prefetcher)
+    monkeypatch.setattr(handler_module, 'bot', ChatBot())
+    prefetcher.start(1, load_hotels=lambda: hotels(1), count=7)
+    details.started.wait(5)
+    command(SimpleNamespace(chat=SimpleNamespace(id=1), from_user=SimpleNamespace(id=1)))
+    details.released.set()
+    stats = finish(prefetcher)
+    # загрузка, начатая до команды, завершается, следующие не запрашиваются
+    assert details.requested == ['1-1']
+    assert (stats['cancelled'], stats['unused'], stats['completed'], stats['details_loaded']) == (1, 1, 0, 1)
+    assert prefetcher.jobs == {}
+
+
+def test_new_prefetch_replaces_the_chat_prefetch():
+    details = Details()
+    prefetcher = Prefetcher(load_detail=details, max_workers=1, details=3, max_chats=10)
+    prefetcher.start(1, load_hotels=lambda: hotels('old'), count=7)
+    details.started.wait(5)
+    prefetcher.start(1, load_hotels=lambda: hotels('new'), count=2)
+    details.released.set()
+    stats = finish(prefetcher)
+    # новая загрузка ограничена числом отелей, которое запросил пользователь
+    assert details.requested == ['old-1', 'new-1', 'new-2']
+    assert (stats['started'], stats['cancelled'], stats['completed'], stats['unused']) == (2, 1, 1, 1)
+    assert prefetcher.jobs[1].hotel_ids == ['new-1', 'new-2']
+
+
+def test_oldest_chat_is_dropped_above_max_chats():
+    details = Details()
+    prefetcher = Prefetcher(load_detail=details, max_workers=1, details=2, max_chats=2)
+    prefetcher.start(1, load_hotels=lambda: hotels(1), count=7)
+    details.started.wait(5)
+    prefetcher.start(2, load_hotels=lambda: hotels(2), count=7)
+    prefetcher.start(3, load_hotels=lambda: hotels(3), count=7)
+    assert list(prefetcher.jobs) == [2, 3]
+    details.released.set()
+    stats = finish(prefetcher)
+    assert details.requested == ['1-1', '2-1', '2-2', '3-1', '3-2']
+    assert (stats['cancelled'], stats['completed'], stats['unused']) == (1, 2, 1)
+
+
+def test_claim_counts_the_displayed_prefetched_hotels():
+    details = Details()
+    details.released.set()
+    prefetcher = Prefetcher(load_detail=details, max_workers=1, details=3, max_chats=10)
+    prefetcher.start(1, load_hotels=lambda: hotels(1), count=7)
+    prefetcher.start(2, load_hotels=lambda: hotels(2), count=7)
+    finish(prefetcher)
+    prefetcher.claim(1, ['1-1', '1-3', '1-9'])
+    # поиск без загрузки заранее (или уже учтённой) не меняет счётчики
+    prefetcher.claim(1, ['1-2'])
+    prefetcher.claim(5, ['5-1'])
+    prefetcher.cancel(2)
+    stats = prefetcher.stats()
+    assert (stats['used'], stats['unused'], stats['cancelled'], stats['completed']) == (1, 1, 0, 2)
+    assert (stats['details_loaded'], stats['details_used']) == (6, 2)
+    assert stats['detail_use_rate'] == pytest.approx(1 / 3)
+    assert prefetcher.jobs == {}
@@ -0,0 +1,47 @@
+import multiprocessing
+from utils.processes import raw_update_chat_id, ProcessDispatcher
+
+
+class RecordingBot:
+    """
+    class contains a bot stub reporting the worker and the update of each processed update
+    """
+    def __init__(self, handled):
+        self.threaded = True
+        self.handled = handled
+
+    def process_new_updates(self, updates):
+        for update in updates:
+            self.handled.put((multiprocessing.current_process().name, update.message.chat.id, update.update_id))
+
+
+def message(update_id, chat_id):
+    return {'update_id': update_id, 'message': {'message_id': update_id, 'date': 0, 'text': 'Paris',
+                                                'chat': {'id': chat_id, 'type': 'private'}}}
+
+
+def test_raw_update_chat_id():
+    chat = {'chat': {'id': 7}}
+    assert raw_update_chat_id(message(1, 5)) == 5
+    assert raw_update_chat_id({'update_id': 1, 'edited_message': chat}) == 7
+    assert raw_update_chat_id({'update_id': 1, 'channel_post': chat}) == 7
+    assert raw_update_chat_id({'update_id': 1, 'callback_query': {'from': {'id': 3}, 'message': chat}}) == 7
+    # кнопка inline-сообщения: сообщения нет, чат определяется по пользователю
+    assert raw_update_chat_id({'update_id': 1, 'callback_query': {'from': {'id': 3}, 'inline_message_id': 'x'}}) == 3
+    assert raw_update_chat_id({'update_id': 1, 'inline_query': {'from': {'id': 3}}}) == 0
+
+
+def test_chat_updates_go_to_one_worker_in_order(database):
+    handled = multiprocessing.get_context('fork').Queue()
+    chats = [1, 2, 3, 4, 1, 5, 2, 1, 6, 3, 1, 4]
+    dispatcher = ProcessDispatcher(RecordingBot(handled), processes=3, queue_size=2)
+    for update_id, chat_id in enumerate(chats, 1):
+        dispatcher.put(message(update_id, chat_id))
+    dispatcher.stop()
+    records = [handled.get(timeout=10) for _ in chats]
+    assert dispatcher.routed == [3, 6, 3]
+    for chat_id in set(chats):
+        workers = {worker for worker, chat, _ in records if chat == chat_id}
+        assert workers == {f'update-worker-{chat_id % 3}'}
+        update_ids = [update_id for _, chat, update_id in records if chat == chat_id]
+        assert update_ids == [update_id for update_id, chat in enumerate(chats, 1) if chat == chat_id]
@@ -0,0 +1,117 @@
+from datetime import date
+import pytest
+from api_seq import api
+from api_seq.cache import RefreshingCache
+from api_seq.singleflight import SingleFlight
+from api_seq.search_request import SearchRequest
+from api_seq.quota import QuotaManager, QuotaExceeded, quota as hotels4_quota, PRIORITY_INTERACTIVE, \
+    PRIORITY_PREFETCH, PRIORITY_WARMUP, LEVEL_NORMAL, LEVEL_FEWER_PICTURES, LEVEL_LIST_ONLY
+from database.classes import QuotaEntry
+
+SHARES = (1.0, 0.6, 0.3)
+
+
+def create_quota(minute_limit=100, day_limit=1000, processes=1):
+    return QuotaManager({'detail': (minute_limit, day_limit)}, SHARES, fewer_pictures=0.7, list_only=0.9,
+                        processes=processes)
+
+
+class CountingEndpoint:
+    """
+    stub of a hotels4 endpoint: takes a call from the quota like request_detail and counts the calls sent
+    """
+    def __init__(self, quota):
+        self.quota = quota
+        self.calls = 0
+
+    def __call__(self):
+        self.quota.acquire('detail')
+        self.calls += 1
+        return {'name': 'Hotel'}
+
+
+def send(endpoint, count):
+    rejected = 0
+    for _ in range(count):
+        try:
+            endpoint()
+        except QuotaExceeded:
+            rejected += 1
+    return rejected
+
+
+def test_calls_above_the_minute_budget_are_not_sent():
+    quota = create_quota(minute_limit=10)
+    endpoint = CountingEndpoint(quota)
+    assert send(endpoint, 25) == 15
+    assert endpoint.calls == 10
+    assert quota.stats()['endpoints']['detail']['rejected'] == 15
+
+
+@pytest.mark.parametrize('priority, allowed', [(PRIORITY_PREFETCH, 6), (PRIORITY_WARMUP, 3)])
+def test_background_priorities_use_their_share(priority, allowed):
+    quota = create_quota(minute_limit=10)
+    endpoint = CountingEndpoint(quota)
+    with quota.priority(priority):
+        send(endpoint, 10)
+    assert endpoint.calls == allowed
+    # запросы пользователя используют оставшуюся часть бюджета
+    send(endpoint, 10)
+    assert endpoint.calls == 10
+
+
+def test_degradation_levels_follow_the_detail_budget():
+    quota = create_quota(minute_limit=10)
+    endpoint = CountingEndpoint(quota)
+    assert quota.level() == LEVEL_NORMAL
+    assert quota.pictures(5) == 5
+    send(endpoint, 7)
+    assert quota.level() == LEVEL_FEWER_PICTURES
+    assert quota.pictures(5) == 1
+    send(endpoint, 2)
+    assert quota.level() == LEVEL_LIST_ONLY
+
+
+def test_processes_share_the_budget():
+    quota = create_quota(minute_limit=10, day_limit=100, processes=4)
+    usage = quota.stats()['endpoints']['detail']
+    assert (usage['minute_limit'], usage['day_limit']) == (2, 25)
+
+
+def test_day_counters_survive_a_restart(database):
+    quota = create_quota(day_limit=100, processes=2)
+    send(CountingEndpoint(quota), 8)
+    quota.flush()
+    quota.flush()
+    assert QuotaEntry.get().calls == 8
+    restarted = create_quota(day_limit=100, processes=2)
+    restarted.load()
+    assert restarted.stats()['endpoints']['detail']['day'] == 4
+
+
+def test_background_refresh_keeps_the_priority_of_the_caller():
+    cache = RefreshingCache(maxsize=10, ttl=0, stale_ttl=60, flight=SingleFlight('test', timeout=5))
+    priorities = []
+
+    def load():
+        priorities.append(hotels4_quota.current_priority())
+        return [len(priorities)]
+
+    cache.get('key', load)
+    with hotels4_quota.priority(PRIORITY_WARMUP):
+        assert cache.get('key', load) == [1]
+    cache.executor.shutdown(wait=True)
+    assert priorities == [PRIORITY_INTERACTIVE, PRIORITY_WARMUP]
+
+
+def test_rejected_search_reaches_the_caller(monkeypatch):
+    def acquire(endpoint):
+        raise QuotaExceeded(f'hotels4 {endpoint} budget exceeded')
+
+    monkeypatch.setattr(hotels4_quota, 'acquire', acquire)
+    search = SearchRequest(region_id='rejected', check_in=date(2030, 1, 1), check_out=date(2030, 1, 3), adults=2,
+                           results_size=5, sort='PRICE_LOW_TO_HIGH', price_min=10, price_max=100)
+    with pytest.raises(QuotaExceeded):
+        api.make_api_request(search)
+    with pytest.raises(QuotaExceeded):
+        api.make_paged_api_request(search, page_size=50, max_results=100)
@@ -0,0 +1,44 @@
+import numpy as np
+from api_seq.records import HotelBatch, HotelRecord
+from universal_functions.ranking import pareto_front, top_k, rank_hotels, best_hotels
+
+WEIGHTS = (0.5, 0.4, 0.1)
+
+
+def test_pareto_front_keeps_the_hotels_no_other_hotel_beats():
+    price = np.array([10000, 20000, 15000, 30000, 10000, 25000])
+    distance = np.array([5.0, 1.0, 3.0, 0.5, 6.0, 2.0])
+    # 4: та же цена, что у 0, но дальше; 5: 1 дешевле и ближе
+    assert pareto_front(price, distance).tolist() == [True, True, True, True, False, False]
+    assert pareto_front(price.astype(np.float64), distance).tolist() == [True, True, True, True, False, False]
+
+
+def test_top_k_orders_by_score_and_breaks_ties_by_position():
+    scores = np.array([0.3, 0.1, 0.3, 0.2, 0.9, 0.3])
+    assert top_k(scores, 2).tolist() == [1, 3]
+    assert top_k(scores, 4).tolist() == [1, 3, 0, 2]
+    assert top_k(scores, 5).tolist() == [1, 3, 0, 2, 5]
+    assert top_k(scores, 0).tolist() == []
+
+
+def test_more_hotels_requested_than_found():
+    best = rank_hotels([10000, 5000, 7000], [1.0, 2.0, 3.0], [8.0, 9.0, 7.0], WEIGHTS, k=5)
+    assert sorted(best.tolist()) == [0, 1, 2]
+    best = rank_hotels([10000, 5000, 7000], [1.0, 2.0, 3.0], [8.0, 9.0, 7.0], WEIGHTS, k=5, pareto=True)
+    assert sorted(best.tolist()) == [0, 1, 2]
+
+
+def test_pareto_hotels_go_first():
+    # 2 дороже и дальше, чем 1, но у него лучшие отзывы и лучшая оценка
+    hotels = ([10000, 5000, 6000], [1.0, 2.0, 2.5], [5.0, 5.0, 10.0])
+    assert rank_hotels(*hotels, (0.4, 0.3, 0.3), k=3).tolist() == [2, 1, 0]
+    assert rank_hotels(*hotels, (0.4, 0.3, 0.3), k=3, pareto=True).tolist() == [1, 0, 2]
+
+
+def test_no_candidates():
+    assert rank_hotels([], [], [], WEIGHTS, k=5).tolist() == []
+    assert rank_hotels([], [], [], WEIGHTS, k=5, pareto=True).tolist() == []
+    page = HotelBatch()
+    page.append(HotelRecord('1', 100000, 1.0, '$'))
+    data = {'hotels_count': 3, 'price_min': 10, 'price_max': 100, 'distance_min': 0, 'distance_max': 5}
+    assert best_hotels([page], data) == []
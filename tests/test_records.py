@@ -0,0 +1,55 @@
+import pytest
+from api_seq.records import HotelBatch, HotelRecord, parse_price, format_price
+
+
+def list_entry(property_id, price, distance, score=None):
+    entry = {'id': property_id, 'name': f'Hotel {property_id}',
+             'price': {'options': [{'formattedDisplayPrice': price}]},
+             'destinationInfo': {'distanceFromDestination': {'value': distance}}}
+    if score is not None:
+        entry['reviews'] = {'score': score}
+    return entry
+
+
+def test_price_is_parsed_into_cents():
+    assert parse_price('$1,234') == ('$', 123400)
+    assert parse_price('$99.50') == ('$', 9950)
+    assert parse_price('€ 12') == ('€', 1200)
+    assert parse_price('0.99') == ('', 99)
+
+
+@pytest.mark.parametrize('price', ['N/A', '', '$', '$1.2.3'])
+def test_malformed_price_is_rejected(price):
+    with pytest.raises(ValueError):
+        parse_price(price)
+
+
+def test_price_is_formatted_for_display():
+    assert format_price(123400, '$') == '$1,234'
+    assert format_price(9950, '$') == '$99.50'
+    assert format_price(123400 * 3, '€') == '€3,702'
+    assert format_price(5, '$') == '$0.05'
+
+
+def test_entries_with_malformed_price_are_skipped():
+    batch = HotelBatch.from_properties([list_entry('1', '$1,234', 1.5, score=8.4), list_entry('2', 'N/A', 2.0),
+                                        list_entry('3', '', 0.4), list_entry('4', '$99.50', '3')])
+    assert batch.ids == ['1', '4']
+    assert list(batch.price_cents) == [123400, 9950]
+    assert list(batch.distances) == [1.5, 3.0]
+    assert list(batch.review_scores) == [8.4, 0.0]
+    assert batch.currencies == ['$', '$']
+
+
+def test_batch_head_and_iteration():
+    batch = HotelBatch()
+    for num in range(5):
+        batch.append(HotelRecord(str(num), num * 100, num / 2, '$', review_score=num, name=f'Hotel {num}'))
+    assert batch.head(10) is batch
+    head = batch.head(2)
+    assert len(head) == 2 and len(batch) == 5
+    assert [hotel.id for hotel in head] == ['0', '1']
+    hotel = batch[3]
+    assert (hotel.id, hotel.price_cents, hotel.distance, hotel.currency, hotel.review_score, hotel.name) == \
+           ('3', 300, 1.5, '$', 3.0, 'Hotel 3')
+    assert [hotel.price_cents for hotel in batch] == [0, 100, 200, 300, 400]
@@ -0,0 +1,103 @@
+import threading
+from copy import deepcopy
+from datetime import date, timedelta
+from api_seq import api
+from api_seq.api import API
+from api_seq.records import HotelBatch, HotelRecord
+from api_seq.search_request import SearchRequest
+
+
+def create_search(num):
+    check_in = date(2030, 1, 1) + timedelta(days=num)
+    return SearchRequest(region_id=str(num), check_in=check_in, check_out=check_in + timedelta(days=2),
+                         adults=num % 4 + 1, results_size=5, sort='PRICE_LOW_TO_HIGH',
+                         price_min=num, price_max=num + 100)
+
+
+def test_payload_does_not_change_the_template():
+    template = deepcopy(API.payload_list)
+    create_search(7).list_payload(API.payload_list)
+    assert API.payload_list == template
+
+
+def test_concurrent_searches_do_not_mix_parameters():
+    template = deepcopy(API.payload_list)
+    errors = []
+
+    def build(num):
+        search = create_search(num)
+        for _ in range(200):
+            payload = search.list_payload(API.payload_list)
+            if (payload['destination']['regionId'], payload['filters']['price']['min'],
+                    payload['rooms'][0]['adults'], payload['checkInDate']['day']) != \
+                    (str(num), num, search.adults, search.check_in.day):
+                errors.append(num)
+
+    threads = [threading.Thread(target=build, args=(num,)) for num in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert API.payload_list == template
+
+
+def test_cache_key_identifies_the_search():
+    assert create_search(1).cache_key() == create_search(1).cache_key()
+    assert create_search(1).cache_key() != create_search(1)._replace(starting_index=5).cache_key()
+
+
+def test_searches_differing_in_the_number_of_hotels_share_the_list(monkeypatch):
+    requested = []
+
+    def request_hotels(search):
+        requested.append(search.results_size)
+        batch = HotelBatch()
+        for num in range(search.results_size):
+            batch.append(HotelRecord(str(num), num * 100, 1.0, '$'))
+        return batch
+
+    monkeypatch.setattr(api, 'request_hotels', request_hotels)
+    search = create_search(1)._replace(region_id='shared-list')
+    assert api.make_api_request(search._replace(results_size=3)).ids == ['0', '1', '2']
+    assert len(api.make_api_request(search._replace(results_size=7))) == 7
+    assert requested == [7]
+
+
+def stub_list(monkeypatch, hotels):
+    requested = []
+
+    def request_hotels(search):
+        requested.append((search.starting_index, search.results_size))
+        batch = HotelBatch()
+        for num in range(search.starting_index, min(search.starting_index + search.results_size, hotels)):
+            batch.append(HotelRecord(str(num), num * 100, 1.0, '$'))
+        return batch
+
+    monkeypatch.setattr(api, 'request_hotels', request_hotels)
+    return requested
+
+
+def test_pages_stop_after_a_short_page(monkeypatch):
+    requested = stub_list(monkeypatch, hotels=120)
+    pages = api.make_paged_api_request(create_search(2)._replace(region_id='short-page'), page_size=50,
+                                       max_results=400)
+    # следующая страница запрашивается только после просмотра предыдущей
+    assert requested == [(0, 50)]
+    assert [len(page) for page in pages] == [50, 50, 20]
+    assert requested == [(0, 50), (50, 50), (100, 50)]
+
+
+def test_pages_stop_at_max_results(monkeypatch):
+    requested = stub_list(monkeypatch, hotels=1000)
+    pages = api.make_paged_api_request(create_search(3)._replace(region_id='max-results'), page_size=50,
+                                       max_results=120)
+    assert [len(page) for page in pages] == [50, 50, 20]
+    assert requested == [(0, 50), (50, 50), (100, 20)]
+
+
+def test_empty_first_page_means_no_hotels(monkeypatch):
+    requested = stub_list(monkeypatch, hotels=0)
+    assert api.make_paged_api_request(create_search(4)._replace(region_id='no-hotels'), page_size=50,
+                                      max_results=400) is None
+    assert requested == [(0, 50)]
@@ -0,0 +1,206 @@
+import asyncio
+import json
+import threading
+import time
+from functools import partial
+import pytest
+import requests
+from telebot import apihelper, asyncio_helper
+from utils.sender import OutboundScheduler, PRIORITY_RESULT
+
+URL = 'https://api.telegram.org/bot1:test/sendPhoto'
+TEXT_URL = 'https://api.telegram.org/bot1:test/sendMessage'
+
+
+def response(status_code, body):
+    reply = requests.Response()
+    reply.status_code = status_code
+    reply._content = json.dumps(body).encode()
+    return reply
+
+
+class RateLimitedSession:
+    """
+    stub of the Bot API session: answers 429 to the first request of the chat (unless retry_after is None), then 200.
+    The requests with a text in failing raise ConnectionError
+    """
+    def __init__(self, retry_after=1, failing=()):
+        self.retry_after = retry_after
+        self.failing = set(failing)
+        self.sent = []
+        self.times = []
+        self.limited = retry_after is None
+        self.first_sent = threading.Event()
+        self._lock = threading.Lock()
+
+    def request(self, method, url, **kwargs):
+        params = kwargs['params']
+        with self._lock:
+            self.sent.append(params.get('caption', params.get('text')))
+            self.times.append(time.monotonic())
+            self.first_sent.set()
+            if self.sent[-1] in self.failing:
+                raise requests.ConnectionError('Connection reset by peer')
+            if not self.limited:
+                self.limited = True
+                return response(429, {'ok': False, 'error_code': 429,
+                                      'parameters': {'retry_after': self.retry_after}})
+        return response(200, {'ok': True, 'result': {}})
+
+
+def install_session(monkeypatch, session):
+    monkeypatch.setattr(apihelper, '_get_req_session', lambda reset=False: session)
+    monkeypatch.setattr(apihelper, 'CUSTOM_REQUEST_SENDER', None)
+    return session
+
+
+@pytest.fixture
+def telegram(monkeypatch):
+    return install_session(monkeypatch, RateLimitedSession())
+
+
+def send(scheduler, caption, responses, chat_id=1):
+    responses[caption] = scheduler.request('post', URL, params={'chat_id': chat_id, 'caption': caption})
+
+
+def send_text(scheduler, text, responses, **params):
+    try:
+        responses[text] = scheduler.request('post', TEXT_URL, params=dict(params, chat_id=1, text=text))
+    except requests.ConnectionError as e:
+        responses[text] = e
+
+
+def run_in_order(*calls):
+    # запросы встают в очередь в порядке вызовов: каждый следующий поток запускается после небольшой паузы
+    threads = []
+    for call in calls:
+        threads.append(threading.Thread(target=call))
+        threads[-1].start()
+        time.sleep(0.02)
+    for thread in threads:
+        thread.join(10)
+
+
+def test_429_is_retried_and_the_chat_order_is_kept(telegram):
+    scheduler = OutboundScheduler(global_rate=100, chat_rate=100, chat_burst=10)
+    scheduler.start()
+    responses = {}
+    threads = [threading.Thread(target=send, args=(scheduler, '1', responses))]
+    threads[0].start()
+    telegram.first_sent.wait(5)
+    # пока чат заблокирован на retry_after, в очередь встают следующие сообщения
+    for caption in ('2', '3'):
+        threads.append(threading.Thread(target=send, args=(scheduler, caption, responses)))
+        threads[-1].start()
+        time.sleep(0.05)
+    for thread in threads:
+        thread.join(5)
+    assert telegram.sent == ['1', '1', '2', '3']
+    assert {caption: reply.status_code for caption, reply in responses.items()} == {'1': 200, '2': 200, '3': 200}
+    stats = scheduler.stats()
+    assert (stats['sent'], stats['retried'], stats['queued']) == (3, 1, 0)
+
+
+def test_global_rate_is_split_between_processes():
+    scheduler = OutboundScheduler(global_rate=30, chat_rate=1, chat_burst=5, processes=4)
+    assert scheduler.global_bucket.rate == 7.5
+
+
+def test_async_requests_wait_in_the_chat_queue(telegram):
+    scheduler = OutboundScheduler(global_rate=100, chat_rate=100, chat_burst=10)
+    scheduler.start()
+    sent = []
+
+    async def send_message(text):
+        if not scheduler.retried:
+            raise asyncio_helper.ApiTelegramException('sendMessage', None, {
+                'ok': False, 'error_code': 429, 'description': 'Too Many Requests', 'parameters': {'retry_after': 1}})
+        sent.append(text)
+        return text
+
+    async def send_all():
+        return await asyncio.gather(*(scheduler.send_async(1, lambda text=text: send_message(text))
+                                      for text in ('1', '2', '3')))
+
+    assert asyncio.run(send_all()) == ['1', '2', '3']
+    assert sent == ['1', '2', '3']
+    stats = scheduler.stats()
+    assert (stats['sent'], stats['retried'], stats['queued']) == (3, 1, 0)
+
+
+def test_chat_rate_paces_a_chat_but_not_the_others(monkeypatch):
+    telegram = install_session(monkeypatch, RateLimitedSession(retry_after=None))
+    scheduler = OutboundScheduler(global_rate=100, chat_rate=10, chat_burst=1)
+    scheduler.start()
+    responses = {}
+    run_in_order(*(partial(send, scheduler, caption, responses) for caption in ('1', '2', '3', '4')),
+                 partial(send, scheduler, 'other chat', responses, 2))
+    sent = dict(zip(telegram.sent, telegram.times))
+    assert sent['4'] - sent['1'] >= 0.25
+    # сообщение другого чата не ждёт очереди первого
+    assert sent['other chat'] < sent['3']
+    assert len(responses) == 5
+
+
+def test_global_rate_paces_all_chats(monkeypatch):
+    telegram = install_session(monkeypatch, RateLimitedSession(retry_after=None))
+    scheduler = OutboundScheduler(global_rate=5, chat_rate=100, chat_burst=10)
+    scheduler.start()
+    responses = {}
+    run_in_order(*(partial(send, scheduler, str(chat_id), responses, chat_id) for chat_id in range(10)))
+    # 5 сообщений отправляются сразу, следующие 5 по одному за 0.2 с
+    assert telegram.times[-1] - telegram.times[0] >= 0.9
+    assert len(responses) == 10
+
+
+def test_results_go_before_the_text_of_other_chats(monkeypatch):
+    telegram = install_session(monkeypatch, RateLimitedSession(retry_after=None))
+    scheduler = OutboundScheduler(global_rate=2, chat_rate=100, chat_burst=10)
+    # общий лимит исчерпан: оба запроса ждут следующего токена в очереди
+    scheduler.global_bucket.tokens = 0
+    scheduler.start()
+    responses = {}
+
+    def send_result(caption, chat_id):
+        with scheduler.priority(PRIORITY_RESULT):
+            send(scheduler, caption, responses, chat_id)
+
+    run_in_order(partial(send, scheduler, 'text', responses, 2), partial(send_result, 'hotel', 3))
+    assert telegram.sent == ['hotel', 'text']
+
+
+def test_plain_text_messages_of_a_chat_are_coalesced(monkeypatch):
+    telegram = install_session(monkeypatch, RateLimitedSession(retry_after=None))
+    scheduler = OutboundScheduler(global_rate=100, chat_rate=4, chat_burst=1)
+    scheduler.start()
+    responses = {}
+    run_in_order(*(partial(send_text, scheduler, text, responses) for text in ('1', '2', '3')),
+                 partial(send_text, scheduler, 'bold', responses, parse_mode='HTML'),
+                 partial(send_text, scheduler, '5', responses))
+    # сообщение с разметкой не объединяется и разделяет объединяемые сообщения
+    assert telegram.sent == ['1', '2\n3', 'bold', '5']
+    assert responses['2'] is responses['3']
+    assert scheduler.stats()['coalesced'] == 1
+
+
+def test_coalesced_text_is_cut_at_4096_characters(monkeypatch):
+    telegram = install_session(monkeypatch, RateLimitedSession(retry_after=None))
+    scheduler = OutboundScheduler(global_rate=100, chat_rate=4, chat_burst=1)
+    scheduler.start()
+    responses = {}
+    texts = ['first', 'a' * 2000, 'b' * 2095, 'c']
+    run_in_order(*(partial(send_text, scheduler, text, responses) for text in texts))
+    assert telegram.sent == ['first', f'{texts[1]}\n{texts[2]}', 'c']
+    assert len(telegram.sent[1]) == 4096
+
+
+def test_failed_leader_requeues_its_followers(monkeypatch):
+    telegram = install_session(monkeypatch, RateLimitedSession(retry_after=None, failing=['2\n3\n4']))
+    scheduler = OutboundScheduler(global_rate=100, chat_rate=4, chat_burst=1)
+    scheduler.start()
+    responses = {}
+    run_in_order(*(partial(send_text, scheduler, text, responses) for text in ('1', '2', '3', '4')))
+    assert telegram.sent == ['1', '2\n3\n4', '3\n4']
+    assert isinstance(responses['2'], requests.ConnectionError)
+    assert responses['3'].status_code == responses['4'].status_code == 200
+    assert scheduler.stats()['queued'] == 0
@@ -0,0 +1,165 @@
+import itertools
+import json
+import random
+import threading
+from datetime import date, timedelta
+import pytest
+import requests
+from telebot import apihelper, types
+from telebot.custom_filters import StateFilter
+from loader import bot
+from api_seq.api import prefetcher
+import handlers
+
+SESSIONS = 300
+THREADS = 16
+COMMANDS = {'/lowprice': ('city_id', 'get1', 1, 2), '/highprice': ('City_id', 'get2', 3, 4),
+            '/bestdeal': ('bestdeal', 'get3', 5, 6)}
+
+
+def response(body):
+    reply = requests.Response()
+    reply.status_code = 200
+    reply._content = json.dumps(body).encode()
+    return reply
+
+
+class TelegramStub:
+    """
+    stub of the Bot API: records the texts sent to each chat and answers like Telegram
+    """
+    def __init__(self):
+        self.texts = {}
+        self.message_ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def __call__(self, method, url, params=None, **kwargs):
+        params = params or {}
+        chat_id = int(params.get('chat_id', 0))
+        with self._lock:
+            if 'text' in params:
+                self.texts.setdefault(chat_id, []).append(params['text'])
+            message_id = next(self.message_ids)
+        if url.endswith(('/sendMessage', '/editMessageText')):
+            return response({'ok': True, 'result': {'message_id': message_id, 'date': 0, 'text': params.get('text'),
+                                                    'chat': {'id': chat_id, 'type': 'private'}}})
+        return response({'ok': True, 'result': True})
+
+
+class ListStub:
+    """
+    stub of the hotels list request: records the searches, finds no hotels
+    """
+    def __init__(self):
+        self.searches = []
+        self._lock = threading.Lock()
+
+    def __call__(self, search, *args, **kwargs):
+        with self._lock:
+            self.searches.append(search)
+        return None
+
+
+class Session:
+    """
+    one user's dialog: the updates it sends and the search it must produce
+    """
+    def __init__(self, num):
+        self.chat_id = 1000 + num
+        self.command = list(COMMANDS)[num % 3]
+        self.region_id = str(5000 + num)
+        self.hotels_count = num % 7 + 1
+        self.adults = num % 4 + 1
+        self.check_in = date.today() + timedelta(days=num % 60 + 1)
+        self.check_out = self.check_in + timedelta(days=num % 9 + 1)
+        self.price_min = 10 + num
+        self.price_max = 1000 + num
+        self.update_ids = itertools.count(self.chat_id * 100)
+
+    def updates(self):
+        city, pictures, check_in_calendar, check_out_calendar = COMMANDS[self.command]
+        yield self.message(self.command)
+        yield self.callback(f'{city}{self.region_id}')
+        if self.command == '/bestdeal':
+            for text in (self.price_min, self.price_max, 1, 20):
+                yield self.message(str(text))
+        yield self.message(str(self.hotels_count))
+        yield self.message(str(self.adults))
+        yield self.callback(calendar_day(check_in_calendar, self.check_in))
+        yield self.callback(calendar_day(check_out_calendar, self.check_out))
+        yield self.callback(f'{pictures}_no')
+
+    def message(self, text):
+        return types.Update.de_json({'update_id': next(self.update_ids), 'message': self.message_json(text)})
+
+    def callback(self, data):
+        update_id = next(self.update_ids)
+        return types.Update.de_json({'update_id': update_id, 'callback_query': {
+            'id': str(update_id), 'from': self.user_json(), 'chat_instance': str(self.chat_id),
+            'message': self.message_json('Please choose:'), 'data': data}})
+
+    def message_json(self, text):
+        return {'message_id': next(self.update_ids), 'date': 0, 'text': text, 'from': self.user_json(),
+                'chat': {'id': self.chat_id, 'type': 'private'}}
+
+    def user_json(self):
+        return {'id': self.chat_id, 'is_bot': False, 'first_name': f'User {self.chat_id}'}
+
+    def check(self, search):
+        if self.command != '/bestdeal':
+            assert search.results_size == self.hotels_count
+            assert search.sort == ('PRICE_HIGH_TO_LOW' if self.command == '/highprice' else 'PRICE_LOW_TO_HIGH')
+        else:
+            assert (search.price_min, search.price_max) == (self.price_min, self.price_max)
+        assert (search.check_in, search.check_out, search.adults) == (self.check_in, self.check_out, self.adults)
+
+
+def calendar_day(calendar_id, day):
+    return f'cbcal_{calendar_id}_s_d_{day.year}_{day.month}_{day.day}'
+
+
+@pytest.fixture
+def stubs(monkeypatch):
+    telegram = TelegramStub()
+    hotels = ListStub()
+    monkeypatch.setattr(apihelper, 'CUSTOM_REQUEST_SENDER', telegram)
+    monkeypatch.setattr(bot, 'threaded', False)
+    for module in (handlers.lowprice, handlers.highprice):
+        monkeypatch.setattr(module, 'make_api_request', hotels)
+    monkeypatch.setattr(handlers.bestdeal, 'make_paged_api_request', hotels)
+    # результаты загружаются заранее в том же потоке, чтобы после теста не оставалось запросов
+    monkeypatch.setattr(prefetcher, 'start', lambda chat_id, load_hotels, count: load_hotels())
+    bot.add_custom_filter(StateFilter(bot))
+    return telegram, hotels
+
+
+def run_sessions(sessions):
+    # сессии одного потока чередуются по шагам, потоки выполняются одновременно
+    dialogs = [session.updates() for session in sessions]
+    while dialogs:
+        for dialog in list(dialogs):
+            update = next(dialog, None)
+            if update is None:
+                dialogs.remove(dialog)
+            else:
+                bot.process_new_updates([update])
+
+
+def test_interleaved_sessions_do_not_mix_searches(stubs):
+    telegram, hotels = stubs
+    sessions = [Session(num) for num in range(SESSIONS)]
+    shuffled = random.Random(1).sample(sessions, len(sessions))
+    threads = [threading.Thread(target=run_sessions, args=(shuffled[num::THREADS],)) for num in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(60)
+    by_region = {session.region_id: session for session in sessions}
+    searched = {search.region_id for search in hotels.searches}
+    assert searched == set(by_region)
+    # каждый поиск запрашивается дважды: заранее и после ответа о фотографиях
+    assert len(hotels.searches) == 2 * SESSIONS
+    for search in hotels.searches:
+        by_region[search.region_id].check(search)
+    for session in sessions:
+        assert telegram.texts[session.chat_id][-1] == 'Hotels are not found.'
@@ -0,0 +1,87 @@
+import threading
+import time
+import pytest
+import requests
+from api_seq.singleflight import SingleFlight
+
+
+class CountingUpstream:
+    """
+    stub of an API endpoint: counts the calls and answers after the release event is set
+    """
+    def __init__(self, result='reply', error=None):
+        self.result = result
+        self.error = error
+        self.calls = 0
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def __call__(self):
+        self.calls += 1
+        self.started.set()
+        self.release.wait(5)
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+def run_concurrently(flight, key, upstream, callers):
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(capture(flight, key, upstream)))
+               for _ in range(callers)]
+    threads[0].start()
+    upstream.started.wait(5)
+    for thread in threads[1:]:
+        thread.start()
+    while flight.stats()['shared'] < callers - 1:
+        time.sleep(0.001)
+    upstream.release.set()
+    for thread in threads:
+        thread.join(5)
+    return results
+
+
+def capture(flight, key, upstream):
+    try:
+        return flight.do(key, upstream)
+    except Exception as e:
+        return e
+
+
+def test_concurrent_calls_share_one_upstream_call():
+    flight = SingleFlight('test', timeout=5)
+    upstream = CountingUpstream()
+    results = run_concurrently(flight, 'paris', upstream, callers=20)
+    assert upstream.calls == 1
+    assert results == ['reply'] * 20
+    assert flight.stats() == {'calls': 1, 'shared': 19}
+    assert not flight.in_flight('paris')
+
+
+def test_error_is_returned_to_every_caller():
+    flight = SingleFlight('test', timeout=5)
+    upstream = CountingUpstream(error=requests.ConnectionError('down'))
+    results = run_concurrently(flight, 'paris', upstream, callers=5)
+    assert upstream.calls == 1
+    assert all(isinstance(result, requests.ConnectionError) for result in results)
+    # следующий вызов после ошибки снова обращается к API
+    assert flight.do('paris', lambda: 'retry') == 'retry'
+
+
+def test_different_keys_are_not_shared():
+    flight = SingleFlight('test', timeout=5)
+    assert [flight.do(key, lambda key=key: key.upper()) for key in ('a', 'b')] == ['A', 'B']
+    assert flight.stats() == {'calls': 2, 'shared': 0}
+
+
+def test_waiter_gives_up_after_timeout():
+    flight = SingleFlight('test', timeout=0.05)
+    upstream = CountingUpstream()
+    owner = threading.Thread(target=flight.do, args=('paris', upstream))
+    owner.start()
+    upstream.started.wait(5)
+    with pytest.raises(requests.Timeout):
+        flight.do('paris', upstream)
+    upstream.release.set()
+    owner.join(5)
+    assert upstream.calls == 1
@@ -0,0 +1,133 @@
+import threading
+import time
+from datetime import date
+import pytest
+from telebot.storage import redis_storage
+from database.classes import StateEntry
+from database.state_storage import SqliteStateStorage, RedisStateStorage, dump_state, load_state
+
+CHECK_IN = date(2030, 1, 1)
+
+
+class RedisStub:
+    """
+    class contains the records of a Redis server and the expiry they were set with
+    """
+    def __init__(self):
+        self.records = {}
+        self.expiry = {}
+
+    def get(self, key):
+        return self.records.get(key)
+
+    def set(self, key, value, ex=None):
+        self.records[key] = value.encode()
+        self.expiry[key] = ex
+
+    def delete(self, key):
+        self.records.pop(key, None)
+
+    def close(self):
+        pass
+
+
+def expire_states():
+    StateEntry.update(expires=int(time.time()) - 1).execute()
+
+
+def test_state_data_round_trips_dates():
+    data = {'date_check_in': CHECK_IN, 'dates': [CHECK_IN], 'range': {'$date': 1, 'end': 2}, 'people_count': '2'}
+    text = dump_state(data)
+    assert ' ' not in text
+    assert load_state(text) == data
+    with pytest.raises(TypeError):
+        dump_state({'value': object()})
+
+
+def test_sqlite_state_round_trip(database):
+    storage = SqliteStateStorage(ttl=60)
+    assert storage.get_state(1, 2) is None
+    storage.set_state(1, 2, 'LowState:city')
+    storage.set_data(1, 2, 'date_check_in', CHECK_IN)
+    with storage.get_interactive_data(1, 2) as data:
+        data['total_days'] = 2
+    assert storage.get_state(1, 2) == 'LowState:city'
+    assert storage.get_data(1, 2) == {'date_check_in': CHECK_IN, 'total_days': 2}
+    # состояние другого пользователя того же чата хранится отдельно
+    assert storage.get_data(1, 3) is None
+    storage.set_state(1, 2, 'LowState:price')
+    assert storage.get_data(1, 2) == {'date_check_in': CHECK_IN, 'total_days': 2}
+    assert storage.reset_data(1, 2)
+    assert storage.get_data(1, 2) == {}
+    assert storage.delete_state(1, 2)
+    assert storage.get_state(1, 2) is None
+
+
+def test_expired_state_is_neither_read_nor_updated(database):
+    storage = SqliteStateStorage(ttl=60)
+    storage.set_state(1, 2, 'LowState:city')
+    storage.set_data(1, 2, 'query', 'Paris')
+    assert storage._get(1, 2).expires >= int(time.time()) + 59
+    expire_states()
+    assert storage._get(1, 2) is None
+    assert not storage._update(1, 2, state='LowState:price')
+    assert storage.get_state(1, 2) is None
+    assert storage.get_data(1, 2) is None
+    assert not storage.reset_data(1, 2)
+    with pytest.raises(RuntimeError):
+        storage.set_data(1, 2, 'query', 'Rome')
+
+
+def test_set_state_after_expiry_resets_the_data(database):
+    storage = SqliteStateStorage(ttl=60)
+    storage.set_state(1, 2, 'LowState:city')
+    storage.set_data(1, 2, 'query', 'Paris')
+    expire_states()
+    storage.set_state(1, 2, 'LowState:city')
+    assert storage.get_state(1, 2) == 'LowState:city'
+    assert storage.get_data(1, 2) == {}
+    assert StateEntry.select().count() == 1
+
+
+def test_concurrent_data_writes_do_not_fail(database):
+    storage = SqliteStateStorage(ttl=60)
+    errors = []
+
+    def answer(chat_id):
+        try:
+            storage.set_state(chat_id, chat_id, 'LowState:city')
+            for step in range(50):
+                storage.get_data(chat_id, chat_id)
+                storage.set_data(chat_id, chat_id, f'answer_{step}', step)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=answer, args=(chat_id,)) for chat_id in range(1, 5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert len(storage.get_data(4, 4)) == 50
+
+
+def test_redis_state_round_trip(monkeypatch):
+    # клиент redis в тестах не нужен: пул соединений не создаётся, соединение заменяется заглушкой
+    monkeypatch.setattr(redis_storage, 'redis_installed', True)
+    monkeypatch.setattr(redis_storage, 'ConnectionPool', lambda **kwargs: None, raising=False)
+    redis = RedisStub()
+    storage = RedisStateStorage(ttl=60)
+    storage.connection = lambda: redis
+    storage.set_state(1, 2, 'LowState:city')
+    storage.set_data(1, 2, 'date_check_in', CHECK_IN)
+    with storage.get_interactive_data(1, 2) as data:
+        data['total_days'] = 2
+    assert storage.get_state(1, 2) == 'LowState:city'
+    assert storage.get_data(1, 2) == {'date_check_in': CHECK_IN, 'total_days': 2}
+    assert load_state(redis.records['telebot_1']) == {'2': {'state': 'LowState:city',
+                                                            'data': {'date_check_in': CHECK_IN, 'total_days': 2}}}
+    assert redis.expiry == {'telebot_1': 60}
+    assert storage.delete_state(1, 1) is False
+    storage.set_state(1, 1, 'LowState:city')
+    assert storage.delete_state(1, 1)
+    assert redis.records == {}
@@ -0,0 +1,142 @@
+import time
+from datetime import date, timedelta
+from types import SimpleNamespace
+import pytest
+from api_seq import warmup as warmup_module
+from api_seq.cache import create_cache, RefreshingCache
+from api_seq.quota import QuotaExceeded
+from api_seq.singleflight import SingleFlight
+from api_seq.warmup import Warmup, popular_queries, popular_searches, upcoming_request
+from database.classes import Search
+from config_data.config import BESTDEAL_PAGE_SIZE, LIST_RESULTS_SIZE
+
+DAY = 24 * 60 * 60
+NOW = int(time.time())
+
+
+def add_search(query, command='/lowprice', region_id='1', days_ago=1, check_in_days=10, nights=2):
+    created = NOW - days_ago * DAY
+    check_in = date.fromtimestamp(created) + timedelta(days=check_in_days)
+    return Search.create(user_id=1, created=created, command=command, query=query, region_id=region_id,
+                         check_in=check_in, check_out=check_in + timedelta(days=nights), adults=2,
+                         price_min=10, price_max=500)
+
+
+@pytest.fixture
+def history(database):
+    # направления по числу поисков за 30 дней: Paris /lowprice 4, Rome /lowprice 3, Berlin 2,
+    # Rome /highprice и Paris /bestdeal по 1; поиски старше 30 дней не считаются
+    for _ in range(4):
+        add_search('Paris', region_id='2734')
+    for _ in range(3):
+        add_search('Rome', region_id='3023', days_ago=2)
+    for _ in range(2):
+        add_search('Berlin', region_id='536')
+    add_search('rome', command='/highprice', region_id='3023', days_ago=3)
+    add_search('paris', command='/bestdeal', region_id='2734')
+    for _ in range(5):
+        add_search('London', region_id='2114', days_ago=40)
+    # поиск с незаконченным диалогом: без региона и дат
+    Search.create(user_id=1, created=NOW, command='/lowprice')
+    return database
+
+
+class Hotels4:
+    """
+    stub of the warm-up requests: records them and stores the answers in the caches like the real requests,
+    the list requests after list_limit of them raise QuotaExceeded
+    """
+    def __init__(self, monkeypatch, list_limit=None):
+        self.calls = []
+        self.list_limit = list_limit
+        self.location_cache = create_cache('locations', maxsize=100, ttl=60)
+        self.detail_cache = create_cache('details', maxsize=100, ttl=60)
+        self.search_cache = RefreshingCache(maxsize=100, ttl=60, stale_ttl=60, flight=SingleFlight('list', timeout=1))
+        for name in ('location_cache', 'detail_cache', 'search_cache', 'search_locations', 'make_api_request',
+                     'fetch_detail'):
+            monkeypatch.setattr(warmup_module, name, getattr(self, name))
+
+    def search_locations(self, query):
+        self.calls.append(('locations', query))
+        self.location_cache.set(query.casefold(), [query])
+        return [query]
+
+    def make_api_request(self, request):
+        self.calls.append(('list', request.region_id))
+        if self.list_limit is not None and len([call for call in self.calls if call[0] == 'list']) > self.list_limit:
+            raise QuotaExceeded('hotels4 list budget exceeded')
+        hotels = [SimpleNamespace(id=f'{request.region_id}-{num}') for num in range(1, 6)]
+        self.search_cache.set(request.cache_key(), hotels)
+        return hotels
+
+    def fetch_detail(self, hotel_id):
+        self.calls.append(('detail', hotel_id))
+        self.detail_cache.set(hotel_id, {'name': hotel_id})
+        return {'name': hotel_id}
+
+
+def test_popular_queries(history):
+    since = NOW - 30 * DAY
+    # написания, отличающиеся регистром, считаются одним направлением (первое — самое частое)
+    assert popular_queries(since, 2) == ['Paris', 'Rome']
+    assert popular_queries(since, 10) == ['Paris', 'Rome', 'Berlin']
+    assert 'London' in popular_queries(NOW - 60 * DAY, 1)
+
+
+def test_popular_searches(history):
+    searches = popular_searches(NOW - 30 * DAY, 10)
+    destinations = [(search.command, search.region_id) for search in searches]
+    assert destinations[:3] == [('/lowprice', '2734'), ('/lowprice', '3023'), ('/lowprice', '536')]
+    assert set(destinations[3:]) == {('/highprice', '3023'), ('/bestdeal', '2734')}
+    # для каждого направления берётся последний поиск
+    assert searches[0].id == Search.select().where(Search.query == 'Paris').order_by(Search.id.desc()).get().id
+    assert len(popular_searches(NOW - 30 * DAY, 1)) == 1
+
+
+def test_upcoming_request_keeps_the_lead_and_the_length_of_stay(database):
+    today = date(2030, 6, 1)
+    request = upcoming_request(add_search('Paris', days_ago=5, check_in_days=10, nights=3), today=today)
+    assert (request.check_in, request.check_out) == (today + timedelta(days=10), today + timedelta(days=13))
+    assert (request.sort, request.results_size, request.region_id, request.adults) == \
+           ('PRICE_LOW_TO_HIGH', LIST_RESULTS_SIZE, '1', 2)
+    bestdeal = upcoming_request(add_search('Paris', command='/bestdeal'), today=today)
+    assert (bestdeal.sort, bestdeal.results_size) == ('PRICE_LOW_TO_HIGH', BESTDEAL_PAGE_SIZE)
+    assert upcoming_request(add_search('Rome', command='/highprice'), today=today).sort == 'PRICE_HIGH_TO_LOW'
+    # дата заезда в прошлом относительно поиска: заезд сегодня, не меньше одной ночи
+    past = upcoming_request(add_search('Rome', check_in_days=-2, nights=0), today=today)
+    assert (past.check_in, past.check_out) == (today, today + timedelta(days=1))
+
+
+def test_budget_is_spent_on_locations_lists_then_details(history, monkeypatch):
+    hotels4 = Hotels4(monkeypatch)
+    report = Warmup(budget=7, history_days=30, destinations=3, details=2).run()
+    assert report['calls'] == {'locations': 3, 'list': 3, 'detail': 1}
+    assert [call for call in hotels4.calls if call[0] != 'detail'] == [
+        ('locations', 'Paris'), ('locations', 'Rome'), ('locations', 'Berlin'),
+        ('list', '2734'), ('list', '3023'), ('list', '536')]
+    assert (report['budget'], report['cached'], report['destinations']) == (7, 0, 3)
+
+
+def test_cached_entries_are_not_requested_again(history, monkeypatch):
+    hotels4 = Hotels4(monkeypatch)
+    warmup = Warmup(budget=100, history_days=30, destinations=2, details=2)
+    first = warmup.run()
+    assert first['calls'] == {'locations': 2, 'list': 2, 'detail': 4}
+    # обращения самого прогрева не считаются попаданиями
+    detail = warmup.hit_rate()['detail']
+    assert (detail['warmed'], detail['used']) == (4, 0)
+    hotels4.detail_cache.get('2734-1')
+    assert warmup.hit_rate()['detail']['used'] == 1
+    hotels4.calls.clear()
+    second = warmup.run()
+    # всё уже в кэшах: запросов нет, найденные записи засчитываются в cached
+    assert hotels4.calls == []
+    assert second['calls'] == {'locations': 0, 'list': 0, 'detail': 0}
+    assert second['cached'] == 2 + 2 + 4
+
+
+def test_quota_exceeded_stops_the_list_requests(history, monkeypatch):
+    hotels4 = Hotels4(monkeypatch, list_limit=1)
+    report = Warmup(budget=100, history_days=30, destinations=3, details=1).run()
+    assert report['calls'] == {'locations': 3, 'list': 2, 'detail': 1}
+    assert [call for call in hotels4.calls if call[0] == 'detail'] == [('detail', '2734-1')]
@@ -0,0 +1,24 @@
+from datetime import date
+from database.classes import Property, SearchProperty
+from database.writer import write_searches
+
+COLUMNS = {'user_id': 1, 'created': 0, 'command': '/lowprice', 'query': 'Paris', 'region_id': '1',
+           'check_in': date(2030, 1, 1), 'check_out': date(2030, 1, 3), 'adults': 1, 'price_min': 0,
+           'price_max': 100}
+
+
+def stored(property_id):
+    return Property.select(Property.name, Property.address).where(Property.id == property_id).tuples().get()
+
+
+def test_degraded_card_keeps_the_stored_property(database):
+    write_searches([(COLUMNS, [('1', 'Real name', 'Real address')])])
+    write_searches([(COLUMNS, [('1', 'Hotel 1', None)])])
+    assert stored('1') == ('Real name', 'Real address')
+    assert SearchProperty.select().count() == 2
+
+
+def test_complete_card_replaces_a_partial_one(database):
+    write_searches([(COLUMNS, [('2', 'Hotel 2', None)])])
+    write_searches([(COLUMNS, [('2', 'Real name', 'Real address'), ('3', 'Other', 'Street')])])
+    assert stored('2') == ('Real name', 'Real address')
@@ -0,0 +1,191 @@
+import numpy as np
+from api_seq.records import HotelBatch
+from config_data.config import BESTDEAL_CANDIDATES, BESTDEAL_WEIGHTS, BESTDEAL_PARETO
+
+
+def normalize(values):
+    """
+        Scales the values to the range [0, 1] (all zeros if the values are equal).
+
+        :param values: numpy.ndarray
+        :return: numpy.ndarray
+    """
+    values = values.astype(np.float64)
+    low = values.min()
+    spread = values.max() - low
+    if spread == 0:
+        return np.zeros_like(values)
+    return (values - low) / spread
+
+
+def pareto_front(price, distance):
+    """
+        Finds the hotels for which no other hotel is both cheaper (or equal) and closer.
+
+        :param price: numpy.ndarray
+        :param distance: numpy.ndarray
+        :return: Boolean mask of the Pareto-optimal hotels.
+        :rtype: numpy.ndarray
+    """
+    if np.issubdtype(price.dtype, np.integer):
+        # цены в центах целые: дробная добавка упорядочивает отели с одинаковой ценой по расстоянию
+        order = np.argsort(price + normalize(distance) * 0.5)
+    else:
+        order = np.lexsort((distance, price))
+    sorted_distance = distance[order].astype(np.float64)
+    closest_before = np.empty_like(sorted_distance)
+    closest_before[0] = np.inf
+    np.minimum.accumulate(sorted_distance[:-1], out=closest_before[1:])
+    mask = np.empty(len(price), dtype=bool)
+    mask[order] = sorted_distance < closest_before
+    return mask
+
+
+def score_hotels(price, distance, review, weights):
+    """
+        Scores all hotels in one pass, a lower score is a better deal.
+
+        :param price: numpy.ndarray
+        :param distance: numpy.ndarray
+        :param review: numpy.ndarray (guest review score, higher is better)
+        :param weights: tuple (weight of price, distance, review score)
+        :return: numpy.ndarray
+    """
+    price_weight, distance_weight, review_weight = weights
+    return (price_weight * normalize(price) + distance_weight * normalize(distance)
+            - review_weight * normalize(review))
+
+
+def top_k(scores, k):
+    """
+        Returns the indices of the k lowest scores in ascending order of score (partial sort),
+        of equal scores the lower index goes first.
+
+        :param scores: numpy.ndarray
+        :param k: int
+        :return: numpy.ndarray
+    """
+    if k >= len(scores):
+        return np.argsort(scores, kind='stable')
+    # argpartition выбирает из равных оценок на границе произвольные: берутся все оценки не хуже k-й
+    threshold = np.partition(scores, k - 1)[k - 1] if k > 0 else -np.inf
+    best = np.flatnonzero(scores <= threshold)
+    return best[np.argsort(scores[best], kind='stable')][:k]
+
+
+def rank_hotels(price, distance, review, weights, k, pareto=False):
+    """
+        Ranks the candidate hotels by the weighted price/distance/review score.
+        With pareto=True the hotels of the Pareto front (price, distance) go first,
+        the remaining places are filled with the best of the other hotels.
+
+        :param price: array of prices
+        :param distance: array of distances
+        :param review: array of review scores
+        :param weights: tuple (weight of price, distance, review score)
+        :param k: int (number of hotels to return)
+        :param pareto: bool
+        :return: Indices of the best hotels in display order.
+        :rtype: numpy.ndarray
+    """
+    price = np.asarray(price)
+    distance = np.asarray(distance)
+    review = np.asarray(review)
+    if len(price) == 0:
+        return np.empty(0, dtype=np.intp)
+    scores = score_hotels(price, distance, review, weights)
+    if not pareto:
+        return top_k(scores, k)
+    front = pareto_front(price, distance)
+    front_scores = np.where(front, scores, np.inf)
+    best = top_k(front_scores, min(k, int(front.sum())))
+    if len(best) < k:
+        rest_scores = np.where(front, np.inf, scores)
+        best = np.concatenate((best, top_k(rest_scores, min(k - len(best), int((~front).sum())))))
+    return best
+
+
+def best_hotels(pages, data):
+    """
+        Collects the hotels within the user's ranges page by page (collect_candidates)
+        and ranks them by price, distance and review score (rank_hotels).
+        The next page is requested only while the hotels found are fewer than the number to display,
+        so a search usually costs one properties/v2/list call (BESTDEAL_PAGE_SIZE >= BESTDEAL_CANDIDATES)
+        and at most BESTDEAL_MAX_RESULTS / BESTDEAL_PAGE_SIZE calls with narrow ranges.
+
+        :param pages: iterable of HotelBatch (properties/v2/list pages)
+        :param data: dict (state data with the ranges and the number of hotels)
+        :return: The best hotels in display order.
+        :rtype: list
+    """
+    candidates = HotelBatch()
+    for page in pages:
+        if collect_candidates(candidates, page, data):
+            break
+    return rank_candidates(candidates, data)
+
+
+def candidates_limit(data):
+    """
+        Returns the number of hotels within the user's ranges to collect for ranking.
+
+        :param data: dict (state data with the number of hotels)
+        :return: int
+    """
+    return max(BESTDEAL_CANDIDATES, int(data['hotels_count']))
+
+
+def rank_candidates(candidates, data):
+    """
+        Selects the best of the collected hotels (rank_hotels with the BESTDEAL_* settings).
+
+        :param candidates: HotelBatch
+        :param data: dict (state data with the number of hotels)
+        :return: The best hotels in display order.
+        :rtype: list
+    """
+    best = rank_hotels(candidates.price_cents, candidates.distances, candidates.review_scores,
+                       weights=BESTDEAL_WEIGHTS, k=int(data['hotels_count']), pareto=BESTDEAL_PARETO)
+    return [candidates[index] for index in best]
+
+
+def collect_candidates(candidates, page, data):
+    """
+        Adds the hotels of the page within the user's price and distance ranges to the candidates
+        (up to candidates_limit hotels in all).
+
+        :param candidates: HotelBatch
+        :param page: HotelBatch (a properties/v2/list page)
+        :param data: dict (state data with the ranges and the number of hotels)
+        :return: True if enough hotels are collected and the next page is not needed.
+        :rtype: bool
+    """
+    limit = candidates_limit(data)
+    price_min, price_max = int(data['price_min']), int(data['price_max'])
+    distance_min, distance_max = float(data['distance_min']), float(data['distance_max'])
+    for hotel in page:
+        if len(candidates) == limit:
+            break
+        if is_hotel_in_range(hotel, price_min, price_max, distance_min, distance_max):
+            candidates.append(hotel)
+    return len(candidates) >= int(data['hotels_count'])
+
+
+def is_hotel_in_range(hotel, price_min, price_max, distance_min, distance_max):
+    """
+        Checks whether a hotel is within specified price and distance ranges.
+
+        :param hotel: The parsed hotel.
+        :type hotel: HotelRecord
+        :param price_min: The minimum price.
+        :type price_min: float
+        :param price_max: The maximum price.
+        :type price_max: float
+        :param distance_min: The minimum distance to the destination.
+        :type distance_min: float
+        :param distance_max: The maximum distance to the destination.
+        :type distance_max: float
+        :return: True if the hotel is within the price and distance ranges, otherwise False.
+        :rtype: bool
+    """
+    return price_min * 100 <= hotel.price_cents <= price_max * 100 and distance_min <= hotel.distance <= distance_max
@@ -1 +1,4 @@
 from . import set_bot_commands
+from . import webhook
+from . import processes
+from . import sender
@@ -0,0 +1,159 @@
+import multiprocessing
+import signal
+import time
+import requests
+from telebot import types, apihelper
+from api_seq import session as api_session, media
+from api_seq.quota import quota
+from database.classes import db
+from database.writer import history_writer
+from config_data.config import HISTORY_WRITE_BEHIND, IMAGE_CHECK_WORKERS
+from .sender import outbound
+from loguru import logger
+
+
+def raw_update_chat_id(update):
+    """
+        Returns the chat the raw update (dict of getUpdates) belongs to (0 if the update has no chat).
+
+        :param update: dict
+        :return: int
+    """
+    for field in ('message', 'edited_message', 'channel_post', 'edited_channel_post'):
+        if field in update:
+            return update[field]['chat']['id']
+    callback_query = update.get('callback_query')
+    if callback_query:
+        if callback_query.get('message'):
+            return callback_query['message']['chat']['id']
+        return callback_query['from']['id']
+    return 0
+
+
+def process_updates(bot, updates, num, on_exit=None):
+    """
+        Worker process: handles the updates of its chats one by one, in the order they were received.
+
+        :param bot: telebot.TeleBot
+        :param updates: multiprocessing.Queue (raw updates, None stops the worker)
+        :param num: int (number of the worker)
+        :param on_exit: callable run when the worker stops (default: None)
+        :return: None
+    """
+    # остановкой управляет диспетчер: рабочий процесс дообрабатывает очередь после Ctrl+C или SIGTERM
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    # HTTP-соединения родительского процесса не используются: открываются свои
+    apihelper._get_req_session(reset=True)
+    api_session.session = api_session.create_session(pool_size=api_session.api_pool_size(1))
+    media.image_session = api_session.create_session(pool_size=IMAGE_CHECK_WORKERS)
+    bot.threaded = False
+    outbound.start()
+    quota.start()
+    if HISTORY_WRITE_BEHIND:
+        history_writer.start()
+    processed = 0
+    while True:
+        update = updates.get()
+        if update is None:
+            break
+        try:
+            bot.process_new_updates([types.Update.de_json(update)])
+        except Exception as e:
+            logger.exception(f'Update processing failed: {e}')
+        processed += 1
+    if on_exit is not None:
+        on_exit()
+    history_writer.stop()
+    quota.stop()
+    logger.info(f'Worker {num} stopped: {processed} updates')
+
+
+class ProcessDispatcher:
+    """
+    class contains a pool of worker processes handling Telegram updates.
+    Every chat is always routed to the same worker (chat id modulo the number of workers),
+    so the updates of one chat are processed strictly in order.
+    The workers are forked: they inherit the bot with its handlers and the warmed up caches
+    (the bot cannot be pickled for the spawn start method).
+    """
+    def __init__(self, bot, processes, queue_size, on_exit=None):
+        if 'fork' not in multiprocessing.get_all_start_methods():
+            raise RuntimeError('BOT_PROCESSES > 1 requires the fork start method (not available on this platform), '
+                               'set BOT_PROCESSES=1')
+        context = multiprocessing.get_context('fork')
+        # соединение с history.db не должно наследоваться дочерними процессами
+        db.close()
+        self.queues = [context.Queue(maxsize=queue_size) for _ in range(processes)]
+        self.routed = [0] * processes
+        self.started = time.perf_counter()
+        self.processes = [context.Process(target=process_updates, args=(bot, updates, num, on_exit),
+                                           name=f'update-worker-{num}', daemon=True)
+                          for num, updates in enumerate(self.queues)]
+        for process in self.processes:
+            process.start()
+
+    def put(self, update):
+        """
+            Routes the raw update to the worker of its chat (waits while the worker queue is full).
+
+            :param update: dict
+            :return: None
+        """
+        num = raw_update_chat_id(update) % len(self.queues)
+        self.queues[num].put(update)
+        self.routed[num] += 1
+
+    def stop(self):
+        """
+            Lets the workers finish the queued updates and waits for them.
+
+            :return: None
+        """
+        for updates in self.queues:
+            updates.put(None)
+        for process in self.processes:
+            process.join()
+        logger.info(f'Worker processes: {self.stats()}')
+
+    def stats(self):
+        """
+            Returns the number of updates routed to each worker and the overall rate.
+
+            :return: dict
+        """
+        total = sum(self.routed)
+        return {'routed': list(self.routed), 'updates_per_second': total / (time.perf_counter() - self.started)}
+
+
+def run_processes(bot, processes, queue_size, on_exit=None, timeout=20):
+    """
+        Receives updates with long polling and handles them in worker processes.
+
+        :param bot: telebot.TeleBot
+        :param processes: int (number of worker processes)
+        :param queue_size: int (maximum number of updates waiting for each worker)
+        :param on_exit: callable run by each worker when it stops (default: None)
+        :param timeout: int (long polling timeout, seconds)
+        :return: None
+    """
+    bot.remove_webhook()
+    dispatcher = ProcessDispatcher(bot, processes=processes, queue_size=queue_size, on_exit=on_exit)
+    logger.info(f'Polling with {processes} worker processes')
+    offset = None
+    try:
+        while True:
+            try:
+                updates = apihelper.get_updates(bot.token, offset=offset, timeout=timeout,
+                                                long_polling_timeout=timeout)
+            except (apihelper.ApiException, requests.RequestException) as e:
+                logger.error(f'Polling failed: {e}')
+                time.sleep(3)
+                continue
+            for update in updates:
+                offset = update['update_id'] + 1
+                dispatcher.put(update)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        dispatcher.stop()
@@ -0,0 +1,333 @@
+import asyncio
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from telebot import apihelper, asyncio_helper
+from loader import BOT_PROCESSES
+from config_data.config import OUTBOUND_GLOBAL_RATE, OUTBOUND_CHAT_RATE, OUTBOUND_CHAT_BURST
+from loguru import logger
+
+PRIORITY_RESULT = 0
+PRIORITY_TEXT = 1
+
+
+class TokenBucket:
+    """
+    class contains a token bucket: rate tokens per second, at most capacity tokens at a time
+    """
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def wait_time(self, now):
+        """
+            Returns how long to wait until a token is available (0 if it is available now).
+
+            :param now: float (time.monotonic())
+            :return: float
+        """
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self):
+        """
+            Takes a token (wait_time must have returned 0).
+
+            :return: None
+        """
+        self.tokens -= 1
+
+
+class OutboundRequest:
+    """
+    class contains a Bot API request waiting for its turn
+    """
+    __slots__ = ('method', 'url', 'kwargs', 'chat_id', 'priority', 'seq', 'enqueued', 'released', 'response',
+                 'merged', 'waker')
+
+    def __init__(self, method, url, kwargs, chat_id, priority, seq, waker=None):
+        self.method = method
+        self.url = url
+        self.kwargs = kwargs
+        self.chat_id = chat_id
+        self.priority = priority
+        self.seq = seq
+        self.enqueued = time.monotonic()
+        self.released = threading.Event()
+        self.response = None
+        self.merged = []
+        self.waker = waker
+
+    def release(self):
+        """
+            Lets the request be sent (wakes the waiting thread or coroutine).
+
+            :return: None
+        """
+        self.released.set()
+        if self.waker is not None:
+            self.waker()
+
+
+class ChatQueue:
+    """
+    class contains the requests of one chat (sent strictly in order, one at a time) and its rate limit
+    """
+    __slots__ = ('requests', 'bucket', 'in_flight', 'blocked_until')
+
+    def __init__(self, rate, capacity):
+        self.requests = deque()
+        self.bucket = TokenBucket(rate, capacity)
+        self.in_flight = False
+        self.blocked_until = 0.0
+
+
+class OutboundScheduler:
+    """
+    class contains the scheduler of the outbound Bot API requests.
+    It is installed as telebot's apihelper.CUSTOM_REQUEST_SENDER, so every request addressed to a chat
+    waits for a token of the global and of the chat's token bucket. The requests of a chat are sent in order,
+    hotel cards (PRIORITY_RESULT) go before the dialog text of other chats, consecutive plain text messages
+    of a chat are sent as one message and 429 responses are retried after retry_after.
+    The requests of the async bot (BOT_RUNTIME=async) wait for their turn in the same queues (send_async).
+    With several bot processes each one gets an equal part of the global rate (a chat is always
+    handled by the same process, so the chat rate is not divided).
+    """
+    def __init__(self, global_rate, chat_rate, chat_burst, processes=1):
+        global_rate = global_rate / processes
+        self.global_bucket = TokenBucket(global_rate, max(1.0, global_rate))
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.chats = {}
+        self.local = threading.local()
+        self.seq = itertools.count()
+        self.thread = None
+        self._condition = threading.Condition()
+        self.sent = 0
+        self.retried = 0
+        self.coalesced = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+    def start(self):
+        """
+            Starts the scheduler thread and routes the Bot API requests through it.
+
+            :return: None
+        """
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._schedule, name='outbound-scheduler', daemon=True)
+            self.thread.start()
+            apihelper.CUSTOM_REQUEST_SENDER = self.request
+
+    @contextmanager
+    def priority(self, priority):
+        """
+            Sets the priority of the requests sent by the current thread inside the with block.
+
+            :param priority: int (PRIORITY_RESULT or PRIORITY_TEXT)
+        """
+        previous = getattr(self.local, 'priority', PRIORITY_TEXT)
+        self.local.priority = priority
+        try:
+            yield
+        finally:
+            self.local.priority = previous
+
+    def request(self, method, url, **kwargs):
+        """
+            Sends a Bot API request when the rate limits allow it (signature of requests.Session.request).
+
+            :param method: str
+            :param url: str
+            :param kwargs: arguments of requests.Session.request
+            :return: requests.Response
+        """
+        chat_id = (kwargs.get('params') or {}).get('chat_id')
+        if chat_id is None:
+            return apihelper._get_req_session().request(method, url, **kwargs)
+        item = self._enqueue(method, url, kwargs, chat_id)
+        while True:
+            item.released.wait()
+            if item.response is not None:
+                return item.response
+            try:
+                response = apihelper._get_req_session().request(method, url, **item.kwargs)
+            except Exception:
+                self._done(item, None)
+                raise
+            if response.status_code == 429 and self._retry_later(item, response):
+                continue
+            self._done(item, response)
+            return response
+
+    async def send_async(self, chat_id, send, priority=PRIORITY_TEXT):
+        """
+            Sends a request of the async bot when the rate limits allow it, without blocking the event loop.
+            A 429 response is retried after retry_after like the requests of telebot.
+
+            :param chat_id: int
+            :param send: callable returning the awaitable Bot API call (e.g. lambda: bot.send_message(...))
+            :param priority: int (PRIORITY_RESULT or PRIORITY_TEXT)
+            :return: result of the Bot API call
+        """
+        if self.thread is None:
+            return await send()
+        loop = asyncio.get_running_loop()
+        turn = asyncio.Event()
+        item = self._enqueue(None, '', {}, chat_id, priority=priority,
+                             waker=lambda: loop.call_soon_threadsafe(turn.set))
+        while True:
+            await turn.wait()
+            turn.clear()
+            try:
+                result = await send()
+            except asyncio_helper.ApiTelegramException as e:
+                retry_after = (e.result_json.get('parameters') or {}).get('retry_after')
+                if e.error_code == 429 and retry_after is not None:
+                    self._block(item, retry_after)
+                    continue
+                self._done(item, None)
+                raise
+            except Exception:
+                self._done(item, None)
+                raise
+            self._done(item, result)
+            return result
+
+    def _enqueue(self, method, url, kwargs, chat_id, priority=None, waker=None):
+        if priority is None:
+            priority = getattr(self.local, 'priority', PRIORITY_TEXT)
+        item = OutboundRequest(method, url, kwargs, chat_id, priority, next(self.seq), waker)
+        with self._condition:
+            chat = self.chats.get(chat_id)
+            if chat is None:
+                chat = self.chats[chat_id] = ChatQueue(self.chat_rate, self.chat_burst)
+            chat.requests.append(item)
+            self._condition.notify()
+        return item
+
+    def _retry_later(self, item, response):
+        try:
+            retry_after = response.json()['parameters']['retry_after']
+        except (ValueError, KeyError, TypeError):
+            return False
+        self._block(item, retry_after)
+        return True
+
+    def _block(self, item, retry_after):
+        logger.warning(f'Telegram rate limit for chat {item.chat_id}: retry after {retry_after} s')
+        with self._condition:
+            chat = self.chats[item.chat_id]
+            chat.blocked_until = time.monotonic() + retry_after
+            chat.in_flight = False
+            chat.requests.appendleft(item)
+            item.released.clear()
+            self.retried += 1
+            self._condition.notify()
+
+    def _done(self, item, response):
+        latency = time.monotonic() - item.enqueued
+        with self._condition:
+            chat = self.chats[item.chat_id]
+            chat.in_flight = False
+            if response is None:
+                # запрос не отправлен: объединённые с ним сообщения отправляются отдельно
+                for follower in reversed(item.merged):
+                    chat.requests.appendleft(follower)
+                item.merged = []
+            self.sent += 1
+            self.latency_total += latency
+            self.latency_max = max(self.latency_max, latency)
+            self._condition.notify()
+        for follower in item.merged:
+            follower.response = response
+            follower.release()
+
+    def _coalesce(self, item, chat):
+        params = item.kwargs.get('params') or {}
+        if not _is_plain_text(item, params):
+            return
+        text = params['text']
+        while chat.requests:
+            following = chat.requests[0]
+            following_params = following.kwargs.get('params') or {}
+            if not _is_plain_text(following, following_params) \
+                    or len(text) + 1 + len(following_params['text']) > 4096:
+                break
+            chat.requests.popleft()
+            text = f'{text}\n{following_params["text"]}'
+            item.merged.append(following)
+        if item.merged:
+            item.kwargs['params'] = dict(params, text=text)
+            self.coalesced += len(item.merged)
+
+    def _schedule(self):
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                ready = []
+                idle = []
+                wake_up = None
+                for chat_id, chat in self.chats.items():
+                    if chat.in_flight:
+                        continue
+                    if not chat.requests:
+                        chat.bucket.wait_time(now)
+                        if chat.blocked_until <= now and chat.bucket.tokens >= chat.bucket.capacity:
+                            idle.append(chat_id)
+                        continue
+                    wait = max(chat.blocked_until - now, chat.bucket.wait_time(now))
+                    if wait > 0:
+                        wake_up = wait if wake_up is None else min(wake_up, wait)
+                        continue
+                    head = chat.requests[0]
+                    heapq.heappush(ready, (head.priority, head.seq, chat_id))
+                # чаты без запросов с полным ведром токенов больше не нужны
+                for chat_id in idle:
+                    del self.chats[chat_id]
+                if not ready:
+                    self._condition.wait(wake_up)
+                    continue
+                wait = self.global_bucket.wait_time(now)
+                if wait > 0:
+                    self._condition.wait(wait)
+                    continue
+                _, _, chat_id = ready[0]
+                chat = self.chats[chat_id]
+                item = chat.requests.popleft()
+                self._coalesce(item, chat)
+                self.global_bucket.take()
+                chat.bucket.take()
+                chat.in_flight = True
+                item.release()
+
+    def stats(self):
+        """
+            Returns the queue depth, the number of sent, retried and coalesced requests and the send latency.
+
+            :return: dict
+        """
+        with self._condition:
+            return {'queued': sum(len(chat.requests) for chat in self.chats.values()),
+                    'sent': self.sent, 'retried': self.retried, 'coalesced': self.coalesced,
+                    'latency_avg': self.latency_total / self.sent if self.sent else 0.0,
+                    'latency_max': self.latency_max}
+
+
+def _is_plain_text(item, params):
+    return item.url.endswith('/sendMessage') and 'text' in params \
+        and not {'reply_markup', 'parse_mode', 'entities', 'reply_to_message_id'} & params.keys()
+
+
+# каждый рабочий процесс отправляет сообщения сам и получает равную часть общего лимита
+outbound = OutboundScheduler(global_rate=OUTBOUND_GLOBAL_RATE, chat_rate=OUTBOUND_CHAT_RATE,
+                             chat_burst=OUTBOUND_CHAT_BURST, processes=BOT_PROCESSES)
@@ -0,0 +1,168 @@
+import json
+import queue
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from telebot import types
+from loguru import logger
+
+
+def update_chat_id(update):
+    """
+        Returns the chat the update belongs to (0 if the update has no chat).
+
+        :param update: telebot.types.Update
+        :return: int
+    """
+    if update.message:
+        return update.message.chat.id
+    if update.callback_query:
+        if update.callback_query.message:
+            return update.callback_query.message.chat.id
+        return update.callback_query.from_user.id
+    for field in ('edited_message', 'channel_post', 'edited_channel_post'):
+        message = getattr(update, field, None)
+        if message:
+            return message.chat.id
+    return 0
+
+
+class UpdateDispatcher:
+    """
+    class contains a pool of workers processing Telegram updates.
+    Each worker has its own bounded queue and every chat is always routed to the same worker,
+    so the updates of one chat are processed strictly in order.
+    """
+    def __init__(self, bot, workers, queue_size):
+        self.bot = bot
+        self.queues = [queue.Queue(maxsize=queue_size) for _ in range(workers)]
+        self.processed = 0
+        self.rejected = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+        self._lock = threading.Lock()
+        self.threads = [threading.Thread(target=self._work, args=(updates,), name=f'update-worker-{num}', daemon=True)
+                        for num, updates in enumerate(self.queues)]
+        for thread in self.threads:
+            thread.start()
+
+    def put(self, update, timeout=1):
+        """
+            Routes the update to the worker of its chat.
+
+            :param update: telebot.types.Update
+            :param timeout: float (seconds to wait if the worker queue is full)
+            :return: False if the queue stayed full, True otherwise.
+            :rtype: bool
+        """
+        updates = self.queues[update_chat_id(update) % len(self.queues)]
+        try:
+            updates.put((update, time.perf_counter()), timeout=timeout)
+            return True
+        except queue.Full:
+            with self._lock:
+                self.rejected += 1
+            return False
+
+    def stop(self):
+        """
+            Lets the workers finish the queued updates and waits for them.
+
+            :return: None
+        """
+        for updates in self.queues:
+            updates.put(None)
+        for thread in self.threads:
+            thread.join()
+
+    def _work(self, updates):
+        while True:
+            item = updates.get()
+            if item is None:
+                updates.task_done()
+                break
+            update, enqueued = item
+            latency = time.perf_counter() - enqueued
+            with self._lock:
+                self.processed += 1
+                self.latency_total += latency
+                self.latency_max = max(self.latency_max, latency)
+            try:
+                self.bot.process_new_updates([update])
+            except Exception as e:
+                logger.exception(f'Update processing failed: {e}')
+            finally:
+                updates.task_done()
+
+    def stats(self):
+        """
+            Returns the number of processed updates, queueing latency and queue depths.
+
+            :return: dict
+        """
+        with self._lock:
+            return {'processed': self.processed, 'rejected': self.rejected,
+                    'latency_avg': self.latency_total / self.processed if self.processed else 0.0,
+                    'latency_max': self.latency_max,
+                    'queue_depth': [updates.qsize() for updates in self.queues]}
+
+
+def make_request_handler(dispatcher, path, secret):
+    """
+        Creates the HTTP request handler class receiving the updates posted by Telegram.
+
+        :param dispatcher: UpdateDispatcher
+        :param path: str (URL path of the webhook)
+        :param secret: str (expected X-Telegram-Bot-Api-Secret-Token header, None to skip the check)
+        :return: class
+    """
+    class WebhookHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            if self.path != path or (secret and self.headers.get('X-Telegram-Bot-Api-Secret-Token') != secret):
+                self.send_response(403)
+                self.end_headers()
+                return
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            try:
+                update = types.Update.de_json(json.loads(body))
+            except ValueError:
+                self.send_response(400)
+                self.end_headers()
+                return
+            # 503 заставляет Telegram повторить доставку позже, если очередь переполнена
+            self.send_response(200 if dispatcher.put(update) else 503)
+            self.end_headers()
+
+        def log_message(self, format, *args):
+            pass
+
+    return WebhookHandler
+
+
+def run_webhook(bot, host, port, path, secret, workers, queue_size):
+    """
+        Receives Telegram updates on a local HTTP server and processes them with a worker pool.
+        Handlers run in the worker threads, the bot's own thread pool is not used.
+        On Ctrl+C (or SIGTERM, see main.py) the queued updates are processed before returning.
+
+        :param bot: telebot.TeleBot
+        :param host: str
+        :param port: int
+        :param path: str (URL path of the webhook)
+        :param secret: str (secret token set with set_webhook)
+        :param workers: int
+        :param queue_size: int (maximum number of updates waiting for each worker)
+        :return: None
+    """
+    bot.threaded = False
+    dispatcher = UpdateDispatcher(bot, workers=workers, queue_size=queue_size)
+    server = ThreadingHTTPServer((host, port), make_request_handler(dispatcher, path, secret))
+    logger.info(f'Webhook server listening on {host}:{port}{path}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        dispatcher.stop()
+        logger.info(f'Webhook updates: {dispatcher.stats()}')